@@ -0,0 +1,396 @@
+"""
+Admission control, rate limiting and load shedding for RMS.
+
+Requests pass three gates before reaching a route:
+
+1. A token bucket per client, answering 429 when it is empty.
+2. A global cap on requests in flight, sized to this worker's primary
+   database pool so a burst queues here instead of timing out on pool
+   checkout.
+3. A bounded FIFO of requests waiting for a slot. A request that waits
+   longer than ``admission_queue_timeout_ms`` is shed with 503, and new
+   arrivals are shed at once while the oldest waiter has already waited
+   that long.
+
+Media transfers (upload body appends and media downloads) skip gates 2
+and 3: they release their database session before streaming, and one
+slow client moving a large file would otherwise hold a slot for minutes.
+They still pass the per-client bucket.
+
+Rating writes are also limited per project by ``limit_project``, called
+from the routes since the project id lives in the request body.
+
+Bucket state is kept in process memory by default. With several workers
+``rate_limit_store = "sqlite"`` shares it through a local SQLite file,
+updated with one atomic upsert per check. A locked or failing store lets
+the request through rather than rejecting it.
+"""
+import asyncio
+import logging
+import math
+import sqlite3
+import time
+from collections import OrderedDict, deque
+from contextlib import suppress
+from typing import Deque, Optional, Tuple
+
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+import metrics
+from config import get_settings
+from database import primary_pool_limits
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Routes outside admission control: probes and long-lived streams
+EXEMPT_PATHS = {"/health", "/metrics", "/docs", "/openapi.json"}
+LONG_LIVED_SUFFIXES = ("/live",)
+
+# Methods and path prefixes of requests streaming media without a database session
+TRANSFER_ROUTES = (
+    ("PATCH", "/uploads/"),
+    ("GET", "/media/"),
+    ("HEAD", "/media/"),
+)
+
+class AdmissionRejected(Exception):
+    """A request refused by admission control."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+    def headers(self) -> dict:
+        """Retry-After header in whole seconds, at least one."""
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+class MemoryBucketStore:
+    """
+    Token buckets held in process memory.
+
+    Args:
+        max_keys: Buckets kept; the least recently used are forgotten,
+            which only ever refills them early
+    """
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        """
+        Take tokens from a bucket.
+
+        Args:
+            key: Bucket key
+            rate: Tokens added per second
+            burst: Bucket capacity
+            cost: Tokens needed
+
+        Returns:
+            0 if the tokens were taken, else seconds until they will be available
+        """
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return 0.0 if allowed else (cost - tokens) / rate
+
+    def clear(self) -> None:
+        """Refill every bucket."""
+        self._buckets.clear()
+
+class SQLiteBucketStore:
+    """
+    Token buckets shared between processes through a SQLite file.
+
+    Each check is a single ``INSERT ... ON CONFLICT DO UPDATE ... RETURNING``
+    statement, so concurrent workers never interleave a read and a write.
+
+    Args:
+        path: Database file, on a local disk shared by the workers
+        busy_timeout_ms: Wait for a lock held by another worker before failing open
+    """
+
+    PRUNE_EVERY = 10_000
+
+    def __init__(self, path: str, busy_timeout_ms: int = 50):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=busy_timeout_ms / 1000, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Buckets are disposable, so a crash may lose the last writes
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets "
+            "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, allowed INTEGER NOT NULL)"
+        )
+        self._checks = 0
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        """Take tokens from a shared bucket; see MemoryBucketStore.take."""
+        now = time.time()
+        # SET expressions all see the old row, so refill is computed from it consistently
+        refill = "min(:burst, tokens + (:now - updated) * :rate)"
+        try:
+            tokens, allowed = self._conn.execute(
+                "INSERT INTO rate_buckets (key, tokens, updated, allowed) "
+                "VALUES (:key, :burst - :cost, :now, :burst >= :cost) "
+                "ON CONFLICT(key) DO UPDATE SET "
+                f"tokens = CASE WHEN {refill} >= :cost THEN {refill} - :cost ELSE {refill} END, "
+                f"allowed = {refill} >= :cost, updated = :now "
+                "RETURNING tokens, allowed",
+                {"key": key, "rate": rate, "burst": burst, "cost": cost, "now": now}
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Rate limit store unavailable, admitting request: {e}")
+            return 0.0
+        self._checks += 1
+        if self._checks % self.PRUNE_EVERY == 0:
+            self._prune(now)
+        return 0.0 if allowed else (cost - tokens) / rate
+
+    def _prune(self, now: float) -> None:
+        """Delete buckets idle for an hour; they would be full anyway."""
+        with suppress(sqlite3.Error):
+            self._conn.execute("DELETE FROM rate_buckets WHERE updated < ?", (now - 3600,))
+
+    def clear(self) -> None:
+        """Refill every bucket."""
+        self._conn.execute("DELETE FROM rate_buckets")
+
+class AdmissionController:
+    """
+    In-flight cap, wait queue and rate limits shared by all requests of a process.
+
+    Args:
+        store: Token bucket store
+        max_in_flight: Requests served at once
+        max_queue: Requests allowed to wait for a slot
+        queue_timeout_seconds: Longest wait for a slot before shedding
+        client_rate: Requests per second per client, 0 to disable
+        client_burst: Client bucket capacity
+        project_rate: Rating writes per second per project, 0 to disable
+        project_burst: Project bucket capacity
+    """
+
+    def __init__(
+        self,
+        store,
+        max_in_flight: int,
+        max_queue: int = 100,
+        queue_timeout_seconds: float = 1.0,
+        client_rate: float = 0.0,
+        client_burst: float = 0.0,
+        project_rate: float = 0.0,
+        project_burst: float = 0.0
+    ):
+        self.store = store
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.project_rate = project_rate
+        self.project_burst = project_burst
+        self.in_flight = 0
+        self._waiters: Deque[Tuple[asyncio.Future, float]] = deque()
+
+    @property
+    def queued(self) -> int:
+        """Requests waiting for a slot."""
+        return len(self._waiters)
+
+    def check_client(self, client: str) -> None:
+        """
+        Take a token from a client's bucket.
+
+        Raises:
+            AdmissionRejected: 429 if the client is over its rate
+        """
+        if self.client_rate <= 0:
+            return
+        wait = self.store.take(f"client:{client}", self.client_rate, self.client_burst)
+        if wait > 0:
+            metrics.RATE_LIMITED_CLIENT.inc()
+            raise AdmissionRejected(status.HTTP_429_TOO_MANY_REQUESTS, "Too many requests", wait)
+
+    def check_project(self, project_id: int, cost: float = 1.0) -> None:
+        """
+        Take tokens from a project's write bucket.
+
+        Raises:
+            AdmissionRejected: 429 if the project is over its rate
+        """
+        if self.project_rate <= 0:
+            return
+        wait = self.store.take(f"project:{project_id}", self.project_rate, self.project_burst, cost)
+        if wait > 0:
+            metrics.RATE_LIMITED_PROJECT.inc()
+            raise AdmissionRejected(
+                status.HTTP_429_TOO_MANY_REQUESTS, f"Too many ratings for project {project_id}", wait
+            )
+
+    async def acquire(self) -> None:
+        """
+        Wait for an in-flight slot, in arrival order.
+
+        Raises:
+            AdmissionRejected: 503 if the queue is full, already too slow,
+                or the wait times out
+        """
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            return
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if len(self._waiters) >= self.max_queue:
+            metrics.ADMISSION_QUEUE_FULL.inc()
+            raise AdmissionRejected(status.HTTP_503_SERVICE_UNAVAILABLE, "Server is busy", self.queue_timeout_seconds)
+        if self._waiters and now - self._waiters[0][1] >= self.queue_timeout_seconds:
+            # The head of the queue is about to be shed; a new arrival would be too
+            metrics.ADMISSION_SHED.inc()
+            raise AdmissionRejected(status.HTTP_503_SERVICE_UNAVAILABLE, "Server is busy", self.queue_timeout_seconds)
+
+        waiter = loop.create_future()
+        entry = (waiter, now)
+        self._waiters.append(entry)
+        metrics.ADMISSION_QUEUED.inc()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout_seconds)
+        except asyncio.TimeoutError:
+            metrics.ADMISSION_QUEUE_TIMEOUT.inc()
+            raise AdmissionRejected(status.HTTP_503_SERVICE_UNAVAILABLE, "Server is busy", self.queue_timeout_seconds)
+        except asyncio.CancelledError:
+            # The client went away; pass on a slot that was already handed over
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            metrics.ADMISSION_QUEUED.dec()
+            metrics.ADMISSION_WAIT.observe(loop.time() - now)
+            with suppress(ValueError):
+                self._waiters.remove(entry)
+
+    def release(self) -> None:
+        """Hand the slot to the oldest waiter, or free it."""
+        while self._waiters:
+            waiter, _ = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def reset(self) -> None:
+        """Refill all buckets."""
+        self.store.clear()
+
+def build_controller() -> Optional[AdmissionController]:
+    """
+    Create the process-wide controller from settings.
+
+    Returns:
+        The controller, or None when admission control is disabled
+    """
+    settings = get_settings()
+    if not settings.admission_enabled:
+        return None
+    if settings.rate_limit_store == "sqlite":
+        store = SQLiteBucketStore(settings.rate_limit_sqlite_path)
+    elif settings.rate_limit_store == "memory":
+        store = MemoryBucketStore()
+    else:
+        raise ValueError(f"Unknown rate limit store: {settings.rate_limit_store}")
+    max_in_flight = settings.admission_max_in_flight or sum(primary_pool_limits())
+    return AdmissionController(
+        store,
+        max_in_flight=max_in_flight,
+        max_queue=settings.admission_max_queue,
+        queue_timeout_seconds=settings.admission_queue_timeout_ms / 1000,
+        client_rate=settings.rate_limit_client_per_second,
+        client_burst=settings.rate_limit_client_burst,
+        project_rate=settings.rate_limit_project_per_second,
+        project_burst=settings.rate_limit_project_burst,
+    )
+
+admission_controller = build_controller()
+
+def limit_project(project_id: int, cost: float = 1.0) -> None:
+    """
+    Apply the per-project write rate limit inside a route.
+
+    Raises:
+        HTTPException: 429 with Retry-After if the project is over its rate
+    """
+    if admission_controller is None:
+        return
+    try:
+        admission_controller.check_project(project_id, cost)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers=e.headers())
+
+def client_key(scope: Scope, trust_forwarded_for: bool) -> str:
+    """Identify the client: the first X-Forwarded-For hop when trusted, else the peer address."""
+    if trust_forwarded_for:
+        for name, value in scope.get("headers", ()):
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+def is_transfer(method: str, path: str, api_prefix: str) -> bool:
+    """Whether a request streams media and should not hold an in-flight slot."""
+    return any(
+        method == transfer_method and path.startswith(api_prefix + prefix)
+        for transfer_method, prefix in TRANSFER_ROUTES
+    )
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware applying the process-wide controller to HTTP requests.
+
+    Probes, metrics, docs and live streams bypass it; media transfers only
+    pass the client rate limit. WebSockets are not HTTP requests and are
+    limited by the live hub instead.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        settings = get_settings()
+        self.trust_forwarded_for = settings.rate_limit_trust_forwarded_for
+        self.api_prefix = settings.api_prefix
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        controller = admission_controller
+        path = scope.get("path", "")
+        if (controller is None or scope["type"] != "http"
+                or path in EXEMPT_PATHS or path.endswith(LONG_LIVED_SUFFIXES)):
+            await self.app(scope, receive, send)
+            return
+        transfer = is_transfer(scope["method"], path, self.api_prefix)
+        try:
+            controller.check_client(client_key(scope, self.trust_forwarded_for))
+            if not transfer:
+                await controller.acquire()
+        except AdmissionRejected as e:
+            response = JSONResponse({"detail": e.detail}, status_code=e.status_code, headers=e.headers())
+            await response(scope, receive, send)
+            return
+        if transfer:
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.release()
@@ -0,0 +1,216 @@
+"""
+Per-rasa rating aggregates for RMS.
+
+This module keeps the project_rasa_stats and content_item_rasa_stats tables
+in step with the ratings table. Every rating insert folds its values into
+running count/sum/sum-of-squares/min/max rows inside the same transaction,
+so summaries are read from at most nine rows instead of scanning ratings.
+The distinct-rater and rating-value sketches in sketches.py are kept in
+the same transaction.
+
+Run ``python aggregates.py rebuild`` to recompute the aggregate and sketch
+tables from scratch.
+"""
+import argparse
+import logging
+import math
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Table, case, delete, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import models
+import sketches
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Dialect-specific INSERT constructs that support ON CONFLICT DO UPDATE
+UPSERT_INSERTS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+STAT_TABLES = (
+    (models.ProjectRasaStats.__table__, "project_id"),
+    (models.ContentItemRasaStats.__table__, "content_item_id"),
+)
+
+def fold_ratings(rows: Iterable[Dict[str, Any]], key: str) -> List[Dict[str, Any]]:
+    """
+    Fold rating rows into one stats delta per (key, rasa).
+
+    Args:
+        rows: Rating row dicts with ``rasa``, ``rating_value`` and the key column
+        key: Grouping column, ``project_id`` or ``content_item_id``
+
+    Returns:
+        List of delta rows ready for upsert
+    """
+    deltas: Dict[Tuple[int, models.Rasa], Dict[str, Any]] = {}
+    for row in rows:
+        key_id, value = row.get(key), row.get("rating_value")
+        if key_id is None or value is None:
+            continue
+        delta = deltas.get((key_id, row["rasa"]))
+        if delta is None:
+            deltas[(key_id, row["rasa"])] = {
+                key: key_id,
+                "rasa": row["rasa"],
+                "rating_count": 1,
+                "rating_sum": value,
+                "rating_sum_squares": value * value,
+                "rating_min": value,
+                "rating_max": value,
+            }
+            continue
+        delta["rating_count"] += 1
+        delta["rating_sum"] += value
+        delta["rating_sum_squares"] += value * value
+        delta["rating_min"] = min(delta["rating_min"], value)
+        delta["rating_max"] = max(delta["rating_max"], value)
+    return list(deltas.values())
+
+def _upsert_statement(dialect_name: str, table: Table, key: str):
+    """Build an INSERT that adds deltas onto existing stats rows."""
+    stmt = UPSERT_INSERTS[dialect_name](table)
+    excluded = stmt.excluded
+    return stmt.on_conflict_do_update(
+        index_elements=[key, "rasa"],
+        set_={
+            "rating_count": table.c.rating_count + excluded.rating_count,
+            "rating_sum": table.c.rating_sum + excluded.rating_sum,
+            "rating_sum_squares": table.c.rating_sum_squares + excluded.rating_sum_squares,
+            "rating_min": case(
+                (excluded.rating_min < table.c.rating_min, excluded.rating_min),
+                else_=table.c.rating_min
+            ),
+            "rating_max": case(
+                (excluded.rating_max > table.c.rating_max, excluded.rating_max),
+                else_=table.c.rating_max
+            ),
+        }
+    )
+
+async def apply_ratings(db: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+    """
+    Fold newly inserted ratings into the aggregate tables.
+
+    Must run in the same transaction as the rating insert. Ratings
+    without a rating_value are not counted.
+
+    Args:
+        db: Database session holding the insert transaction
+        rows: Rating row dicts that were inserted
+    """
+    dialect_name = db.get_bind().dialect.name
+    for table, key in STAT_TABLES:
+        deltas = fold_ratings(rows, key)
+        if deltas:
+            await db.execute(_upsert_statement(dialect_name, table, key), deltas)
+    await sketches.apply_ratings(db, rows)
+
+async def get_project_summary(db: AsyncSession, project: models.Project) -> Dict[str, Any]:
+    """
+    Summarize a project's ratings from its aggregate rows.
+
+    Args:
+        db: Database session
+        project: Project to summarize
+
+    Returns:
+        Distribution and per-rasa statistics plus the expected-rasa match rate
+    """
+    result = await db.execute(
+        select(models.ProjectRasaStats).where(models.ProjectRasaStats.project_id == project.id)
+    )
+    stats = {row.rasa: row for row in result.scalars().all()}
+    total = sum(row.rating_count for row in stats.values())
+
+    distribution = {}
+    for rasa in models.Rasa:
+        row = stats.get(rasa)
+        distribution[rasa.value] = describe_stats(row, total)
+
+    expected = stats.get(project.expected_rasa)
+    return {
+        "project_id": project.id,
+        "expected_rasa": project.expected_rasa.value,
+        "total_ratings": total,
+        "match_rate": (expected.rating_count / total) if expected and total else 0.0,
+        "distribution": distribution,
+    }
+
+def describe_stats(row: Optional[models.RasaStatsColumns], total: int) -> Dict[str, Any]:
+    """
+    Derive share, mean and standard deviation from one stats row.
+
+    Args:
+        row: Aggregate row, or None when the rasa has no ratings
+        total: Ratings across all rasas, used for the share
+
+    Returns:
+        Dict of summary values for one rasa
+    """
+    if row is None or not row.rating_count:
+        return {"count": 0, "share": 0.0, "mean": None, "stddev": None, "min": None, "max": None}
+    count = row.rating_count
+    mean = row.rating_sum / count
+    variance = max(row.rating_sum_squares / count - mean * mean, 0.0)
+    return {
+        "count": count,
+        "share": count / total if total else 0.0,
+        "mean": mean,
+        "stddev": math.sqrt(variance),
+        "min": row.rating_min,
+        "max": row.rating_max,
+    }
+
+def rebuild_rasa_stats(db: Session) -> None:
+    """
+    Recompute both aggregate tables from the ratings table.
+
+    Args:
+        db: Sync database session; the caller commits
+    """
+    rating = models.Rating
+    for table, key in STAT_TABLES:
+        key_column = getattr(rating, key)
+        db.execute(delete(table))
+        source = (
+            select(
+                key_column,
+                rating.rasa,
+                func.count(),
+                func.sum(rating.rating_value),
+                func.sum(rating.rating_value * rating.rating_value),
+                func.min(rating.rating_value),
+                func.max(rating.rating_value),
+            )
+            .where(key_column.is_not(None), rating.rating_value.is_not(None))
+            .group_by(key_column, rating.rasa)
+        )
+        db.execute(insert(table).from_select(
+            [key, "rasa", "rating_count", "rating_sum", "rating_sum_squares", "rating_min", "rating_max"],
+            source
+        ))
+        logger.info(f"Rebuilt {table.name}")
+    sketches.rebuild_sketches(db)
+
+def main() -> None:
+    """Command line entry point for aggregate maintenance."""
+    from config import init_logging
+    from database import get_db
+
+    parser = argparse.ArgumentParser(description="Maintain RMS rating aggregates")
+    parser.add_argument("command", choices=["rebuild"], help="Maintenance command to run")
+    parser.parse_args()
+
+    init_logging()
+    with get_db() as db:
+        rebuild_rasa_stats(db)
+
+if __name__ == "__main__":
+    main()
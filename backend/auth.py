@@ -0,0 +1,291 @@
+"""
+Authentication for RMS.
+
+Passwords are hashed with passlib in a small dedicated thread pool, so
+key derivation never runs on the event loop and a burst of logins cannot
+take every default executor thread. The first configured scheme with an
+installed backend hashes new passwords; the others only verify, and
+hashes in them are upgraded at the next successful login.
+
+Access tokens are signed JWTs verified without a database round trip.
+Active users are kept as small principals in an LRU/TTL cache keyed by
+user id, so an authenticated request costs a signature check and a dict
+lookup. Deactivating a user evicts its principal here; other processes
+drop it when the entry expires.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from jose import JWTError, jwt
+from passlib.context import CryptContext
+from passlib.registry import get_crypt_handler
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from config import get_settings
+from database import get_write_session
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+BEARER_CHALLENGE = {"WWW-Authenticate": "Bearer"}
+
+bearer_scheme = HTTPBearer(auto_error=False)
+
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated user as seen by request handlers."""
+    id: int
+    username: str
+    is_admin: bool
+
+class PrincipalCache:
+    """
+    LRU/TTL cache of active user principals keyed by user id.
+
+    Args:
+        max_entries: Maximum number of cached principals
+        ttl_seconds: Lifetime of an entry; bounds how long a deactivation
+            made in another process goes unnoticed
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 60.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, Tuple[Principal, float]]" = OrderedDict()
+
+    def get(self, user_id: int) -> Optional[Principal]:
+        """Return a cached principal, or None if absent or expired."""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        if entry[1] < time.monotonic():
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return entry[0]
+
+    def put(self, principal: Principal) -> None:
+        """Cache a principal, evicting the least recently used beyond capacity."""
+        if self.max_entries <= 0:
+            return
+        self._entries[principal.id] = (principal, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(principal.id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        """Drop a user's principal."""
+        self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        """Drop every principal."""
+        self._entries.clear()
+
+def _build_principal_cache() -> PrincipalCache:
+    """Create the process-wide principal cache from settings."""
+    settings = get_settings()
+    return PrincipalCache(settings.principal_cache_max_entries, settings.principal_cache_ttl_seconds)
+
+principal_cache = _build_principal_cache()
+
+# Password hashing
+
+def _has_backend(scheme: str) -> bool:
+    """Check that a passlib scheme exists and its backend library is installed."""
+    try:
+        handler = get_crypt_handler(scheme)
+    except KeyError:
+        return False
+    has_backend = getattr(handler, "has_backend", None)
+    return has_backend is None or has_backend()
+
+@lru_cache()
+def password_context() -> CryptContext:
+    """
+    Build the passlib context from the configured schemes.
+
+    Returns:
+        Context hashing with the first usable scheme and verifying all of them
+
+    Raises:
+        RuntimeError: If none of the configured schemes is usable
+    """
+    schemes = [scheme for scheme in get_settings().password_schemes if _has_backend(scheme)]
+    if not schemes:
+        raise RuntimeError(f"No usable password scheme in {get_settings().password_schemes}")
+    logger.info(f"Hashing passwords with {schemes[0]}")
+    return CryptContext(schemes=schemes, deprecated="auto")
+
+_hash_executor: Optional[ThreadPoolExecutor] = None
+
+def _executor() -> ThreadPoolExecutor:
+    """Return the password hashing pool, creating it on first use."""
+    global _hash_executor
+    if _hash_executor is None:
+        _hash_executor = ThreadPoolExecutor(
+            max_workers=get_settings().password_hash_workers, thread_name_prefix="password-hash"
+        )
+    return _hash_executor
+
+def shutdown_password_pool() -> None:
+    """Shut down the password hashing pool, waiting for running hashes."""
+    global _hash_executor
+    if _hash_executor is not None:
+        _hash_executor.shutdown(wait=True)
+        _hash_executor = None
+
+async def hash_password(password: str) -> str:
+    """
+    Hash a password off the event loop.
+
+    Args:
+        password: Plain text password
+
+    Returns:
+        Encoded hash in the default scheme
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor(), password_context().hash, password)
+
+async def verify_password(password: str, hashed: Optional[str]) -> Tuple[bool, Optional[str]]:
+    """
+    Check a password off the event loop.
+
+    A missing hash is checked against a throwaway hash, so unknown
+    usernames take as long to reject as wrong passwords.
+
+    Args:
+        password: Plain text password
+        hashed: Stored hash, or None when the user does not exist
+
+    Returns:
+        Whether the password matches, and a replacement hash when the
+        stored one uses a deprecated scheme or settings
+    """
+    context = password_context()
+    loop = asyncio.get_running_loop()
+    if hashed is None:
+        await loop.run_in_executor(_executor(), context.dummy_verify)
+        return False, None
+    return await loop.run_in_executor(_executor(), context.verify_and_update, password, hashed)
+
+# Tokens
+
+def create_access_token(user_id: int) -> Tuple[str, int]:
+    """
+    Issue a signed access token.
+
+    Args:
+        user_id: Subject of the token
+
+    Returns:
+        Encoded token and its lifetime in seconds
+    """
+    settings = get_settings()
+    now = datetime.utcnow()
+    lifetime = timedelta(minutes=settings.access_token_expire_minutes)
+    claims = {"sub": str(user_id), "iat": now, "exp": now + lifetime}
+    return jwt.encode(claims, settings.secret_key, algorithm=settings.algorithm), int(lifetime.total_seconds())
+
+def decode_access_token(token: str) -> int:
+    """
+    Verify a token's signature and expiry.
+
+    Args:
+        token: Encoded access token
+
+    Returns:
+        The user id it was issued to
+
+    Raises:
+        HTTPException: 401 if the token is invalid or expired
+    """
+    settings = get_settings()
+    try:
+        claims = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+        return int(claims["sub"])
+    except (JWTError, KeyError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired token",
+            headers=BEARER_CHALLENGE
+        )
+
+# Principals
+
+async def load_principal(db: AsyncSession, user_id: int) -> Optional[Principal]:
+    """
+    Look up an active user's principal, from the cache when possible.
+
+    Args:
+        db: Database session, used only on a cache miss
+        user_id: User id
+
+    Returns:
+        The principal, or None if the user is missing or deactivated
+    """
+    principal = principal_cache.get(user_id)
+    if principal is not None:
+        return principal
+    user = models.User
+    row = (await db.execute(
+        select(user.id, user.username, user.is_admin).where(user.id == user_id, user.is_active.is_(True))
+    )).first()
+    if row is None:
+        return None
+    principal = Principal(id=row.id, username=row.username, is_admin=bool(row.is_admin))
+    principal_cache.put(principal)
+    return principal
+
+async def get_optional_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
+    db: AsyncSession = Depends(get_write_session)
+) -> Optional[Principal]:
+    """
+    Dependency resolving the bearer token, if any, to a principal.
+
+    The session is the request's write session, so routes that already
+    write share it rather than opening another.
+
+    Returns:
+        The principal, or None for anonymous requests
+
+    Raises:
+        HTTPException: 401 if a token is given but invalid, or its user is deactivated
+    """
+    if credentials is None:
+        return None
+    principal = await load_principal(db, decode_access_token(credentials.credentials))
+    if principal is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User is inactive or does not exist",
+            headers=BEARER_CHALLENGE
+        )
+    return principal
+
+async def get_current_user(principal: Optional[Principal] = Depends(get_optional_user)) -> Principal:
+    """
+    Dependency requiring an authenticated user.
+
+    Raises:
+        HTTPException: 401 for anonymous requests
+    """
+    if principal is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers=BEARER_CHALLENGE
+        )
+    return principal
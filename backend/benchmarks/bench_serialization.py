@@ -0,0 +1,83 @@
+"""
+Micro-benchmark of list response serialization.
+
+Compares the old path (ORM objects through jsonable_encoder and json.dumps)
+with the new one (column row tuples through orjson) for pages of ratings,
+reporting milliseconds per 1,000 rows for fetch plus encode.
+
+Run from the backend directory:
+    python benchmarks/bench_serialization.py [--rows 1000] [--repeat 20]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import models
+import schemas
+
+def seed(session: Session, rows: int) -> None:
+    """Insert one project and ``rows`` ratings."""
+    project = models.Project(title="Benchmark", expected_rasa=models.Rasa.SHANTA)
+    session.add(project)
+    session.flush()
+    rasas = list(models.Rasa)
+    session.execute(insert(models.Rating), [
+        {
+            "project_id": project.id,
+            "rasa": rasas[i % len(rasas)],
+            "rating_value": i % 10 + 1,
+            "feedback": f"feedback {i}",
+            "created_at": datetime(2024, 1, 1),
+        }
+        for i in range(rows)
+    ])
+    session.commit()
+
+def orm_path(session: Session) -> bytes:
+    """Previous behaviour: ORM instances, reflective encoding, stdlib json."""
+    ratings = session.execute(select(models.Rating)).scalars().all()
+    body = json.dumps(jsonable_encoder(ratings), separators=(",", ":")).encode("utf-8")
+    session.expunge_all()
+    return body
+
+def row_path(session: Session) -> bytes:
+    """Current behaviour: schema columns, row dicts, orjson."""
+    result = session.execute(select(*schemas.RATING_COLUMNS))
+    return orjson.dumps(schemas.rows_to_dicts(result), default=jsonable_encoder)
+
+def measure(func, session: Session, repeat: int) -> float:
+    """Return the best wall time of ``repeat`` runs in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(session)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        seed(session, args.rows)
+        per_k = 1000 / args.rows
+        for name, func in (("orm + jsonable_encoder + json", orm_path), ("rows + orjson", row_path)):
+            seconds = measure(func, session, args.repeat)
+            print(f"{name:32s} {seconds * per_k * 1000:8.2f} ms / 1k rows")
+
+if __name__ == "__main__":
+    main()
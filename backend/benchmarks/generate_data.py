@@ -0,0 +1,320 @@
+"""
+Synthetic data generator for RMS benchmarks.
+
+Fills an empty database with users, projects, content items,
+philosophical analyses and ratings. Project ``expected_rasa`` values
+follow a Zipf-like skew, and each rating matches its project's expected
+rasa with probability ``--match-rate``. The output is deterministic for a
+given ``--seed``.
+
+Ratings are generated in chunks and bulk loaded with executemany inserts
+(COPY on PostgreSQL with psycopg2), then the rasa aggregate tables are
+rebuilt from them. Ids are assigned here, so the target tables must be
+empty; ``--reset`` drops and recreates the schema first.
+
+Run from the backend directory:
+    python benchmarks/generate_data.py --ratings 10000000 --reset
+"""
+import argparse
+import csv
+import io
+import logging
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Sequence, Tuple
+
+from sqlalchemy import Table, create_engine, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aggregates
+import models
+from database import ensure_indexes, get_database_url
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+RASAS = list(models.Rasa)
+GENDERS = list(models.Gender)
+CONTENT_TYPES = ("image", "video", "text")
+RACE_PERSPECTIVES = ("North Indian", "South Indian", "East Indian", "West Indian")
+RELIGIOUS_PERSPECTIVES = ("Hindu", "Muslim", "Christian", "Sikh", "Jain", "Buddhist")
+
+# Rasa weights for project expected_rasa, 1/rank
+RASA_WEIGHTS = [1 / rank for rank in range(1, len(RASAS) + 1)]
+
+# Ratings are spread over this many days before GENERATED_AT
+RATING_SPAN_DAYS = 365
+
+# Fixed timestamp so that runs with the same seed produce identical data
+GENERATED_AT = datetime(2025, 1, 1)
+
+# Rating tuple layout produced by generate_ratings
+RATING_COLUMNS = (
+    models.Rating.id,
+    models.Rating.user_id,
+    models.Rating.project_id,
+    models.Rating.content_item_id,
+    models.Rating.rasa,
+    models.Rating.rating_value,
+    models.Rating.feedback,
+    models.Rating.created_at,
+)
+
+def generate_users(count: int) -> Iterator[Dict[str, Any]]:
+    """Generate user rows with ids 1..count."""
+    for user_id in range(1, count + 1):
+        yield {
+            "id": user_id,
+            "username": f"user{user_id}",
+            "email": f"user{user_id}@example.com",
+            "hashed_password": "not-a-real-hash",
+            "is_active": True,
+            "is_admin": False,
+            "created_at": GENERATED_AT,
+        }
+
+def generate_projects(rng: random.Random, count: int, users: int) -> List[Dict[str, Any]]:
+    """Generate project rows with a skewed expected_rasa."""
+    expected = rng.choices(RASAS, weights=RASA_WEIGHTS, k=count)
+    return [
+        {
+            "id": project_id,
+            "title": f"Project {project_id}",
+            "description": f"Synthetic project {project_id}",
+            "creator_id": rng.randint(1, users) if users else None,
+            "expected_rasa": expected[project_id - 1].name,
+            "created_at": GENERATED_AT,
+        }
+        for project_id in range(1, count + 1)
+    ]
+
+def generate_content_items(rng: random.Random, projects: int, per_project: int) -> Iterator[Dict[str, Any]]:
+    """Generate content item rows, ``per_project`` for every project."""
+    item_id = 0
+    for project_id in range(1, projects + 1):
+        for position in range(per_project):
+            item_id += 1
+            content_type = rng.choice(CONTENT_TYPES)
+            yield {
+                "id": item_id,
+                "project_id": project_id,
+                "title": f"Item {position + 1} of project {project_id}",
+                "content_type": content_type,
+                "content_url": f"https://example.com/content/{item_id}.{content_type}",
+                "created_at": GENERATED_AT,
+            }
+
+def generate_analyses(rng: random.Random, items: int) -> Iterator[Dict[str, Any]]:
+    """Generate one philosophical analysis per content item."""
+    for item_id in range(1, items + 1):
+        yield {
+            "id": item_id,
+            "content_item_id": item_id,
+            "gender_perspective": rng.choice(GENDERS).name,
+            "race_perspective": rng.choice(RACE_PERSPECTIVES),
+            "religious_perspective": rng.choice(RELIGIOUS_PERSPECTIVES),
+            "analysis_notes": f"Synthetic analysis {item_id}",
+            "created_at": GENERATED_AT,
+        }
+
+def generate_ratings(
+    rng: random.Random,
+    count: int,
+    projects: Sequence[Dict[str, Any]],
+    users: int,
+    items_per_project: int,
+    match_rate: float,
+    chunk_size: int
+) -> Iterator[List[Tuple]]:
+    """
+    Generate rating rows in chunks of tuples.
+
+    Args:
+        rng: Seeded random generator
+        count: Total ratings
+        projects: Generated project rows
+        users: Number of users
+        items_per_project: Content items per project
+        match_rate: Probability a rating uses the project's expected rasa
+        chunk_size: Rows per chunk
+
+    Yields:
+        Lists of (id, user_id, project_id, content_item_id, rasa,
+        rating_value, feedback, created_at) tuples
+    """
+    rasa_names = [rasa.name for rasa in RASAS]
+    expected = [project["expected_rasa"] for project in projects]
+    start = GENERATED_AT - timedelta(days=RATING_SPAN_DAYS)
+    span_seconds = RATING_SPAN_DAYS * 86400
+    rating_id = 0
+    while rating_id < count:
+        size = min(chunk_size, count - rating_id)
+        # Sorted offsets keep created_at increasing with id, as in production
+        offsets = sorted(rng.random() * span_seconds for _ in range(size))
+        chunk = []
+        for offset in offsets:
+            rating_id += 1
+            project_index = rng.randrange(len(projects))
+            matched = rng.random() < match_rate
+            rasa = expected[project_index] if matched else rng.choice(rasa_names)
+            content_item_id = (
+                project_index * items_per_project + rng.randrange(items_per_project) + 1
+                if items_per_project else None
+            )
+            chunk.append((
+                rating_id,
+                rng.randint(1, users) if users else None,
+                project_index + 1,
+                content_item_id,
+                rasa,
+                min(10, max(1, round(rng.gauss(7.5 if matched else 5.0, 1.8)))),
+                None,
+                start + timedelta(seconds=offset),
+            ))
+        yield chunk
+
+def _copy_rows(connection: Connection, table: Table, columns: Sequence[str], rows: Sequence[Tuple]) -> None:
+    """Load rows with PostgreSQL COPY through the raw psycopg2 cursor."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(tuple("" if value is None else value for value in row) for row in rows)
+    buffer.seek(0)
+    dbapi_connection = connection.connection.dbapi_connection
+    with dbapi_connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '')",
+            buffer
+        )
+
+def load_rows(connection: Connection, table: Table, rows: Sequence[Any], use_copy: bool) -> None:
+    """
+    Bulk load one chunk of rows.
+
+    Args:
+        connection: Connection inside the load transaction
+        table: Target table
+        rows: Dicts keyed by column, or tuples in column order of the ratings chunk
+        use_copy: Use COPY instead of an executemany insert
+    """
+    if not rows:
+        return
+    if isinstance(rows[0], dict):
+        columns = list(rows[0])
+        tuples = [tuple(row[column] for column in columns) for row in rows]
+    else:
+        columns = [column.key for column in RATING_COLUMNS]
+        tuples = rows
+    if use_copy:
+        _copy_rows(connection, table, columns, tuples)
+    else:
+        connection.execute(table.insert(), [dict(zip(columns, row)) for row in tuples])
+
+def _chunks(rows: Iterator[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    """Group an iterator of rows into lists of at most ``size``."""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _reset_sequences(connection: Connection) -> None:
+    """Move PostgreSQL id sequences past the explicitly assigned ids."""
+    for table in (models.User, models.Project, models.ContentItem, models.PhilosophicalAnalysis, models.Rating):
+        name = table.__tablename__
+        connection.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), COALESCE((SELECT MAX(id) FROM {name}), 1))"
+        ))
+
+def generate(engine: Engine, args: argparse.Namespace) -> Dict[str, int]:
+    """
+    Generate and load the full data set.
+
+    Args:
+        engine: Target engine
+        args: Parsed command line arguments
+
+    Returns:
+        Row counts per table
+    """
+    rng = random.Random(args.seed)
+    use_copy = engine.dialect.name == "postgresql" and engine.dialect.driver == "psycopg2"
+    if args.reset:
+        models.Base.metadata.drop_all(engine)
+    models.Base.metadata.create_all(engine)
+    ensure_indexes(engine)
+
+    projects = generate_projects(rng, args.projects, args.users)
+    items = args.projects * args.items_per_project
+    counts = {"users": args.users, "projects": args.projects, "content_items": items,
+              "philosophical_analyses": items, "ratings": args.ratings}
+
+    with engine.begin() as connection:
+        if engine.dialect.name == "sqlite":
+            connection.exec_driver_sql("PRAGMA synchronous=OFF")
+        for table, rows in (
+            (models.User.__table__, generate_users(args.users)),
+            (models.Project.__table__, iter(projects)),
+            (models.ContentItem.__table__, generate_content_items(rng, args.projects, args.items_per_project)),
+            (models.PhilosophicalAnalysis.__table__, generate_analyses(rng, items)),
+        ):
+            for chunk in _chunks(rows, args.chunk_size):
+                load_rows(connection, table, chunk, use_copy)
+            logger.info(f"Loaded {table.name}")
+
+    started = time.perf_counter()
+    loaded = 0
+    for chunk in generate_ratings(rng, args.ratings, projects, args.users,
+                                  args.items_per_project, args.match_rate, args.chunk_size):
+        # One transaction per chunk keeps the WAL / transaction log bounded
+        with engine.begin() as connection:
+            load_rows(connection, models.Rating.__table__, chunk, use_copy)
+        loaded += len(chunk)
+        rate = loaded / (time.perf_counter() - started)
+        logger.info(f"Loaded {loaded}/{args.ratings} ratings ({rate:,.0f} rows/s)")
+
+    with engine.begin() as connection:
+        if engine.dialect.name == "postgresql":
+            _reset_sequences(connection)
+    with Session(engine) as db:
+        aggregates.rebuild_rasa_stats(db)
+        db.commit()
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as connection:
+            connection.execution_options(isolation_level="AUTOCOMMIT").exec_driver_sql("ANALYZE")
+    return counts
+
+def main() -> None:
+    """Command line entry point."""
+    from config import init_logging
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=None, help="Target database (defaults to the configured one)")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--projects", type=int, default=1_000)
+    parser.add_argument("--items-per-project", type=int, default=20)
+    parser.add_argument("--ratings", type=int, default=10_000_000)
+    parser.add_argument("--match-rate", type=float, default=0.4,
+                        help="Probability that a rating uses the project's expected rasa")
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="Drop and recreate all tables first")
+    args = parser.parse_args()
+
+    init_logging()
+    engine = create_engine(args.database_url or get_database_url())
+    started = time.perf_counter()
+    counts = generate(engine, args)
+    engine.dispose()
+    logger.info(f"Generated {counts} in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+"""
+HTTP load test harness for the RMS API.
+
+Drives a weighted mix of read and write requests from concurrent async
+workers and reports throughput and p50/p95/p99 latency per endpoint.
+Requests go either to ``main.app`` in-process through httpx's ASGI
+transport, or over HTTP to a uvicorn server (``--serve`` starts one,
+``--base-url`` targets a running one).
+
+Results are written as JSON. When ``--baseline`` is given the run is
+compared with it, and the process exits non-zero if any endpoint's p95
+latency grew, or its throughput fell, by more than ``--threshold``.
+
+Run from the backend directory against a database filled by
+generate_data.py (select it with the ``database_url`` environment variable):
+    python benchmarks/load_test.py --duration 30 --output results.json
+    python benchmarks/load_test.py --serve --baseline results.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+API = "/api/v1"
+
+RASA_NAMES = ("SHRINGARA", "HASYA", "KARUNA", "VEERA", "BHAYANAKA", "ADBHUTA", "SHANTA", "BIBHATSA", "RAUDRA")
+
+@dataclass
+class Workload:
+    """Shared state for scenarios: known ids and a seeded generator."""
+    rng: random.Random
+    project_ids: List[int] = field(default_factory=list)
+
+    def project_id(self) -> int:
+        """Pick a project, favouring low ids to give the cache some hot keys."""
+        return self.project_ids[min(int(self.rng.expovariate(1 / 20)), len(self.project_ids) - 1)]
+
+    def rating(self, project_id: int) -> Dict[str, Any]:
+        """Build a random rating payload."""
+        return {"project_id": project_id, "rasa": self.rng.choice(RASA_NAMES), "rating_value": self.rng.randint(1, 10)}
+
+Scenario = Callable[[httpx.AsyncClient, Workload], Awaitable[httpx.Response]]
+
+async def list_projects(client: httpx.AsyncClient, workload: Workload) -> httpx.Response:
+    """First keyset page of projects."""
+    return await client.get(f"{API}/projects/", params={"cursor": "", "limit": 50})
+
+async def project_detail(client: httpx.AsyncClient, workload: Workload) -> httpx.Response:
+    """Project detail with content items and the rasa summary."""
+    return await client.get(
+        f"{API}/projects/{workload.project_id()}",
+        params={"include": "content_items,rating_summary", "fields": "title,content_items.title"}
+    )
+
+async def rasa_summary(client: httpx.AsyncClient, workload: Workload) -> httpx.Response:
+    """Rasa summary of one project."""
+    return await client.get(f"{API}/projects/{workload.project_id()}/rasa-summary")
+
+async def list_ratings(client: httpx.AsyncClient, workload: Workload) -> httpx.Response:
+    """First keyset page of one project's ratings."""
+    return await client.get(f"{API}/ratings/", params={"project_id": workload.project_id(), "cursor": "", "limit": 50})
+
+async def create_rating(client: httpx.AsyncClient, workload: Workload) -> httpx.Response:
+    """Single rating insert."""
+    return await client.post(f"{API}/ratings/", json=workload.rating(workload.project_id()))
+
+async def create_ratings_batch(client: httpx.AsyncClient, workload: Workload) -> httpx.Response:
+    """Batch insert of 100 ratings."""
+    project_id = workload.project_id()
+    return await client.post(f"{API}/ratings/batch", json=[workload.rating(project_id) for _ in range(100)])
+
+# Scenario name -> (function, default weight)
+SCENARIOS: Dict[str, Tuple[Scenario, float]] = {
+    "list_projects": (list_projects, 15),
+    "project_detail": (project_detail, 25),
+    "rasa_summary": (rasa_summary, 25),
+    "list_ratings": (list_ratings, 20),
+    "create_rating": (create_rating, 13),
+    "create_ratings_batch": (create_ratings_batch, 2),
+}
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def summarize(samples: Dict[str, List[float]], errors: Dict[str, int], elapsed: float) -> Dict[str, Any]:
+    """
+    Reduce raw latencies to per-endpoint statistics.
+
+    Args:
+        samples: Latencies in seconds per scenario
+        errors: Failed requests per scenario
+        elapsed: Wall time of the run in seconds
+
+    Returns:
+        Dict of scenario name to count, errors, rps and latency percentiles in ms
+    """
+    endpoints = {}
+    for name in sorted(set(samples) | set(errors)):
+        latencies = sorted(samples.get(name, []))
+        endpoints[name] = {
+            "count": len(latencies),
+            "errors": errors.get(name, 0),
+            "rps": len(latencies) / elapsed if elapsed else 0.0,
+            **{
+                f"p{pct}_ms": round(value * 1000, 3) if value is not None else None
+                for pct in (50, 95, 99)
+                for value in [percentile(latencies, pct)]
+            },
+        }
+    return endpoints
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    List regressions of a run against a baseline.
+
+    Args:
+        results: Current run, as produced by run_load
+        baseline: Earlier run to compare with
+        threshold: Allowed relative change, e.g. 0.2 for 20%
+
+    Returns:
+        Human-readable regression descriptions; empty if none
+    """
+    regressions = []
+    for name, base in baseline["endpoints"].items():
+        current = results["endpoints"].get(name)
+        if current is None:
+            continue
+        if base.get("p95_ms") and current.get("p95_ms") is not None:
+            if current["p95_ms"] > base["p95_ms"] * (1 + threshold):
+                regressions.append(f"{name}: p95 {base['p95_ms']:.2f} ms -> {current['p95_ms']:.2f} ms")
+        if base.get("rps") and current["rps"] < base["rps"] * (1 - threshold):
+            regressions.append(f"{name}: throughput {base['rps']:.1f} -> {current['rps']:.1f} req/s")
+        if current["errors"] > base.get("errors", 0):
+            regressions.append(f"{name}: errors {base.get('errors', 0)} -> {current['errors']}")
+    return regressions
+
+async def _discover_projects(client: httpx.AsyncClient, workload: Workload, minimum: int = 10) -> None:
+    """Collect existing project ids, creating a few if the database is empty."""
+    response = await client.get(f"{API}/projects/", params={"cursor": "", "limit": 200})
+    response.raise_for_status()
+    workload.project_ids = [project["id"] for project in response.json()["items"]]
+    while len(workload.project_ids) < minimum:
+        response = await client.post(f"{API}/projects/", json={"title": f"Load test {len(workload.project_ids)}"})
+        response.raise_for_status()
+        workload.project_ids.append(response.json()["id"])
+
+async def run_load(
+    client: httpx.AsyncClient,
+    weights: Dict[str, float],
+    concurrency: int = 16,
+    duration: Optional[float] = None,
+    requests: Optional[int] = None,
+    seed: int = 42
+) -> Dict[str, Any]:
+    """
+    Run the workload against a client until the duration or request budget is spent.
+
+    Args:
+        client: httpx client bound to the target
+        weights: Relative weight per scenario name
+        concurrency: Number of concurrent workers
+        duration: Seconds to run for
+        requests: Total requests to send; takes precedence over duration
+        seed: Seed for scenario choice and payloads
+
+    Returns:
+        Dict with run settings, totals and per-endpoint statistics
+    """
+    workload = Workload(rng=random.Random(seed))
+    await _discover_projects(client, workload)
+    names = [name for name, weight in weights.items() if weight > 0]
+    scenario_weights = [weights[name] for name in names]
+    samples: Dict[str, List[float]] = {name: [] for name in names}
+    errors: Dict[str, int] = {}
+    remaining = [requests]
+    deadline = time.perf_counter() + (duration if duration is not None else 10.0)
+
+    async def worker() -> None:
+        while True:
+            if remaining[0] is not None:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            elif time.perf_counter() >= deadline:
+                return
+            name = workload.rng.choices(names, weights=scenario_weights)[0]
+            start = time.perf_counter()
+            try:
+                response = await SCENARIOS[name][0](client, workload)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            if failed:
+                errors[name] = errors.get(name, 0) + 1
+            else:
+                samples[name].append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    endpoints = summarize(samples, errors, elapsed)
+    total = sum(stats["count"] for stats in endpoints.values())
+    return {
+        "settings": {"concurrency": concurrency, "duration": duration, "requests": requests,
+                     "seed": seed, "weights": {name: weights[name] for name in names}},
+        "elapsed_seconds": round(elapsed, 3),
+        "total": {"count": total, "errors": sum(errors.values()), "rps": total / elapsed if elapsed else 0.0},
+        "endpoints": endpoints,
+    }
+
+async def run_in_process(args: argparse.Namespace, weights: Dict[str, float]) -> Dict[str, Any]:
+    """Run against main.app through the ASGI transport, with startup and shutdown."""
+    from main import app
+
+    await app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://rms") as client:
+            return await run_load(client, weights, args.concurrency, args.duration, args.requests, args.seed)
+    finally:
+        await app.router.shutdown()
+
+def _free_port() -> int:
+    """Return a free local TCP port."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def run_over_http(args: argparse.Namespace, weights: Dict[str, float]) -> Dict[str, Any]:
+    """Run against a uvicorn server, starting one first if ``--serve`` is set."""
+    server = None
+    base_url = args.base_url
+    if args.serve:
+        port = _free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        server = subprocess.Popen(
+            [sys.executable, "serve.py", "--port", str(port),
+             "--workers", str(args.workers), "--log-level", "warning"],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        )
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30.0) as client:
+            for _ in range(100):
+                try:
+                    if (await client.get("/health")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.1)
+            else:
+                raise RuntimeError(f"Server at {base_url} did not become healthy")
+            return await run_load(client, weights, args.concurrency, args.duration, args.requests, args.seed)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+
+def parse_mix(raw: Optional[str]) -> Dict[str, float]:
+    """Parse ``name=weight,...`` overrides on top of the default weights."""
+    weights = {name: weight for name, (_, weight) in SCENARIOS.items()}
+    for part in (raw or "").split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        if name.strip() not in SCENARIOS:
+            raise ValueError(f"Unknown scenario {name}. Must be one of: {', '.join(SCENARIOS)}")
+        weights[name.strip()] = float(weight)
+    return weights
+
+def main() -> None:
+    """Command line entry point."""
+    from config import init_logging
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--serve", action="store_true", help="Start uvicorn and test over HTTP")
+    target.add_argument("--base-url", default=None, help="Test a running server over HTTP")
+    parser.add_argument("--workers", type=int, default=1, help="Server worker processes with --serve")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run")
+    parser.add_argument("--requests", type=int, default=None, help="Total requests; overrides --duration")
+    parser.add_argument("--mix", default=None, help="Scenario weights, e.g. create_rating=0,list_ratings=50")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="Write results JSON here")
+    parser.add_argument("--baseline", default=None, help="Compare with this results JSON")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    init_logging()
+    weights = parse_mix(args.mix)
+    runner = run_over_http if (args.serve or args.base_url) else run_in_process
+    results = asyncio.run(runner(args, weights))
+    results["target"] = args.base_url or ("uvicorn" if args.serve else "in-process")
+
+    for name, stats in results["endpoints"].items():
+        print(f"{name:22s} {stats['count']:7d} req {stats['errors']:5d} err {stats['rps']:9.1f} req/s  "
+              f"p50 {stats['p50_ms']} ms  p95 {stats['p95_ms']} ms  p99 {stats['p99_ms']} ms")
+    print(f"{'total':22s} {results['total']['count']:7d} req {results['total']['errors']:5d} err "
+          f"{results['total']['rps']:9.1f} req/s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("target") != results["target"]:
+            logger.warning(f"Baseline target {baseline.get('target')} differs from {results['target']}")
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            logger.error(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
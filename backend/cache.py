@@ -0,0 +1,160 @@
+"""
+In-process response cache for RMS read endpoints.
+
+Rendered JSON bodies are cached per route and query string with LRU and
+TTL eviction. Each entry records the version counters of the data scopes
+it was built from (all projects, all ratings, or one project); writes bump
+those counters, so only the entries they affect stop matching. Responses
+carry a strong ETag and conditional requests are answered with 304.
+
+The cache is per process; with several workers each keeps its own copy.
+"""
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import orjson
+from fastapi import Request, Response, status
+from fastapi.encoders import jsonable_encoder
+
+from config import get_settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Version scopes
+PROJECTS_SCOPE = "projects"
+RATINGS_SCOPE = "ratings"
+CONTENT_SCOPE = "content_items"
+
+def project_scope(project_id: int) -> str:
+    """Return the version scope covering one project's ratings and stats."""
+    return f"project:{project_id}"
+
+@dataclass
+class CacheEntry:
+    """A rendered response body and the data versions it was built from."""
+    body: bytes
+    etag: str
+    versions: Tuple[int, ...]
+    expires_at: float
+
+class ResponseCache:
+    """
+    LRU/TTL cache of rendered JSON responses with versioned invalidation.
+
+    Args:
+        max_entries: Maximum number of cached responses
+        ttl_seconds: Lifetime of an entry regardless of invalidation
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 60.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+
+    @staticmethod
+    def key_for(request: Request) -> str:
+        """Build a cache key from the route path and sorted query params."""
+        params = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+        return f"{request.url.path}?{params}"
+
+    def versions(self, scopes: Iterable[str]) -> Tuple[int, ...]:
+        """
+        Snapshot the version counters for a set of scopes.
+
+        Take the snapshot before querying, so a write that lands during
+        the query leaves the stored entry already stale.
+        """
+        return tuple(self._versions.get(scope, 0) for scope in scopes)
+
+    def invalidate(self, *scopes: str) -> None:
+        """Bump the version counters of the given scopes."""
+        for scope in scopes:
+            self._versions[scope] = self._versions.get(scope, 0) + 1
+
+    def clear(self) -> None:
+        """Drop every entry and reset all version counters."""
+        self._entries.clear()
+        self._versions.clear()
+
+    def respond(self, request: Request, scopes: Tuple[str, ...]) -> Optional[Response]:
+        """
+        Answer a request from the cache.
+
+        Args:
+            request: Incoming GET request
+            scopes: Data scopes the route depends on
+
+        Returns:
+            Cached response (200 or 304), or None on a miss
+        """
+        key = self.key_for(request)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at < time.monotonic() or entry.versions != self.versions(scopes):
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        logger.debug(f"Response cache hit for {key}")
+        return _render(request, entry)
+
+    def store(
+        self,
+        request: Request,
+        versions: Tuple[int, ...],
+        content: Any
+    ) -> Response:
+        """
+        Render content, cache it and build the response.
+
+        Args:
+            request: Incoming GET request
+            versions: Version snapshot taken before the content was queried
+            content: Row dicts and plain values; anything orjson does not
+                know natively goes through jsonable_encoder
+
+        Returns:
+            Response for the request (200, or 304 if the client copy matches)
+        """
+        body = orjson.dumps(content, default=jsonable_encoder)
+        entry = CacheEntry(
+            body=body,
+            etag=f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"',
+            versions=versions,
+            expires_at=time.monotonic() + self.ttl_seconds,
+        )
+        if self.max_entries > 0:
+            key = self.key_for(request)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return _render(request, entry)
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an entity tag."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+def _render(request: Request, entry: CacheEntry) -> Response:
+    """Build a 200 or 304 response for a cache entry."""
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+def _build_cache() -> ResponseCache:
+    """Create the process-wide cache from settings."""
+    settings = get_settings()
+    max_entries = settings.response_cache_max_entries if settings.response_cache_enabled else 0
+    return ResponseCache(max_entries=max_entries, ttl_seconds=settings.response_cache_ttl_seconds)
+
+response_cache = _build_cache()
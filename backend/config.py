@@ -7,10 +7,12 @@ It provides a centralized way to manage configuration across the application.
 import os
 import logging
 from functools import lru_cache
-from typing import Optional
+from typing import List, Optional
 from pydantic_settings import BaseSettings
 from pathlib import Path
 
+import log_pipeline
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
@@ -22,9 +24,89 @@ class Settings(BaseSettings):
         app_name: Name of the application
         debug: Debug mode flag
         database_url: Database connection URL
+        read_database_urls: Read replica URLs; reads use the primary when empty
+        db_pool_size: Persistent connections in the primary pool
+        read_pool_size: Persistent connections in each read pool
+        db_max_overflow: Extra connections a pool may open under load
+        db_pool_recycle: Seconds before a pooled connection is replaced
+        db_pool_timeout: Seconds to wait for a pooled connection
+        db_max_connections: Connections the database allows this application; pools of all
+            workers are sized to fit within it (0 for no limit)
+        db_init_on_startup: Create the schema when a worker starts; the serve launcher does it
+            once instead and turns this off for its workers
+        workers: Server processes sharing the database, set by the serve launcher, which turns
+            off the response cache, live updates and write-behind when it is above 1
+        sqlite_mmap_size: SQLite memory-mapped I/O size in bytes
+        sqlite_cache_size: SQLite page cache size (negative for KiB)
         secret_key: Secret key for JWT token generation
         algorithm: Algorithm used for JWT token
         access_token_expire_minutes: JWT token expiration time
+        password_schemes: Passlib schemes in preference order; the first installed one hashes
+        password_hash_workers: Threads hashing and verifying passwords
+        principal_cache_max_entries: LRU capacity of the authenticated user cache
+        principal_cache_ttl_seconds: Maximum age of a cached user principal
+        rating_batch_max_rows: Maximum rows accepted by the batch rating endpoint
+        rating_batch_max_bytes: Largest batch rating body in bytes, refused before it is read
+        write_behind_enabled: Queue single ratings and write them in group commits
+        write_behind_max_queue: Capacity of the write-behind queue
+        write_behind_flush_interval_ms: Maximum wait before queued ratings are flushed
+        write_behind_flush_max_rows: Maximum ratings per group commit
+        write_behind_enqueue_timeout_ms: Wait for queue space before answering 503
+        response_cache_enabled: Cache rendered GET responses in process
+        response_cache_max_entries: LRU capacity of the response cache
+        response_cache_ttl_seconds: Maximum age of a cached response
+        live_updates_enabled: Serve live rasa distributions over SSE and WebSocket
+        live_max_updates_per_second: Upper bound on pushes per project per second
+        live_queue_size: Updates buffered per subscriber before the oldest are dropped
+        live_max_subscribers: Live connections accepted per process
+        live_heartbeat_seconds: Idle interval after which a keep-alive is sent
+        rollup_enabled: Maintain minute/hour/day rating rollups in the background
+        rollup_interval_seconds: Pause between rollup refresh passes
+        rollup_batch_size: Rating ids folded per rollup transaction
+        rating_id_settle_seconds: Age at which the highest rating id seen is taken as complete on
+            PostgreSQL, where ids are drawn before commit; must exceed the longest rating write transaction
+        trend_max_points: Largest number of buckets a trend response may hold
+        trend_default_days: Trend range used when no 'from' is given
+        sketch_hll_precision: HyperLogLog precision of the distinct-rater sketches (4-16)
+        search_language: PostgreSQL text search configuration used for stemming
+        snapshot_dir: Root of the partitioned Parquet ratings snapshot
+        upload_folder: Root of partial uploads and content-addressed media
+        max_upload_size: Largest accepted media upload in bytes
+        allowed_file_types: Content types accepted for media uploads
+        upload_write_buffer_size: Upload bytes collected before each disk write
+        media_read_chunk_size: Bytes per read when media is served without sendfile
+        media_worker_enabled: Run a media processing worker inside the API process
+        media_worker_processes: Worker processes running media jobs at once
+        media_job_timeout_seconds: Time a media job may run before its process is killed
+        media_job_max_attempts: Runs before a media job is marked failed
+        media_job_retry_seconds: Backoff before the first retry; doubles per attempt
+        media_job_poll_seconds: Interval between queue checks when not woken
+        media_thumbnail_widths: Thumbnail widths produced for images and videos
+        media_active_project_days: Projects rated within this many days get priority
+        snapshot_batch_size: Rows fetched and written per snapshot batch
+        similarity_refresh_seconds: Age after which a similarity query first folds in newer ratings
+        similarity_warm_on_startup: Load the similarity index in the background at startup
+        similarity_load_chunk_size: Aggregate rows fetched per batch when loading the similarity index
+        admission_enabled: Apply admission control and rate limits to HTTP requests
+        admission_max_in_flight: Requests served at once; 0 uses the primary pool's size plus overflow
+        admission_max_queue: Requests allowed to wait for an in-flight slot
+        admission_queue_timeout_ms: Longest wait for a slot before a request is shed with 503
+        rate_limit_client_per_second: Sustained requests per second per client; 0 disables
+        rate_limit_client_burst: Requests a client may send at once after being idle
+        rate_limit_project_per_second: Sustained rating writes per second per project; 0 disables
+        rate_limit_project_burst: Rating writes a project may take at once after being idle
+        rate_limit_trust_forwarded_for: Identify clients by X-Forwarded-For (behind a proxy only)
+        rate_limit_store: Where bucket state lives: memory, or sqlite to share it between workers
+        rate_limit_sqlite_path: SQLite file holding shared bucket state
+        slow_request_ms: Requests slower than this are logged with their query count
+        health_check_timeout_seconds: Timeout of the /health database probe
+        log_level: Root log level
+        log_format: Text log format, used when log_json is off
+        log_json: Write log records as JSON lines
+        log_queue_size: Records buffered for the log writer thread before new ones are dropped
+        log_access_sample_rate: Fraction of successful requests written to the access log
+        log_sql_sample_rate: Fraction of SQL statements logged; slow ones are always logged
+        slow_query_ms: Statements slower than this are logged as warnings; 0 disables
     """
     # Application Settings
     app_name: str = "RMS - Rating Management System"
@@ -34,22 +116,111 @@ class Settings(BaseSettings):
     # Database Settings
     db_path: Path = Path(__file__).parent.parent / "data" / "rms.db"
     database_url: str = f"sqlite:///{db_path}"
-
+    read_database_urls: List[str] = []
+    db_pool_size: int = 5
+    read_pool_size: int = 10
+    db_max_overflow: int = 10
+    db_pool_recycle: int = 1800
+    db_pool_timeout: float = 30.0
+    db_max_connections: int = 0
+    db_init_on_startup: bool = True
+    workers: int = 1
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    sqlite_cache_size: int = -64000  # Negative values are KiB
     
+    # Ingestion Settings
+    rating_batch_max_rows: int = 50000
+    rating_batch_max_bytes: int = 64 * 1024 * 1024
+
+    # Write-behind Settings
+    write_behind_enabled: bool = False
+    write_behind_max_queue: int = 10000
+    write_behind_flush_interval_ms: int = 50
+    write_behind_flush_max_rows: int = 1000
+    write_behind_enqueue_timeout_ms: int = 100
+
+    # Response Cache Settings
+    response_cache_enabled: bool = True
+    response_cache_max_entries: int = 1024
+    response_cache_ttl_seconds: float = 60.0
+
+    # Live Update Settings
+    live_updates_enabled: bool = True
+    live_max_updates_per_second: float = 2.0
+    live_queue_size: int = 8
+    live_max_subscribers: int = 10000
+    live_heartbeat_seconds: float = 15.0
+
+    # Rollup Settings
+    rollup_enabled: bool = True
+    rollup_interval_seconds: float = 10.0
+    rollup_batch_size: int = 100_000
+    rating_id_settle_seconds: float = 10.0
+    trend_max_points: int = 2000
+    trend_default_days: int = 30
+    sketch_hll_precision: int = 12
+    search_language: str = "english"
+
+    # Analytics Snapshot Settings
+    snapshot_dir: str = "snapshots/ratings"
+    snapshot_batch_size: int = 100_000
+
+    # Similarity Index Settings
+    similarity_refresh_seconds: float = 5.0
+    similarity_warm_on_startup: bool = True
+    similarity_load_chunk_size: int = 50_000
+
     # Security Settings
     secret_key: str = "your-secret-key-here"  # Change in production
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
-    
+    password_schemes: List[str] = ["argon2", "bcrypt", "pbkdf2_sha256"]
+    password_hash_workers: int = 4
+    principal_cache_max_entries: int = 10000
+    principal_cache_ttl_seconds: float = 60.0
     
     # File Upload Settings
     upload_folder: str = "uploads"
-    max_upload_size: int = 10 * 1024 * 1024  # 10MB
+    max_upload_size: int = 1024 * 1024 * 1024  # 1GB
     allowed_file_types: list = ["image/jpeg", "image/png", "video/mp4"]
+    upload_write_buffer_size: int = 1024 * 1024
+    media_read_chunk_size: int = 256 * 1024
+
+    # Media Processing Settings
+    media_worker_enabled: bool = True
+    media_worker_processes: int = 2
+    media_job_timeout_seconds: float = 300.0
+    media_job_max_attempts: int = 3
+    media_job_retry_seconds: float = 30.0
+    media_job_poll_seconds: float = 5.0
+    media_thumbnail_widths: List[int] = [320, 960]
+    media_active_project_days: int = 7
     
+    # Admission Control Settings
+    admission_enabled: bool = True
+    admission_max_in_flight: int = 0
+    admission_max_queue: int = 100
+    admission_queue_timeout_ms: float = 1000.0
+    rate_limit_client_per_second: float = 50.0
+    rate_limit_client_burst: float = 100.0
+    rate_limit_project_per_second: float = 200.0
+    rate_limit_project_burst: float = 400.0
+    rate_limit_trust_forwarded_for: bool = False
+    rate_limit_store: str = "memory"
+    rate_limit_sqlite_path: str = "rate_limits.db"
+
+    # Monitoring Settings
+    slow_request_ms: float = 500.0
+    health_check_timeout_seconds: float = 2.0
+
     # Logging Settings
     log_level: str = "INFO"
     log_format: str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    log_json: bool = True
+    log_queue_size: int = 10000
+    log_access_sample_rate: float = 1.0
+    log_sql_sample_rate: float = 0.0
+    slow_query_ms: float = 100.0
     
     # Define all environment variables that your application needs
     DEBUG: bool = False
@@ -79,11 +250,18 @@ def get_settings() -> Settings:
     return Settings()
 
 def init_logging() -> None:
-    """Initialize logging configuration."""
+    """
+    Initialize logging configuration.
+
+    Records are queued by the caller and written as JSON lines (or with
+    ``log_format``) by a background thread; see log_pipeline.
+    """
     settings = get_settings()
-    logging.basicConfig(
-        level=getattr(logging, settings.log_level),
-        format=settings.log_format
+    log_pipeline.configure(
+        level=settings.log_level,
+        json_format=settings.log_json,
+        text_format=settings.log_format,
+        queue_size=settings.log_queue_size
     )
     logger.info(f"Logging initialized at {settings.log_level} level")
 
@@ -3,14 +3,34 @@ Database configuration and connection management for RMS.
 
 This module handles database connection setup, session management,
 and provides utility functions for database operations.
+
+Engines are created per process on first use. A process forked after
+creating them (for example by a preloading pre-fork server) drops the
+inherited pools without closing the parent's connections and builds its
+own. Pools are sized so all workers together stay within
+``db_max_connections``.
 """
+import itertools
 import logging
-from sqlalchemy import create_engine
+import os
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Connection, Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.exc import SQLAlchemyError
-from contextlib import contextmanager
-from typing import Generator
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncGenerator, Dict, Generator, List, Optional, Tuple
 from config import get_settings
+from log_pipeline import instrument_sql
+from metrics import InstrumentedAsyncQueuePool, InstrumentedQueuePool, instrument_engine
+from models import Base
+# Registers the full-text search index with create_all/drop_all
+import search  # noqa: F401
+
+try:
+    import fcntl
+except ImportError:  # Windows: no inter-process schema lock for SQLite
+    fcntl = None
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -20,19 +40,220 @@ def get_database_url() -> str:
     settings = get_settings()
     return settings.database_url
 
-# Create SQLAlchemy engine
-engine = create_engine(
-    get_database_url(),
-    pool_pre_ping=True,  # Enable connection health checks
-    echo=True  # Log SQL queries (disable in production)
-)
+# Async drivers used in place of the sync DBAPI for each backend
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+def get_async_database_url(url: str = None) -> str:
+    """
+    Get the async variant of a database URL.
+
+    Args:
+        url: Sync database URL, defaults to the configured one
+
+    Returns:
+        str: Same URL with the driver swapped for its asyncio counterpart
+    """
+    url = make_url(url or get_database_url())
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No async driver configured for {url.get_backend_name()}")
+    return url.set(drivername=driver).render_as_string(hide_password=False)
+
+def get_read_database_urls() -> List[str]:
+    """Get read replica URLs, falling back to the primary database."""
+    settings = get_settings()
+    return settings.read_database_urls or [get_database_url()]
+
+def engine_options(
+    url: str,
+    pool_size: int,
+    max_overflow: int,
+    name: str,
+    is_async: bool = False
+) -> Dict[str, Any]:
+    """
+    Build engine keyword arguments for a database URL.
+
+    Args:
+        url: Database URL the engine connects to
+        pool_size: Persistent connections kept by the pool
+        max_overflow: Extra connections the pool may open under load
+        name: Pool name used as the metrics label
+        is_async: Whether the options are for an async engine
+
+    Returns:
+        Dict of create_engine keyword arguments
+    """
+    settings = get_settings()
+    options = {
+        "pool_pre_ping": True,  # Enable connection health checks
+    }
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        # In-memory SQLite uses a single static connection; there is no pool to size
+        return options
+    options.update(
+        # Explicit because aiosqlite would otherwise get an unpooled NullPool
+        poolclass=InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool,
+        pool_logging_name=name,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_recycle=settings.db_pool_recycle,
+        pool_timeout=settings.db_pool_timeout,
+    )
+    return options
+
+def configure_sqlite(sync_engine: Engine, read_only: bool = False) -> None:
+    """
+    Apply connection pragmas to a SQLite engine.
+
+    Writers switch the database to WAL so readers never block them; read
+    pools are additionally marked query_only.
+
+    Args:
+        sync_engine: Engine, or the sync_engine of an async engine
+        read_only: Whether connections only serve reads
+    """
+    if sync_engine.dialect.name != "sqlite":
+        return
+    settings = get_settings()
+
+    @event.listens_for(sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        else:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}")
+        cursor.execute(f"PRAGMA cache_size={int(settings.sqlite_cache_size)}")
+        cursor.close()
+
+def pool_limits(pool_size: int, shares: int = 1) -> Tuple[int, int]:
+    """
+    Size one pool so that every worker's pools fit the server's connection limit.
 
-# Create sessionmaker
-SessionLocal = sessionmaker(
-    autocommit=False,
-    autoflush=False,
-    bind=engine
-)
+    Args:
+        pool_size: Configured persistent connections for the pool
+        shares: Pools in each worker that connect to the same server
+
+    Returns:
+        (pool_size, max_overflow), capped at ``db_max_connections`` divided
+        over ``workers * shares`` pools when a limit is set
+    """
+    settings = get_settings()
+    if settings.db_max_connections <= 0:
+        return pool_size, settings.db_max_overflow
+    budget = max(1, settings.db_max_connections // (max(1, settings.workers) * shares))
+    size = min(pool_size, budget)
+    return size, min(settings.db_max_overflow, budget - size)
+
+def primary_pool_limits() -> Tuple[int, int]:
+    """Pool size and overflow of the primary engine; without replicas reads share its server."""
+    shares = 1 if get_settings().read_database_urls else 2
+    return pool_limits(get_settings().db_pool_size, shares)
+
+def instrument(sync_engine: Engine, name: str) -> None:
+    """Attach metrics and slow/sampled statement logging to an engine."""
+    settings = get_settings()
+    instrument_engine(sync_engine, name)
+    instrument_sql(sync_engine, name, settings.slow_query_ms, settings.log_sql_sample_rate)
+
+def _create_read_engine(url: str, name: str, limits: Tuple[int, int]):
+    """Create an async engine whose connections only serve reads."""
+    read_engine = create_async_engine(
+        get_async_database_url(url),
+        **engine_options(url, *limits, name, is_async=True)
+    )
+    configure_sqlite(read_engine.sync_engine, read_only=True)
+    instrument(read_engine.sync_engine, name)
+    if read_engine.dialect.name == "postgresql":
+        read_engine = read_engine.execution_options(postgresql_readonly=True)
+    return read_engine
+
+class Engines:
+    """
+    The engines and session factories of one process.
+
+    Created on first use rather than at import, so a server that forks
+    workers after importing the app never shares pooled connections.
+    """
+
+    def __init__(self):
+        settings = get_settings()
+        url = get_database_url()
+        primary = primary_pool_limits()
+        # Sync engine for schema setup and command line tools
+        self.engine = create_engine(url, **engine_options(url, *primary, "sync"))
+        configure_sqlite(self.engine)
+        instrument(self.engine, "sync")
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+
+        # Async engine used by the API routes so queries don't block the event loop
+        self.async_engine = create_async_engine(
+            get_async_database_url(), **engine_options(url, *primary, "primary", is_async=True)
+        )
+        configure_sqlite(self.async_engine.sync_engine)
+        instrument(self.async_engine.sync_engine, "primary")
+        # Objects stay usable after commit; there is no lazy loading on AsyncSession
+        self.AsyncSessionLocal = async_sessionmaker(
+            bind=self.async_engine, autoflush=False, expire_on_commit=False
+        )
+
+        # Read-only engines, one per replica; GET routes are spread across them
+        read_shares = 1 if settings.read_database_urls else 2
+        read_limits = pool_limits(settings.read_pool_size, read_shares)
+        self.read_engines = [
+            _create_read_engine(read_url, f"read-{index}", read_limits)
+            for index, read_url in enumerate(get_read_database_urls())
+        ]
+        self.ReadSessionLocals = [
+            async_sessionmaker(bind=read_engine, autoflush=False, expire_on_commit=False)
+            for read_engine in self.read_engines
+        ]
+        self.read_session_cycle = itertools.cycle(self.ReadSessionLocals)
+        self.pid = os.getpid()
+
+    def sync_engines(self) -> List[Engine]:
+        """Every engine of this set, as sync engines."""
+        return [self.engine, self.async_engine.sync_engine] + [e.sync_engine for e in self.read_engines]
+
+_engines: Optional[Engines] = None
+# Engines inherited over fork; kept referenced so their connections are never closed from the child
+_inherited_engines: List[Engines] = []
+
+def get_engines() -> Engines:
+    """Return this process's engines, creating them on first use."""
+    global _engines
+    if _engines is None or _engines.pid != os.getpid():
+        _engines = Engines()
+    return _engines
+
+def _after_fork_in_child() -> None:
+    """Drop pools inherited from the parent without closing the parent's connections."""
+    global _engines
+    if _engines is None:
+        return
+    for sync_engine in _engines.sync_engines():
+        sync_engine.dispose(close=False)
+    _inherited_engines.append(_engines)
+    _engines = None
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+# Module attributes kept for callers that used the import-time engines
+_ENGINE_ATTRIBUTES = {"engine", "SessionLocal", "async_engine", "AsyncSessionLocal", "read_engines", "ReadSessionLocals"}
+
+def __getattr__(name: str) -> Any:
+    """Resolve the engine attributes lazily on this process's engines."""
+    if name in _ENGINE_ATTRIBUTES:
+        return getattr(get_engines(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 @contextmanager
 def get_db() -> Generator[Session, None, None]:
@@ -46,7 +267,7 @@ def get_db() -> Generator[Session, None, None]:
         with get_db() as db:
             db.query(User).all()
     """
-    db = SessionLocal()
+    db = get_engines().SessionLocal()
     try:
         logger.debug("Creating database session")
         yield db
@@ -61,15 +282,115 @@ def get_db() -> Generator[Session, None, None]:
         logger.debug("Closing database session")
         db.close()
 
+@asynccontextmanager
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Async context manager for database sessions.
+
+    Yields:
+        AsyncSession: SQLAlchemy async database session
+
+    Example:
+        async with get_async_db() as db:
+            await db.execute(select(User))
+    """
+    db = get_engines().AsyncSessionLocal()
+    try:
+        logger.debug("Creating async database session")
+        yield db
+        await db.commit()
+        logger.debug("Committing async database session")
+    except SQLAlchemyError as e:
+        logger.error(f"Database error occurred: {str(e)}")
+        await db.rollback()
+        logger.debug("Rolling back async database session")
+        raise
+    finally:
+        logger.debug("Closing async database session")
+        await db.close()
+
+def ensure_indexes(bind=None) -> None:
+    """
+    Create declared indexes that are missing from existing tables.
+
+    create_all only builds indexes together with new tables, so databases
+    created before an index was declared pick it up here.
+
+    Args:
+        bind: Engine or connection to migrate, defaults to the primary engine
+    """
+    bind = bind if bind is not None else get_engines().engine
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+
+async def dispose_engines() -> None:
+    """Close pooled connections of every engine of this process."""
+    if _engines is None or _engines.pid != os.getpid():
+        return
+    await _engines.async_engine.dispose()
+    for read_engine in _engines.read_engines:
+        await read_engine.dispose()
+    _engines.engine.dispose()
+    logger.info("Disposed database engines")
+
+# Arbitrary application-wide key of the PostgreSQL schema advisory lock
+SCHEMA_LOCK_KEY = 0x524D5301
+
+@contextmanager
+def schema_lock(connection: Connection) -> Generator[None, None, None]:
+    """
+    Hold an inter-process lock while the schema is created or migrated.
+
+    PostgreSQL uses a session advisory lock on the given connection;
+    file-backed SQLite uses an exclusive lock on a file next to the
+    database. Processes starting together take turns instead of racing
+    on CREATE TABLE.
+
+    Args:
+        connection: Connection the schema work runs on
+    """
+    dialect_name = connection.dialect.name
+    if dialect_name == "postgresql":
+        connection.exec_driver_sql(f"SELECT pg_advisory_lock({SCHEMA_LOCK_KEY})")
+        try:
+            yield
+        finally:
+            connection.exec_driver_sql(f"SELECT pg_advisory_unlock({SCHEMA_LOCK_KEY})")
+        return
+    database = connection.engine.url.database
+    if dialect_name != "sqlite" or database in (None, "", ":memory:") or fcntl is None:
+        yield
+        return
+    with open(f"{database}.schema-lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
 def init_db() -> None:
-    """Initialize database tables."""
-    from models import Base
+    """
+    Initialize database tables, one process at a time.
+
+    Runs once in the serve launcher before workers start; workers it
+    launches skip it (``db_init_on_startup``). Independently started
+    processes serialize on schema_lock.
+    """
+    engine = get_engines().engine
     try:
-        Base.metadata.create_all(bind=engine)
+        with engine.connect() as connection:
+            with schema_lock(connection):
+                Base.metadata.create_all(bind=connection)
+                ensure_indexes(connection)
+                connection.commit()
         logger.info("Successfully initialized database tables")
     except SQLAlchemyError as e:
         logger.error(f"Failed to initialize database: {str(e)}")
         raise
+    finally:
+        # Schema work is done; serving uses the async engines
+        engine.dispose()
 
 def get_db_session() -> Generator[Session, None, None]:
     """
@@ -85,3 +406,40 @@ def get_db_session() -> Generator[Session, None, None]:
     """
     with get_db() as session:
         yield session
+
+async def get_async_db_session() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Async dependency for FastAPI endpoints that need database access.
+
+    Yields:
+        AsyncSession: SQLAlchemy async database session
+
+    Example:
+        @app.get("/users")
+        async def get_users(db: AsyncSession = Depends(get_async_db_session)):
+            result = await db.execute(select(User))
+            return result.scalars().all()
+    """
+    async with get_async_db() as session:
+        yield session
+
+# Writes go to the primary engine
+get_write_session = get_async_db_session
+
+def new_read_session() -> AsyncSession:
+    """Create a session on the next read engine, for work outside a request."""
+    return next(get_engines().read_session_cycle)()
+
+async def get_read_session() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Dependency for read-only endpoints.
+
+    Sessions come from the read engines in round-robin order, so heavy
+    listings don't hold connections the write pool needs. With replicas,
+    reads may lag the primary by the replication delay.
+
+    Yields:
+        AsyncSession: Session bound to a read-only engine
+    """
+    async with new_read_session() as session:
+        yield session
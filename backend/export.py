@@ -0,0 +1,105 @@
+"""
+Streaming rating export for RMS.
+
+Ratings are read through a server-side cursor in fixed-size partitions
+and encoded as NDJSON or CSV one partition at a time, so memory use stays
+flat regardless of export size. Rows are ordered by id; a client that
+loses its connection resumes with ``after_id`` set to the last id it saw.
+"""
+import csv
+import io
+from datetime import datetime
+from typing import AsyncIterator, Optional, Sequence
+
+import orjson
+from sqlalchemy import Row, Select, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+
+# Rows fetched from the server-side cursor per partition
+EXPORT_PARTITION_SIZE = 1000
+
+EXPORT_COLUMNS = (
+    models.Rating.id,
+    models.Rating.user_id,
+    models.Rating.project_id,
+    models.Rating.content_item_id,
+    models.Rating.rasa,
+    models.Rating.rating_value,
+    models.Rating.feedback,
+    models.Rating.created_at,
+)
+
+EXPORT_FIELDS = [column.key for column in EXPORT_COLUMNS]
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+def build_export_query(
+    project_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    after_id: Optional[int] = None
+) -> Select:
+    """
+    Build the export query.
+
+    Args:
+        project_id: Only export ratings for this project
+        since: Only export ratings created at or after this time
+        after_id: Resume after this rating id
+
+    Returns:
+        Select over the export columns ordered by id
+    """
+    query = select(*EXPORT_COLUMNS)
+    if project_id is not None:
+        query = query.where(models.Rating.project_id == project_id)
+    if since is not None:
+        query = query.where(models.Rating.created_at >= since)
+    if after_id is not None:
+        query = query.where(models.Rating.id > after_id)
+    return query.order_by(models.Rating.id)
+
+def _plain(row: Row) -> list:
+    """Convert a result row to JSON/CSV friendly values."""
+    values = list(row)
+    values[4] = row.rasa.value if row.rasa is not None else None
+    values[7] = row.created_at.isoformat() if row.created_at is not None else None
+    return values
+
+def encode_ndjson(rows: Sequence[Row]) -> bytes:
+    """Encode a partition of rows as NDJSON lines."""
+    return b"".join(orjson.dumps(row._asdict(), option=orjson.OPT_APPEND_NEWLINE) for row in rows)
+
+def encode_csv(rows: Sequence[Row], header: bool = False) -> bytes:
+    """Encode a partition of rows as CSV, optionally preceded by the header."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_FIELDS)
+    writer.writerows(_plain(row) for row in rows)
+    return buffer.getvalue().encode("utf-8")
+
+async def stream_export(db: AsyncSession, query: Select, export_format: str) -> AsyncIterator[bytes]:
+    """
+    Stream an export query as encoded chunks.
+
+    Args:
+        db: Database session, kept open until the stream finishes
+        query: Query built by build_export_query
+        export_format: ``ndjson`` or ``csv``
+
+    Yields:
+        bytes: One encoded chunk per partition
+    """
+    if export_format == "csv":
+        yield encode_csv([], header=True)
+    result = await db.stream(query.execution_options(yield_per=EXPORT_PARTITION_SIZE))
+    async for partition in result.partitions():
+        if export_format == "csv":
+            yield encode_csv(partition)
+        else:
+            yield encode_ndjson(partition)
@@ -0,0 +1,262 @@
+"""
+Live Navarasa distribution updates for RMS.
+
+Rating writes mark their projects as changed; that is the only work done
+per rating. A single publisher task wakes at most
+``max_updates_per_second`` times a second, recomputes the rasa summary of
+each changed project that has subscribers (one aggregate query per
+project, not per rating) and encodes it once as an SSE frame and a
+WebSocket message.
+
+Each project topic keeps the last ``queue_size`` frames in a shared ring.
+A subscriber holds only its position in that ring, which behaves like a
+bounded per-subscriber queue: a consumer that falls more than
+``queue_size`` frames behind loses the oldest ones and continues from the
+earliest frame still buffered. Publishing wakes all waiters through one
+event, so its cost does not depend on how far behind anyone is.
+
+State is per process; with several workers each serves its own
+subscribers and sees only the ratings written through it.
+"""
+import asyncio
+import logging
+from collections import deque
+from contextlib import suppress
+from dataclasses import dataclass
+from typing import AsyncContextManager, AsyncIterator, Callable, Deque, Dict, Optional, Set
+
+import orjson
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import aggregates
+import metrics
+import models
+from config import get_settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Event name used for distribution updates in both transports
+SUMMARY_EVENT = "rasa-summary"
+
+# Keep-alives sent when a subscriber has been idle for the heartbeat interval
+SSE_HEARTBEAT = b": keep-alive\n\n"
+WS_HEARTBEAT = '{"type":"heartbeat"}'
+
+class SubscriberLimitError(Exception):
+    """Raised when a process already serves the maximum number of subscribers."""
+
+@dataclass(frozen=True)
+class Frame:
+    """One published update, pre-encoded for each transport."""
+    version: int
+    sse: bytes
+    message: str
+
+def encode_frame(version: int, summary: dict) -> Frame:
+    """Encode a rasa summary for SSE and WebSocket delivery."""
+    data = orjson.dumps(summary)
+    message = orjson.dumps({"type": SUMMARY_EVENT, "version": version, "data": summary}).decode()
+    sse = b"event: %s\nid: %d\ndata: %s\n\n" % (SUMMARY_EVENT.encode(), version, data)
+    return Frame(version=version, sse=sse, message=message)
+
+class Topic:
+    """
+    Recent frames of one project and the subscribers waiting for them.
+
+    Args:
+        queue_size: Frames kept for subscribers that are behind
+    """
+
+    def __init__(self, queue_size: int):
+        self.frames: Deque[Frame] = deque(maxlen=queue_size)
+        self.version = 0
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+
+    def publish(self, summary: dict) -> None:
+        """Append a frame and wake every waiting subscriber."""
+        self.version += 1
+        self.frames.append(encode_frame(self.version, summary))
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait for the next publish; returns False on timeout."""
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+class LiveHub:
+    """
+    In-process pub/sub of rasa summaries with coalesced publishing.
+
+    Args:
+        session_factory: Callable returning an async session context manager
+        max_updates_per_second: Upper bound on publishes per project per second
+        queue_size: Frames buffered per subscriber before the oldest are dropped
+        max_subscribers: Maximum concurrent subscribers
+        heartbeat_seconds: Idle time after which subscribers get a keep-alive
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncContextManager[AsyncSession]],
+        max_updates_per_second: float = 2.0,
+        queue_size: int = 8,
+        max_subscribers: int = 10000,
+        heartbeat_seconds: float = 15.0
+    ):
+        self.session_factory = session_factory
+        self.interval = 1 / max_updates_per_second
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.heartbeat_seconds = heartbeat_seconds
+        self._topics: Dict[int, Topic] = {}
+        self._dirty: Set[int] = set()
+        self._subscribers = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def subscribers(self) -> int:
+        """Number of open subscriptions."""
+        return self._subscribers
+
+    def notify(self, *project_ids: int) -> None:
+        """Mark projects as changed; constant cost regardless of subscribers."""
+        self._dirty.update(project_id for project_id in project_ids if project_id in self._topics)
+
+    async def project_exists(self, project_id: int) -> bool:
+        """Check that a project exists with a short-lived session."""
+        async with self.session_factory() as db:
+            return await db.get(models.Project, project_id) is not None
+
+    def subscribe(self, project_id: int) -> AsyncIterator[Optional[Frame]]:
+        """
+        Follow a project's updates until the consumer stops iterating.
+
+        The latest known frame is delivered first. ``None`` is yielded
+        after ``heartbeat_seconds`` without updates, so transports can
+        send a keep-alive and notice closed connections.
+
+        Args:
+            project_id: Project to follow
+
+        Returns:
+            Async iterator of frames in publish order, or None as a heartbeat
+
+        Raises:
+            SubscriberLimitError: If the subscriber limit is reached
+        """
+        if self._subscribers >= self.max_subscribers:
+            raise SubscriberLimitError("Too many live subscribers")
+        return self._follow(project_id)
+
+    async def _follow(self, project_id: int) -> AsyncIterator[Optional[Frame]]:
+        """Register a subscriber and yield its frames; see subscribe()."""
+        topic = self._topics.get(project_id)
+        if topic is None:
+            topic = self._topics[project_id] = Topic(self.queue_size)
+        if not topic.frames:
+            self._dirty.add(project_id)
+        topic.subscribers += 1
+        self._subscribers += 1
+        metrics.LIVE_SUBSCRIBERS.inc()
+        self._ensure_running()
+        last_seen = topic.frames[-1].version - 1 if topic.frames else 0
+        try:
+            while True:
+                pending = [frame for frame in topic.frames if frame.version > last_seen]
+                if not pending:
+                    if not await topic.wait(self.heartbeat_seconds):
+                        yield None
+                    continue
+                dropped = pending[0].version - last_seen - 1
+                if dropped > 0:
+                    metrics.LIVE_DROPPED.inc(dropped)
+                for frame in pending:
+                    last_seen = frame.version
+                    yield frame
+        finally:
+            topic.subscribers -= 1
+            self._subscribers -= 1
+            metrics.LIVE_SUBSCRIBERS.dec()
+            if topic.subscribers == 0:
+                del self._topics[project_id]
+                self._dirty.discard(project_id)
+
+    def _ensure_running(self) -> None:
+        """Start the publisher on the running loop if it is not running there."""
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._run())
+
+    async def _run(self) -> None:
+        """Publish changed projects at most once per interval while anyone listens."""
+        while self._topics:
+            if self._dirty:
+                dirty, self._dirty = self._dirty, set()
+                try:
+                    await self._publish(dirty)
+                except Exception as e:
+                    logger.error(f"Live update publish failed: {e}", exc_info=True)
+                    self._dirty |= dirty
+            await asyncio.sleep(self.interval)
+        self._task = None
+
+    async def _publish(self, project_ids: Set[int]) -> None:
+        """Recompute and publish the summaries of the given projects."""
+        async with self.session_factory() as db:
+            for project_id in project_ids:
+                topic = self._topics.get(project_id)
+                if topic is None:
+                    continue
+                project = await db.get(models.Project, project_id)
+                if project is None:
+                    continue
+                topic.publish(await aggregates.get_project_summary(db, project))
+                metrics.LIVE_PUBLISHES.inc()
+
+    async def stop(self) -> None:
+        """Stop the publisher task."""
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+# Process-wide hub, created on startup when live updates are enabled
+live_hub: Optional[LiveHub] = None
+
+def start_live_hub() -> None:
+    """Create the process-wide hub if enabled in settings."""
+    global live_hub
+    settings = get_settings()
+    if not settings.live_updates_enabled:
+        return
+    from database import new_read_session
+
+    live_hub = LiveHub(
+        new_read_session,
+        max_updates_per_second=settings.live_max_updates_per_second,
+        queue_size=settings.live_queue_size,
+        max_subscribers=settings.live_max_subscribers,
+        heartbeat_seconds=settings.live_heartbeat_seconds,
+    )
+
+async def stop_live_hub() -> None:
+    """Stop the process-wide hub if it exists."""
+    if live_hub is not None:
+        await live_hub.stop()
+
+async def sse_events(updates: AsyncIterator[Optional[Frame]]) -> AsyncIterator[bytes]:
+    """Render a subscription as an SSE byte stream."""
+    async for frame in updates:
+        yield frame.sse if frame is not None else SSE_HEARTBEAT
+
+def notify_ratings(*project_ids: int) -> None:
+    """Tell the process-wide hub, if any, that these projects got ratings."""
+    if live_hub is not None:
+        live_hub.notify(*project_ids)
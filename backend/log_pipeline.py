@@ -0,0 +1,216 @@
+"""
+Non-blocking structured logging for RMS.
+
+Log calls never touch a stream. ``configure`` installs a single
+QueueHandler on the root logger; records are put on a bounded queue by
+the calling code and formatted and written by a QueueListener thread. When
+the queue is full the record is dropped and counted rather than blocking
+the request.
+
+Every record carries the id of the request it was logged under, set by
+the HTTP middleware through ``request_id_var``. Output is one JSON object
+per line, or the classic text format when JSON is turned off.
+
+Access and SQL statement logs are sampled at configurable rates, and the
+decision is taken before a record is built, so unsampled requests cost a
+random number. Statements slower than the slow-query threshold are always
+logged, replacing SQLAlchemy's blanket ``echo``.
+"""
+import atexit
+import logging
+import queue
+import random
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+import orjson
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import metrics
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Loggers for sampled access and SQL records
+access_logger = logging.getLogger("rms.access")
+sql_logger = logging.getLogger("rms.sql")
+
+# Statements longer than this are cut in SQL log records
+MAX_STATEMENT_LENGTH = 2000
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "request_id"}
+
+_base_factory = logging.getLogRecordFactory()
+_listener: Optional[QueueListener] = None
+
+def _record_factory(*args, **kwargs) -> logging.LogRecord:
+    """Create a record stamped with the current request id."""
+    record = _base_factory(*args, **kwargs)
+    record.request_id = request_id_var.get()
+    return record
+
+def sampled(rate: float) -> bool:
+    """Decide whether to log an event sampled at ``rate`` (0 to 1)."""
+    return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON objects, including ``extra`` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        """Render one record."""
+        document = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id is not None:
+            document["request_id"] = request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                document[key] = value
+        if record.exc_info:
+            document["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            document["exc"] = record.exc_text
+        return orjson.dumps(document, default=str).decode()
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Pass the record through mostly untouched; formatting happens on the listener.
+
+        The message is merged with its arguments here, so later changes
+        to mutable arguments do not alter what is logged.
+        """
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """Queue a record, counting it as dropped when the queue is full."""
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.LOG_RECORDS_DROPPED.inc()
+
+def configure(level: str, json_format: bool, text_format: str, queue_size: int) -> None:
+    """
+    Route all logging through a background writer thread.
+
+    Replaces the root logger's handlers; calling it again restarts the
+    pipeline with the new options.
+
+    Args:
+        level: Root log level name
+        json_format: Write JSON lines instead of ``text_format``
+        text_format: logging format string used when JSON is off
+        queue_size: Records buffered before new ones are dropped
+    """
+    global _listener
+    shutdown()
+    stream = logging.StreamHandler()
+    stream.setFormatter(JsonFormatter() if json_format else logging.Formatter(text_format))
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=queue_size)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DroppingQueueHandler(log_queue))
+    root.setLevel(getattr(logging, level))
+    logging.setLogRecordFactory(_record_factory)
+    _listener = QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+
+def shutdown() -> None:
+    """Write out queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+atexit.register(shutdown)
+
+def log_access(
+    method: str,
+    path: str,
+    status_code: int,
+    duration: float,
+    query_count: int,
+    sample_rate: float
+) -> None:
+    """
+    Log one served request, sampled unless it failed.
+
+    Args:
+        method: HTTP method
+        path: Request path
+        status_code: Response status
+        duration: Seconds spent serving the request
+        query_count: Database statements issued
+        sample_rate: Fraction of successful requests logged
+    """
+    if status_code < 500 and not sampled(sample_rate):
+        return
+    access_logger.info(
+        "%s %s %s", method, path, status_code,
+        extra={
+            "method": method,
+            "path": path,
+            "status": status_code,
+            "duration_ms": round(duration * 1000, 3),
+            "queries": query_count,
+        }
+    )
+
+def instrument_sql(sync_engine: Engine, name: str, slow_query_ms: float, sample_rate: float) -> None:
+    """
+    Log slow statements, and a sample of all statements, for an engine.
+
+    Args:
+        sync_engine: Engine, or the sync_engine of an async engine
+        name: Engine label included in records
+        slow_query_ms: Statements at least this slow are logged as warnings; 0 disables
+        sample_rate: Fraction of other statements logged at INFO
+    """
+    if slow_query_ms <= 0 and sample_rate <= 0:
+        return
+    slow_seconds = slow_query_ms / 1000 if slow_query_ms > 0 else float("inf")
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("log_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["log_query_start"].pop()
+        if elapsed >= slow_seconds:
+            log = sql_logger.warning
+            message = "Slow query"
+        elif sampled(sample_rate):
+            log = sql_logger.info
+            message = "Query"
+        else:
+            return
+        log(message, extra={
+            "engine": name,
+            "duration_ms": round(elapsed * 1000, 3),
+            "statement": statement[:MAX_STATEMENT_LENGTH],
+            "executemany": executemany,
+        })
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(context):
+        starts = context.connection.info.get("log_query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
@@ -4,18 +4,35 @@ Main FastAPI application module for RMS (Rating Management System).
 This module initializes the FastAPI application, sets up middleware,
 configures logging, and includes all API routers.
 """
-from fastapi import FastAPI, Request
+from fastapi import Depends, FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse
 from fastapi.openapi.docs import get_swagger_ui_html
+import asyncio
 import logging
+import re
 import time
+import uuid
 from typing import Callable
 from datetime import datetime
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
 
+import log_pipeline
+import metrics
+from admission import AdmissionMiddleware
+from auth import shutdown_password_pool
 from config import get_settings, init_logging
-from database import init_db
-from routers import projects_router, ratings_router, users_router
+from database import dispose_engines, get_write_session, init_db
+from live import start_live_hub, stop_live_hub
+from media_jobs import start_media_worker, stop_media_worker
+from rollups import start_rollup_scheduler, stop_rollup_scheduler
+from similarity import start_similarity_index, stop_similarity_index
+from write_buffer import start_rating_buffer, stop_rating_buffer
+from routers import (
+    content_items_router, media_jobs_router, media_router, projects_router, ratings_router, search_router,
+    uploads_router, users_router
+)
 
 # Initialize logging
 init_logging()
@@ -33,6 +50,7 @@ app = FastAPI(
     - Content analysis with philosophical perspectives
     """,
     version="1.0.0",
+    default_response_class=ORJSONResponse,
     docs_url=None,  # Disable default docs
     redoc_url=None  # Disable default redoc
 )
@@ -40,6 +58,12 @@ app = FastAPI(
 # Get settings
 settings = get_settings()
 
+# Client-supplied request ids are kept only when short and plain
+REQUEST_ID = re.compile(r"[\w.-]{1,64}")
+
+# Admission control sits inside CORS so rejections still carry CORS headers
+app.add_middleware(AdmissionMiddleware)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -49,19 +73,43 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Custom middleware for logging
+# Custom middleware for logging and metrics
 @app.middleware("http")
 async def log_requests(request: Request, call_next: Callable):
-    """Log all HTTP requests with timing information."""
-    start_time = time.time()
-    response = await call_next(request)
-    duration = time.time() - start_time
-    
-    logger.info(
-        f"Method: {request.method} Path: {request.url.path} "
-        f"Status: {response.status_code} Duration: {duration:.2f}s"
-    )
-    
+    """Tag the request with an id, record latency and query metrics and write the access log."""
+    request_id = request.headers.get("x-request-id", "")
+    if not REQUEST_ID.fullmatch(request_id):
+        request_id = uuid.uuid4().hex
+    id_token = log_pipeline.request_id_var.set(request_id)
+    stats = metrics.RequestStats()
+    token = metrics.current_request_stats.set(stats)
+    metrics.REQUESTS_IN_FLIGHT.inc(method=request.method)
+    start_time = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        duration = time.perf_counter() - start_time
+        metrics.REQUESTS_IN_FLIGHT.dec(method=request.method)
+        metrics.current_request_stats.reset(token)
+        # Label by route template so ids in paths don't explode cardinality
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        metrics.REQUEST_LATENCY.observe(duration, method=request.method, route=path, status=str(status_code))
+        metrics.REQUEST_QUERIES.observe(stats.query_count, method=request.method, route=path)
+
+        log_pipeline.log_access(
+            request.method, request.url.path, status_code, duration, stats.query_count,
+            settings.log_access_sample_rate
+        )
+        if duration * 1000 >= settings.slow_request_ms:
+            logger.warning(
+                f"Slow request: {request.method} {request.url.path} took {duration * 1000:.1f}ms "
+                f"with {stats.query_count} queries ({stats.query_time * 1000:.1f}ms in database)"
+            )
+        log_pipeline.request_id_var.reset(id_token)
+    response.headers["X-Request-ID"] = request_id
     return response
 
 # Error handling
@@ -91,14 +139,25 @@ async def custom_swagger_ui_html():
 app.include_router(projects_router, prefix="/api/v1")
 app.include_router(ratings_router, prefix="/api/v1")
 app.include_router(users_router, prefix="/api/v1")
+app.include_router(search_router, prefix="/api/v1")
+app.include_router(uploads_router, prefix="/api/v1")
+app.include_router(media_router, prefix="/api/v1")
+app.include_router(media_jobs_router, prefix="/api/v1")
+app.include_router(content_items_router, prefix="/api/v1")
 
 @app.on_event("startup")
 async def startup_event():
     """Execute actions on application startup."""
     logger.info("Starting up RMS API")
     try:
-        init_db()
-        logger.info("Database initialized successfully")
+        if settings.db_init_on_startup:
+            init_db()
+            logger.info("Database initialized successfully")
+        start_rating_buffer()
+        start_live_hub()
+        start_rollup_scheduler()
+        start_media_worker()
+        start_similarity_index()
     except Exception as e:
         logger.error(f"Failed to initialize database: {e}", exc_info=True)
         raise
@@ -107,11 +166,17 @@ async def startup_event():
 async def shutdown_event():
     """Execute actions on application shutdown."""
     logger.info("Shutting down RMS API")
+    await stop_rating_buffer()
+    await stop_live_hub()
+    await stop_rollup_scheduler()
+    await stop_media_worker()
+    await stop_similarity_index()
+    shutdown_password_pool()
+    await dispose_engines()
 
 @app.get("/")
 async def root():
     """Root endpoint to verify API status."""
-    logger.info("Root endpoint accessed")
     return {
         "status": "active",
         "message": "Welcome to RMS API",
@@ -120,15 +185,34 @@ async def root():
     }
 
 @app.get("/health")
-async def health_check():
-    """Health check endpoint for monitoring."""
-    logger.info("Health check endpoint accessed")
-    return {
-        "status": "healthy",
-        "timestamp": datetime.utcnow().isoformat(),
-        "services": {
-            "api": "up",
-            "database": "up"  # This will be implemented with actual DB health check
+async def health_check(db: AsyncSession = Depends(get_write_session)):
+    """Health check endpoint for monitoring, including a timed database probe."""
+    start_time = time.perf_counter()
+    try:
+        await asyncio.wait_for(db.execute(text("SELECT 1")), settings.health_check_timeout_seconds)
+        database_status = "up"
+    except Exception as e:
+        logger.error(f"Database health probe failed: {e}")
+        await db.rollback()
+        database_status = "down"
+    latency_ms = (time.perf_counter() - start_time) * 1000
+
+    healthy = database_status == "up"
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if healthy else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={
+            "status": "healthy" if healthy else "unhealthy",
+            "timestamp": datetime.utcnow().isoformat(),
+            "services": {
+                "api": "up",
+                "database": database_status
+            },
+            "database_latency_ms": round(latency_ms, 3)
         }
-    }
+    )
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Expose metrics in the Prometheus text format."""
+    return PlainTextResponse(metrics.render_metrics(), media_type="text/plain; version=0.0.4")
 
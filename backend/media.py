@@ -0,0 +1,438 @@
+"""
+Resumable media uploads and content-addressed storage for RMS.
+
+Uploads are written to ``<upload_folder>/partial/<upload id>`` as the
+request body streams in, in bounded buffers, with SHA-256 computed
+incrementally. The size of the partial file is the upload's offset: a
+client that loses its connection asks for the offset and continues from
+there. When the last byte arrives the file is moved to
+``<upload_folder>/media/<ab>/<cd>/<sha256>``; identical media uploaded
+twice is stored once.
+
+Size and type limits are enforced while streaming: a body may not run
+past the declared size, and the leading bytes must match the declared
+content type's signature before more than ``SNIFF_BYTES`` are accepted.
+
+Downloads honour single byte ranges. Servers offering the ASGI
+``http.response.zerocopysend`` extension send the file with sendfile;
+others get it in ``media_read_chunk_size`` reads off the event loop.
+"""
+import hashlib
+import logging
+import os
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, Iterable, Mapping, Optional, Set, Tuple
+
+import anyio
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from config import get_settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Leading bytes checked against the declared content type
+SNIFF_BYTES = 12
+
+SIGNATURES: Dict[str, Callable[[bytes], bool]] = {
+    "image/jpeg": lambda head: head.startswith(b"\xff\xd8\xff"),
+    "image/png": lambda head: head.startswith(b"\x89PNG\r\n\x1a\n"),
+    "image/gif": lambda head: head[:6] in (b"GIF87a", b"GIF89a"),
+    "image/webp": lambda head: head[:4] == b"RIFF" and head[8:12] == b"WEBP",
+    "video/mp4": lambda head: head[4:8] == b"ftyp",
+    "video/webm": lambda head: head.startswith(b"\x1a\x45\xdf\xa3"),
+}
+
+class UploadError(Exception):
+    """Base class of upload failures; ``status_code`` is the HTTP status to report."""
+    status_code = 400
+
+class UploadBusyError(UploadError):
+    """Raised when another request is already appending to the upload."""
+    status_code = 409
+
+class UploadTooLargeError(UploadError):
+    """Raised when an upload exceeds its declared or the configured size."""
+    status_code = 413
+
+class UnsupportedMediaError(UploadError):
+    """Raised when a content type is not allowed or the bytes do not match it."""
+    status_code = 415
+
+class RangeNotSatisfiableError(Exception):
+    """Raised when a Range header selects no bytes of the file."""
+
+def media_url(sha256: str) -> str:
+    """API path that serves a stored blob."""
+    return f"/api/v1/media/{sha256}"
+
+def thumbnail_url(sha256: str, width: int) -> str:
+    """API path that serves a blob's thumbnail."""
+    return f"{media_url(sha256)}/thumbnails/{width}"
+
+class MediaStore:
+    """
+    Partial uploads and content-addressed blobs under one directory.
+
+    Args:
+        root: Storage directory
+        max_size: Largest accepted upload in bytes
+        allowed_types: Accepted content types
+        write_buffer_size: Bytes collected before each disk write
+        read_chunk_size: Bytes per read when serving without sendfile
+    """
+
+    def __init__(
+        self,
+        root: str,
+        max_size: int,
+        allowed_types: Iterable[str],
+        write_buffer_size: int = 1 << 20,
+        read_chunk_size: int = 256 << 10
+    ):
+        self.root = Path(root)
+        self.max_size = max_size
+        self.allowed_types = set(allowed_types)
+        self.write_buffer_size = write_buffer_size
+        self.read_chunk_size = read_chunk_size
+        # Hash state of recently appended uploads, keyed by id, with the offset it covers
+        self._hashers: Dict[str, Tuple[int, "hashlib._Hash"]] = {}
+        self._active: Set[str] = set()
+
+    def part_path(self, upload_id: str) -> Path:
+        """Path of an upload's partial file."""
+        return self.root / "partial" / upload_id
+
+    def blob_path(self, sha256: str) -> Path:
+        """Content-addressed path of a finished blob."""
+        return self.root / "media" / sha256[:2] / sha256[2:4] / sha256
+
+    def thumbnail_path(self, sha256: str, width: int) -> Path:
+        """Path of a blob's JPEG thumbnail at a requested width."""
+        return self.root / "thumbnails" / sha256[:2] / sha256[2:4] / f"{sha256}_{width}.jpg"
+
+    def check_upload(self, content_type: str, size: int) -> None:
+        """
+        Validate a declared upload before any bytes are accepted.
+
+        Raises:
+            UnsupportedMediaError: If the content type is not allowed
+            UploadTooLargeError: If the size exceeds ``max_size``
+        """
+        if content_type not in self.allowed_types:
+            raise UnsupportedMediaError(f"Content type {content_type} is not allowed")
+        if size > self.max_size:
+            raise UploadTooLargeError(f"Upload of {size} bytes exceeds the limit of {self.max_size}")
+
+    def received(self, upload_id: str) -> int:
+        """Bytes received so far for an upload."""
+        try:
+            return self.part_path(upload_id).stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def _rehash(self, upload_id: str, offset: int) -> "hashlib._Hash":
+        """Hash the first ``offset`` bytes of a partial file, e.g. after a restart."""
+        hasher = hashlib.sha256()
+        remaining = offset
+        if not remaining:
+            return hasher
+        with open(self.part_path(upload_id), "rb") as part:
+            while remaining:
+                data = part.read(min(self.write_buffer_size, remaining))
+                if not data:
+                    break
+                hasher.update(data)
+                remaining -= len(data)
+        return hasher
+
+    def _head(self, upload_id: str, offset: int) -> bytes:
+        """Leading bytes already received, up to ``SNIFF_BYTES``."""
+        if offset == 0:
+            return b""
+        with open(self.part_path(upload_id), "rb") as part:
+            return part.read(min(offset, SNIFF_BYTES))
+
+    @staticmethod
+    def check_signature(content_type: str, head: bytes) -> None:
+        """
+        Compare leading bytes with the declared content type's signature.
+
+        Raises:
+            UnsupportedMediaError: If the bytes do not match
+        """
+        signature = SIGNATURES.get(content_type)
+        if signature is not None and not signature(head):
+            raise UnsupportedMediaError(f"Uploaded bytes are not {content_type}")
+
+    async def append(
+        self,
+        upload_id: str,
+        content_type: str,
+        offset: int,
+        size: int,
+        chunks: AsyncIterator[bytes]
+    ) -> int:
+        """
+        Append a streamed body to an upload at ``offset``.
+
+        Bytes that arrived before a failure or disconnect stay written, so
+        the client can resume from ``received()``. A type mismatch
+        discards the upload's bytes.
+
+        Args:
+            upload_id: Upload id
+            content_type: Declared content type
+            offset: Offset the body starts at; must equal ``received()``
+            size: Declared total size
+            chunks: Body chunks
+
+        Returns:
+            Bytes received after the append
+
+        Raises:
+            UploadBusyError: If another request is appending to the upload
+            UploadTooLargeError: If the body runs past ``size``
+            UnsupportedMediaError: If the leading bytes do not match ``content_type``
+        """
+        if upload_id in self._active:
+            raise UploadBusyError(f"Upload {upload_id} is already receiving data")
+        self._active.add(upload_id)
+        part_path = self.part_path(upload_id)
+        try:
+            part_path.parent.mkdir(parents=True, exist_ok=True)
+            cached = self._hashers.pop(upload_id, None)
+            if cached is not None and cached[0] == offset:
+                hasher = cached[1]
+            else:
+                hasher = await anyio.to_thread.run_sync(self._rehash, upload_id, offset)
+            received = offset
+            head = self._head(upload_id, offset) if offset < SNIFF_BYTES else None
+
+            def write(part, data: bytes) -> None:
+                part.write(data)
+                part.flush()
+                hasher.update(data)
+
+            with open(part_path, "ab") as part:
+                pending = bytearray()
+                try:
+                    async for chunk in chunks:
+                        if received + len(pending) + len(chunk) > size:
+                            raise UploadTooLargeError(f"Upload {upload_id} is larger than its declared {size} bytes")
+                        if head is not None and len(head) < SNIFF_BYTES:
+                            head += chunk[:SNIFF_BYTES - len(head)]
+                            if len(head) == SNIFF_BYTES:
+                                self.check_signature(content_type, head)
+                        pending += chunk
+                        if len(pending) >= self.write_buffer_size:
+                            await anyio.to_thread.run_sync(write, part, bytes(pending))
+                            received += len(pending)
+                            pending = bytearray()
+                except UnsupportedMediaError:
+                    pending = bytearray()
+                    raise
+                finally:
+                    if pending:
+                        await anyio.to_thread.run_sync(write, part, bytes(pending))
+                        received += len(pending)
+            if head is not None and len(head) < SNIFF_BYTES and received == size:
+                # Files shorter than the signature window are checked whole
+                self.check_signature(content_type, head)
+            self._hashers[upload_id] = (received, hasher)
+            return received
+        except UnsupportedMediaError:
+            self.discard(upload_id)
+            raise
+        finally:
+            self._active.discard(upload_id)
+
+    async def finish(self, upload_id: str, size: int) -> str:
+        """
+        Move a fully received upload into content-addressed storage.
+
+        Args:
+            upload_id: Upload id
+            size: Declared total size, which must have been received
+
+        Returns:
+            SHA-256 hex digest of the content
+        """
+        cached = self._hashers.pop(upload_id, None)
+        if cached is not None and cached[0] == size:
+            hasher = cached[1]
+        else:
+            hasher = await anyio.to_thread.run_sync(self._rehash, upload_id, size)
+        digest = hasher.hexdigest()
+        target = self.blob_path(digest)
+        part_path = self.part_path(upload_id)
+        if target.exists():
+            # Identical media is already stored
+            part_path.unlink()
+            logger.info(f"Upload {upload_id} deduplicated to {digest}")
+        else:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(part_path, target)
+            logger.info(f"Upload {upload_id} stored as {digest}")
+        return digest
+
+    def discard(self, upload_id: str) -> None:
+        """Delete an upload's partial file and hash state."""
+        self._hashers.pop(upload_id, None)
+        self.part_path(upload_id).unlink(missing_ok=True)
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single byte range.
+
+    Args:
+        header: Range header value
+        size: File size
+
+    Returns:
+        Inclusive (start, end), or None to send the whole file; multiple
+        or malformed ranges are ignored as RFC 9110 allows
+
+    Raises:
+        RangeNotSatisfiableError: If the range starts past the end of the file
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if not first:
+            length = int(last)
+            if length <= 0:
+                raise RangeNotSatisfiableError(header)
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        raise RangeNotSatisfiableError(header)
+    return start, end
+
+class MediaFileResponse(Response):
+    """
+    File response for one byte range, sent with sendfile where the server supports it.
+
+    Args:
+        path: File to send
+        start: First byte offset
+        end: Last byte offset, inclusive
+        headers: Response headers; Content-Length is set here
+        media_type: Content type
+        status_code: 200 or 206
+        chunk_size: Bytes per read when sendfile is unavailable
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        start: int,
+        end: int,
+        headers: Mapping[str, str],
+        media_type: str,
+        status_code: int = 200,
+        chunk_size: int = 256 << 10
+    ):
+        self.path = path
+        self.start = start
+        self.length = end - start + 1
+        self.chunk_size = chunk_size
+        super().__init__(
+            status_code=status_code,
+            headers={**headers, "content-length": str(self.length)},
+            media_type=media_type
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD" or not self.length:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as file:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file.fileno(),
+                    "offset": self.start,
+                    "count": self.length,
+                    "more_body": False,
+                })
+            return
+        async with await anyio.open_file(self.path, "rb") as file:
+            await file.seek(self.start)
+            remaining = self.length
+            while remaining:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining:
+                # The file shrank underneath us; end the body rather than hang
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+def media_response(
+    path: Path,
+    etag: str,
+    content_type: str,
+    request_headers: Mapping[str, str],
+    chunk_size: int = 256 << 10,
+    cache_control: str = "public, max-age=31536000, immutable"
+) -> Response:
+    """
+    Build the download response for a stored file.
+
+    Args:
+        path: File to serve
+        etag: Strong entity tag of the file's content, quoted
+        content_type: File content type
+        request_headers: Incoming request headers (Range, If-Range, If-None-Match)
+        chunk_size: Bytes per read when sendfile is unavailable
+        cache_control: Cache-Control header value
+
+    Returns:
+        200, 206, 304 or 416 response
+    """
+    size = path.stat().st_size
+    headers = {
+        "accept-ranges": "bytes",
+        "etag": etag,
+        "cache-control": cache_control,
+    }
+    if request_headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    range_header = request_headers.get("range")
+    if_range = request_headers.get("if-range")
+    if if_range is not None and if_range != etag:
+        range_header = None
+    try:
+        selected = parse_range(range_header, size)
+    except RangeNotSatisfiableError:
+        return Response(status_code=416, headers={**headers, "content-range": f"bytes */{size}"})
+    if selected is None:
+        return MediaFileResponse(path, 0, size - 1, headers, content_type, chunk_size=chunk_size)
+    start, end = selected
+    headers["content-range"] = f"bytes {start}-{end}/{size}"
+    return MediaFileResponse(path, start, end, headers, content_type, status_code=206, chunk_size=chunk_size)
+
+# Process-wide store, created from settings on first use
+media_store: Optional[MediaStore] = None
+
+def get_media_store() -> MediaStore:
+    """Dependency returning the process-wide media store."""
+    global media_store
+    if media_store is None:
+        settings = get_settings()
+        media_store = MediaStore(
+            settings.upload_folder,
+            max_size=settings.max_upload_size,
+            allowed_types=settings.allowed_file_types,
+            write_buffer_size=settings.upload_write_buffer_size,
+            read_chunk_size=settings.media_read_chunk_size,
+        )
+    return media_store
@@ -0,0 +1,547 @@
+"""
+Background media processing for RMS content items.
+
+Completed uploads enqueue a job in the media_jobs table, so no broker is
+needed and jobs survive restarts. There is one job row per content item:
+enqueueing the same content again is a no-op unless forced, and a new
+upload or a ``PIPELINE_VERSION`` bump resets the row for reprocessing.
+
+A MediaWorker claims due jobs, highest priority first, with a
+compare-and-set update so several API processes or standalone workers
+can share the queue. Jobs for content in projects rated within
+``media_active_project_days`` get priority. The CPU-bound steps in
+media_probe run in a pool of spawned processes; a job that exceeds its
+timeout has its process killed and replaced. Failures are retried with
+exponential backoff up to ``media_job_max_attempts``; a claimed job whose
+lease runs out (its worker died) is released for another attempt.
+
+Results are merged into ``ContentItem.content_data["media"]``, provided the
+item still holds the processed content.
+
+Run ``python media_jobs.py worker`` for a dedicated worker process and
+``python media_jobs.py enqueue-all [--force]`` to reprocess every item.
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import socket
+import uuid
+from contextlib import suppress
+from datetime import datetime, timedelta
+from typing import Any, AsyncContextManager, Callable, Dict, List, Optional, Sequence, Set
+
+from sqlalchemy import case, exists, func, literal, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import media
+import media_probe
+import metrics
+import models
+from config import get_settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Bump when processing output changes; existing items then reprocess on enqueue-all
+PIPELINE_VERSION = 1
+
+JOB_COLUMNS = (
+    models.MediaJob.id,
+    models.MediaJob.content_item_id,
+    models.MediaJob.sha256,
+    models.MediaJob.content_type,
+    models.MediaJob.status,
+    models.MediaJob.priority,
+    models.MediaJob.attempts,
+    models.MediaJob.run_after,
+    models.MediaJob.last_error,
+    models.MediaJob.created_at,
+    models.MediaJob.started_at,
+    models.MediaJob.finished_at,
+)
+
+# Extra time past the job timeout before a claimed job counts as abandoned
+LEASE_GRACE_SECONDS = 60
+
+class JobTimeoutError(Exception):
+    """Raised when a job runs longer than its timeout."""
+
+class WorkerCrashedError(Exception):
+    """Raised when a worker process exits while running a job."""
+
+def input_key(sha256: str) -> str:
+    """Idempotency key of processing a blob with the current pipeline."""
+    return f"{sha256}:{PIPELINE_VERSION}"
+
+async def project_priority(db: AsyncSession, project_id: Optional[int]) -> int:
+    """Priority for a project's jobs: 1 if it was rated recently, else 0."""
+    if project_id is None:
+        return 0
+    cutoff = datetime.utcnow() - timedelta(days=get_settings().media_active_project_days)
+    active = await db.scalar(select(exists().where(
+        models.Rating.project_id == project_id, models.Rating.created_at >= cutoff
+    )))
+    return 1 if active else 0
+
+async def enqueue_processing(
+    db: AsyncSession,
+    content_item: models.ContentItem,
+    sha256: str,
+    content_type: str,
+    force: bool = False
+) -> models.MediaJob:
+    """
+    Queue processing of a content item's media; the caller commits.
+
+    Args:
+        db: Database session
+        content_item: Item whose content_url points at the blob
+        sha256: Blob digest
+        content_type: Blob content type
+        force: Reprocess even if this content was already processed
+
+    Returns:
+        The item's job row
+    """
+    job = await db.scalar(select(models.MediaJob).where(models.MediaJob.content_item_id == content_item.id))
+    key = input_key(sha256)
+    if job is not None and not force and job.input_key == key and job.status != models.JobStatus.FAILED:
+        return job
+    if job is None:
+        job = models.MediaJob(content_item_id=content_item.id)
+        db.add(job)
+    job.sha256 = sha256
+    job.content_type = content_type
+    job.input_key = key
+    job.status = models.JobStatus.QUEUED
+    job.priority = await project_priority(db, content_item.project_id)
+    job.attempts = 0
+    job.run_after = datetime.utcnow()
+    job.locked_by = None
+    job.lease_expires_at = None
+    job.last_error = None
+    job.started_at = None
+    job.finished_at = None
+    return job
+
+async def expire_leases(db: AsyncSession, max_attempts: int) -> int:
+    """Release running jobs whose worker stopped renewing them; returns how many."""
+    now = datetime.utcnow()
+    job = models.MediaJob
+    failed = literal(models.JobStatus.FAILED, job.status.type)
+    queued = literal(models.JobStatus.QUEUED, job.status.type)
+    result = await db.execute(
+        update(job)
+        .where(job.status == models.JobStatus.RUNNING, job.lease_expires_at < now)
+        .values(
+            status=case((job.attempts >= max_attempts, failed), else_=queued),
+            run_after=now,
+            locked_by=None,
+            last_error="Worker lease expired",
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount
+
+async def claim_job(db: AsyncSession, worker_id: str, lease_seconds: float) -> Optional[models.MediaJob]:
+    """
+    Claim the highest priority due job.
+
+    Args:
+        db: Database session
+        worker_id: Identity recorded on the claimed job
+        lease_seconds: Time after which an unfinished claim is released
+
+    Returns:
+        The claimed job, or None when nothing is due
+    """
+    job = models.MediaJob
+    now = datetime.utcnow()
+    due = (job.status == models.JobStatus.QUEUED, job.run_after <= now)
+    candidates = (await db.scalars(
+        select(job.id).where(*due).order_by(job.priority.desc(), job.run_after, job.id).limit(8)
+    )).all()
+    for job_id in candidates:
+        # Compare-and-set: another worker may have claimed it since the select
+        result = await db.execute(
+            update(job)
+            .where(job.id == job_id, *due)
+            .values(
+                status=models.JobStatus.RUNNING,
+                attempts=job.attempts + 1,
+                locked_by=worker_id,
+                lease_expires_at=now + timedelta(seconds=lease_seconds),
+                started_at=now,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            await db.commit()
+            return await db.get(models.MediaJob, job_id, populate_existing=True)
+    await db.commit()
+    return None
+
+async def _owned_job(db: AsyncSession, job_id: int, worker_id: str) -> Optional[models.MediaJob]:
+    """Load a job for update if this worker still holds its claim."""
+    job = await db.get(models.MediaJob, job_id, with_for_update=True, populate_existing=True)
+    if job is None or job.status != models.JobStatus.RUNNING or job.locked_by != worker_id:
+        logger.info(f"Media job {job_id} was reset or reclaimed; dropping this result")
+        return None
+    return job
+
+async def complete_job(db: AsyncSession, job_id: int, worker_id: str, result: Dict[str, Any]) -> bool:
+    """
+    Record a successful run and merge its result into the content item.
+
+    Returns:
+        False if the job was reset or reclaimed meanwhile and the result was dropped
+    """
+    job = await _owned_job(db, job_id, worker_id)
+    if job is None:
+        return False
+    content_item = await db.get(models.ContentItem, job.content_item_id)
+    if content_item is not None and content_item.content_url == media.media_url(job.sha256):
+        for thumbnail in result.get("thumbnails", []):
+            thumbnail["url"] = media.thumbnail_url(job.sha256, thumbnail["size"])
+        result = {**result, "sha256": job.sha256, "pipeline_version": PIPELINE_VERSION,
+                  "processed_at": datetime.utcnow().isoformat()}
+        content_item.content_data = {**(content_item.content_data or {}), "media": result}
+    job.status = models.JobStatus.SUCCEEDED
+    job.finished_at = datetime.utcnow()
+    job.locked_by = None
+    job.lease_expires_at = None
+    job.last_error = None
+    await db.commit()
+    metrics.MEDIA_JOBS.inc(outcome="succeeded")
+    return True
+
+async def fail_job(
+    db: AsyncSession,
+    job_id: int,
+    worker_id: str,
+    error: str,
+    max_attempts: int,
+    retry_seconds: float
+) -> bool:
+    """
+    Record a failed run, scheduling a retry with exponential backoff while attempts remain.
+
+    Returns:
+        False if the job was reset or reclaimed meanwhile
+    """
+    job = await _owned_job(db, job_id, worker_id)
+    if job is None:
+        return False
+    job.last_error = error[:2000]
+    job.locked_by = None
+    job.lease_expires_at = None
+    if job.attempts >= max_attempts:
+        job.status = models.JobStatus.FAILED
+        job.finished_at = datetime.utcnow()
+        outcome = "failed"
+    else:
+        job.status = models.JobStatus.QUEUED
+        job.run_after = datetime.utcnow() + timedelta(seconds=retry_seconds * 2 ** (job.attempts - 1))
+        outcome = "retried"
+    await db.commit()
+    metrics.MEDIA_JOBS.inc(outcome=outcome)
+    logger.warning(f"Media job {job_id} attempt {job.attempts} failed ({outcome}): {error}")
+    return True
+
+async def queue_stats(db: AsyncSession) -> Dict[str, Any]:
+    """
+    Summarize the job table.
+
+    Returns:
+        Job counts per status, the number of due queued jobs and the age of the oldest
+    """
+    job = models.MediaJob
+    now = datetime.utcnow()
+    rows = (await db.execute(
+        select(job.status, func.count(), func.min(job.run_after)).group_by(job.status)
+    )).all()
+    counts = {status.value: 0 for status in models.JobStatus}
+    counts.update({status.value: count for status, count, _ in rows})
+    due = await db.scalar(
+        select(func.count()).select_from(job)
+        .where(job.status == models.JobStatus.QUEUED, job.run_after <= now)
+    )
+    oldest = await db.scalar(
+        select(func.min(job.run_after)).where(job.status == models.JobStatus.QUEUED, job.run_after <= now)
+    )
+    return {
+        "queue_depth": due,
+        "by_status": counts,
+        "oldest_due_seconds": (now - oldest).total_seconds() if oldest else None,
+    }
+
+class ProcessSlot:
+    """
+    One worker process that runs one job at a time over a pipe.
+
+    Args:
+        context: multiprocessing context used to start the process
+    """
+
+    def __init__(self, context):
+        self.context = context
+        self._start()
+
+    def _start(self) -> None:
+        self.conn, child = self.context.Pipe()
+        self.process = self.context.Process(target=media_probe.serve, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+
+    async def run(self, task: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        """
+        Run process_media in the worker process.
+
+        Raises:
+            JobTimeoutError: If no result arrives within ``timeout``; the process is replaced
+            WorkerCrashedError: If the process dies; it is replaced
+            RuntimeError: If processing raised, with its message
+        """
+        self.conn.send(task)
+        if not await asyncio.to_thread(self.conn.poll, timeout):
+            self.restart()
+            raise JobTimeoutError(f"Job exceeded its {timeout:g}s timeout")
+        try:
+            outcome, payload = self.conn.recv()
+        except (EOFError, OSError):
+            self.restart()
+            raise WorkerCrashedError("Worker process exited during the job")
+        if outcome == "error":
+            raise RuntimeError(payload)
+        return payload
+
+    def restart(self) -> None:
+        """Kill and replace the worker process."""
+        self.close()
+        self._start()
+
+    def close(self) -> None:
+        """Kill the worker process."""
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+class MediaWorker:
+    """
+    Claims media jobs and runs them in a pool of worker processes.
+
+    Args:
+        session_factory: Callable returning an async session context manager
+        store: Media store holding blobs and thumbnails
+        processes: Worker processes, i.e. jobs run at once
+        job_timeout_seconds: Time a single job may run
+        max_attempts: Runs before a job is marked failed
+        retry_seconds: Backoff before the first retry; doubles per attempt
+        poll_seconds: Interval between queue checks when not woken
+        thumbnail_widths: Thumbnail widths to produce
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncContextManager[AsyncSession]],
+        store: media.MediaStore,
+        processes: int = 2,
+        job_timeout_seconds: float = 300.0,
+        max_attempts: int = 3,
+        retry_seconds: float = 30.0,
+        poll_seconds: float = 5.0,
+        thumbnail_widths: Sequence[int] = (320, 960)
+    ):
+        self.session_factory = session_factory
+        self.store = store
+        self.processes = processes
+        self.job_timeout_seconds = job_timeout_seconds
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.poll_seconds = poll_seconds
+        self.thumbnail_widths = list(thumbnail_widths)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._idle: List[ProcessSlot] = []
+        self._slots: List[ProcessSlot] = []
+        self._running: Set[asyncio.Task] = set()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def busy(self) -> int:
+        """Jobs currently running."""
+        return len(self._running)
+
+    def start(self) -> None:
+        """Start the dispatcher on the running loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Media worker {self.worker_id} started with {self.processes} processes")
+
+    def wake(self) -> None:
+        """Check the queue now instead of at the next poll."""
+        self._wake.set()
+
+    async def stop(self) -> None:
+        """Stop dispatching, abandon running jobs to their leases and kill the processes."""
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    def task_for(self, job: models.MediaJob) -> Dict[str, Any]:
+        """Keyword arguments of media_probe.process_media for a job."""
+        return {
+            "path": str(self.store.blob_path(job.sha256)),
+            "content_type": job.content_type,
+            "thumbnail_paths": {
+                width: str(self.store.thumbnail_path(job.sha256, width)) for width in self.thumbnail_widths
+            },
+        }
+
+    async def _run(self) -> None:
+        """Fill idle processes with claimed jobs, then wait for a wake-up or the poll interval."""
+        context = multiprocessing.get_context("spawn")
+        self._slots = await asyncio.to_thread(lambda: [ProcessSlot(context) for _ in range(self.processes)])
+        self._idle = list(self._slots)
+        lease_seconds = self.job_timeout_seconds + LEASE_GRACE_SECONDS
+        try:
+            while True:
+                self._wake.clear()
+                try:
+                    async with self.session_factory() as db:
+                        await expire_leases(db, self.max_attempts)
+                        while self._idle:
+                            job = await claim_job(db, self.worker_id, lease_seconds)
+                            if job is None:
+                                break
+                            task = asyncio.create_task(self._execute(self._idle.pop(), job))
+                            self._running.add(task)
+                            task.add_done_callback(self._running.discard)
+                except Exception as e:
+                    logger.error(f"Media job dispatch failed: {e}", exc_info=True)
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+        finally:
+            for task in list(self._running):
+                task.cancel()
+            for slot in self._slots:
+                await asyncio.to_thread(slot.close)
+            self._slots, self._idle = [], []
+
+    async def _execute(self, slot: ProcessSlot, job: models.MediaJob) -> None:
+        """Run one claimed job and record its outcome."""
+        started = asyncio.get_running_loop().time()
+        try:
+            result = await slot.run(self.task_for(job), self.job_timeout_seconds)
+            error = None
+        except Exception as e:
+            result, error = None, str(e)
+        finally:
+            self._idle.append(slot)
+            self.wake()
+        try:
+            async with self.session_factory() as db:
+                if error is None:
+                    await complete_job(db, job.id, self.worker_id, result)
+                    elapsed = asyncio.get_running_loop().time() - started
+                    logger.info(f"Media job {job.id} for content item {job.content_item_id} done in {elapsed:.2f}s")
+                else:
+                    await fail_job(db, job.id, self.worker_id, error, self.max_attempts, self.retry_seconds)
+        except Exception as e:
+            # The lease expires and the job is retried
+            logger.error(f"Recording media job {job.id} failed: {e}", exc_info=True)
+
+# Process-wide worker, created on startup when enabled
+media_worker: Optional[MediaWorker] = None
+
+def create_media_worker(session_factory: Callable[[], AsyncContextManager[AsyncSession]]) -> MediaWorker:
+    """Create a worker configured from settings."""
+    settings = get_settings()
+    return MediaWorker(
+        session_factory,
+        media.get_media_store(),
+        processes=settings.media_worker_processes,
+        job_timeout_seconds=settings.media_job_timeout_seconds,
+        max_attempts=settings.media_job_max_attempts,
+        retry_seconds=settings.media_job_retry_seconds,
+        poll_seconds=settings.media_job_poll_seconds,
+        thumbnail_widths=settings.media_thumbnail_widths,
+    )
+
+def start_media_worker() -> None:
+    """Create and start the process-wide worker if enabled in settings."""
+    global media_worker
+    if not get_settings().media_worker_enabled:
+        return
+    from database import get_async_db
+
+    media_worker = create_media_worker(get_async_db)
+    media_worker.start()
+
+async def stop_media_worker() -> None:
+    """Stop the process-wide worker if it is running."""
+    if media_worker is not None:
+        await media_worker.stop()
+
+def notify_jobs() -> None:
+    """Tell the process-wide worker, if any, that jobs were queued."""
+    if media_worker is not None:
+        media_worker.wake()
+
+async def enqueue_all(db: AsyncSession, force: bool = False) -> int:
+    """
+    Queue every content item holding uploaded media; unchanged items are skipped unless forced.
+
+    Returns:
+        Number of items examined
+    """
+    url = literal(media.media_url("")) + models.MediaBlob.sha256
+    rows = (await db.execute(
+        select(models.ContentItem, models.MediaBlob).join(models.MediaBlob, models.ContentItem.content_url == url)
+    )).all()
+    for content_item, blob in rows:
+        await enqueue_processing(db, content_item, blob.sha256, blob.content_type, force=force)
+    await db.commit()
+    return len(rows)
+
+async def _serve_forever() -> None:
+    """Run a standalone worker until interrupted."""
+    from database import get_async_db
+
+    worker = create_media_worker(get_async_db)
+    worker.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await worker.stop()
+
+def main() -> None:
+    """Command line entry point for the media worker."""
+    from config import init_logging
+    from database import get_async_db
+
+    parser = argparse.ArgumentParser(description="RMS media processing")
+    parser.add_argument("command", choices=["worker", "enqueue-all"], help="Run a worker or queue all media")
+    parser.add_argument("--force", action="store_true", help="Reprocess media already processed")
+    args = parser.parse_args()
+
+    init_logging()
+    if args.command == "worker":
+        with suppress(KeyboardInterrupt):
+            asyncio.run(_serve_forever())
+    else:
+        async def run() -> None:
+            async with get_async_db() as db:
+                count = await enqueue_all(db, force=args.force)
+            logger.info(f"Examined {count} content items")
+
+        asyncio.run(run())
+
+if __name__ == "__main__":
+    main()
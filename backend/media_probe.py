@@ -0,0 +1,244 @@
+"""
+CPU-bound media processing steps for RMS, run in worker processes.
+
+Dimensions and durations are read from file headers without decoding:
+PNG, GIF, JPEG and WebP image headers and the ``mvhd``/``tkhd`` boxes of
+MP4/QuickTime files, located with seeks so large videos are never read in
+full. Thumbnails are JPEGs written next to the media store; images are
+scaled with Pillow and video frames are grabbed with ffmpeg, each used
+only when installed.
+
+This module imports nothing from the application so that spawned worker
+processes start quickly.
+"""
+import logging
+import os
+import shutil
+import struct
+import subprocess
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# JPEG start-of-frame markers; C4, C8 and CC share the range but are not frames
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+# MP4 boxes descended into while looking for mvhd and tkhd
+MP4_CONTAINERS = {b"moov", b"trak"}
+
+FFMPEG_TIMEOUT_SECONDS = 60
+
+def _jpeg_size(file: BinaryIO) -> Optional[Tuple[int, int]]:
+    """Read width and height from the first JPEG start-of-frame segment."""
+    file.seek(2)
+    while True:
+        byte = file.read(1)
+        while byte and byte != b"\xff":
+            byte = file.read(1)
+        marker = file.read(1)
+        while marker == b"\xff":
+            marker = file.read(1)
+        if not marker:
+            return None
+        code = marker[0]
+        if code == 0x01 or 0xD0 <= code <= 0xD7:
+            continue
+        length_bytes = file.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack(">H", length_bytes)[0]
+        if code in JPEG_SOF_MARKERS:
+            height, width = struct.unpack(">xHH", file.read(5))
+            return width, height
+        file.seek(length - 2, os.SEEK_CUR)
+
+def _webp_size(head: bytes) -> Optional[Tuple[int, int]]:
+    """Read width and height from a WebP header."""
+    chunk = head[12:16]
+    if chunk == b"VP8 " and len(head) >= 30:
+        width, height = struct.unpack("<HH", head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L" and len(head) >= 25:
+        b0, b1, b2, b3 = head[21:25]
+        return 1 + (((b1 & 0x3F) << 8) | b0), 1 + (((b3 & 0x0F) << 10) | (b2 << 2) | ((b1 & 0xC0) >> 6))
+    if chunk == b"VP8X" and len(head) >= 30:
+        return 1 + int.from_bytes(head[24:27], "little"), 1 + int.from_bytes(head[27:30], "little")
+    return None
+
+def image_size(path: str) -> Optional[Tuple[int, int]]:
+    """
+    Read image dimensions from the file header.
+
+    Args:
+        path: Image file
+
+    Returns:
+        (width, height), or None for unrecognised formats
+    """
+    with open(path, "rb") as file:
+        head = file.read(32)
+        if head.startswith(b"\x89PNG\r\n\x1a\n") and len(head) >= 24:
+            return struct.unpack(">II", head[16:24])
+        if head[:6] in (b"GIF87a", b"GIF89a"):
+            return struct.unpack("<HH", head[6:10])
+        if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+            return _webp_size(head)
+        if head.startswith(b"\xff\xd8"):
+            return _jpeg_size(file)
+    return None
+
+def _mp4_boxes(file: BinaryIO, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """Yield (type, payload start, payload end) of the boxes in a byte range."""
+    offset = start
+    while offset + 8 <= end:
+        file.seek(offset)
+        size, box_type = struct.unpack(">I4s", file.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", file.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            return
+        yield box_type, offset + header, min(offset + size, end)
+        offset += size
+
+def video_info(path: str) -> Dict[str, Any]:
+    """
+    Read duration and frame size of an MP4/QuickTime file.
+
+    Args:
+        path: Video file
+
+    Returns:
+        Dict with ``duration_seconds``, ``width`` and ``height`` where found
+    """
+    info: Dict[str, Any] = {}
+    with open(path, "rb") as file:
+        pending = [(0, os.fstat(file.fileno()).st_size)]
+        while pending:
+            start, end = pending.pop()
+            for box_type, payload, box_end in _mp4_boxes(file, start, end):
+                if box_type in MP4_CONTAINERS:
+                    pending.append((payload, box_end))
+                    continue
+                if box_type not in (b"mvhd", b"tkhd"):
+                    continue
+                file.seek(payload)
+                version = file.read(1)[0]
+                if box_type == b"mvhd":
+                    file.seek(payload + (20 if version == 1 else 12))
+                    timescale, duration = struct.unpack(">IQ" if version == 1 else ">II", file.read(12 if version == 1 else 8))
+                    if timescale:
+                        info["duration_seconds"] = round(duration / timescale, 3)
+                elif "width" not in info:
+                    file.seek(payload + (88 if version == 1 else 76))
+                    width, height = struct.unpack(">II", file.read(8))
+                    if width and height:
+                        info["width"], info["height"] = width >> 16, height >> 16
+    return info
+
+def _image_thumbnails(path: str, out: Dict[int, Path], warnings: List[str]) -> List[Dict[str, int]]:
+    """Write image thumbnails with Pillow."""
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        warnings.append("Pillow is not installed; image thumbnails skipped")
+        return []
+    created = []
+    with Image.open(path) as image:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        for size, target in out.items():
+            thumbnail = image.copy()
+            thumbnail.thumbnail((size, size * 4))
+            temporary = target.with_suffix(".tmp")
+            thumbnail.save(temporary, "JPEG", quality=85)
+            os.replace(temporary, target)
+            created.append({"size": size, "width": thumbnail.width, "height": thumbnail.height})
+    return created
+
+def _video_thumbnails(path: str, info: Dict[str, Any], out: Dict[int, Path], warnings: List[str]) -> List[Dict[str, int]]:
+    """Write video poster-frame thumbnails with ffmpeg."""
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        warnings.append("ffmpeg is not installed; video thumbnails skipped")
+        return []
+    position = min(1.0, info.get("duration_seconds", 0) / 2)
+    created = []
+    for size, target in out.items():
+        # Never upscale beyond the source frame
+        width = min(size, info["width"]) if info.get("width") else size
+        temporary = target.with_suffix(".tmp.jpg")
+        subprocess.run(
+            [ffmpeg, "-v", "error", "-y", "-ss", str(position), "-i", path,
+             "-frames:v", "1", "-vf", f"scale={width}:-2", str(temporary)],
+            check=True, capture_output=True, timeout=FFMPEG_TIMEOUT_SECONDS
+        )
+        os.replace(temporary, target)
+        height = round(width * info["height"] / info["width"] / 2) * 2 if info.get("width") else None
+        created.append({"size": size, "width": width, "height": height})
+    return created
+
+def process_media(
+    path: str,
+    content_type: str,
+    thumbnail_paths: Dict[int, str],
+) -> Dict[str, Any]:
+    """
+    Extract metadata and write thumbnails for one media file.
+
+    Output files are replaced atomically, so running the same input twice
+    gives the same result.
+
+    Args:
+        path: Media file
+        content_type: MIME type of the file
+        thumbnail_paths: Output path per requested thumbnail width; images
+            smaller than a width are not upscaled
+
+    Returns:
+        Metadata dict with ``content_type``, ``size``, dimensions, duration
+        for videos, the ``thumbnails`` actually written (requested ``size``
+        and resulting ``width``/``height``) and ``warnings``
+    """
+    warnings: List[str] = []
+    result: Dict[str, Any] = {"content_type": content_type, "size": os.path.getsize(path)}
+    kind = content_type.split("/")[0]
+    if kind == "image":
+        dimensions = image_size(path)
+        if dimensions:
+            result["width"], result["height"] = dimensions
+    elif content_type in ("video/mp4", "video/quicktime"):
+        result.update(video_info(path))
+
+    out = {int(size): Path(target) for size, target in thumbnail_paths.items()}
+    for target in out.values():
+        target.parent.mkdir(parents=True, exist_ok=True)
+    if kind == "image":
+        result["thumbnails"] = _image_thumbnails(path, out, warnings)
+    elif kind == "video":
+        result["thumbnails"] = _video_thumbnails(path, result, out, warnings)
+    else:
+        result["thumbnails"] = []
+    result["warnings"] = warnings
+    return result
+
+def serve(conn) -> None:
+    """
+    Worker process loop: receive keyword arguments for process_media, send back results.
+
+    Sends ``("ok", result)`` or ``("error", message)`` per task and exits
+    when the parent closes the pipe.
+    """
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        try:
+            conn.send(("ok", process_media(**task)))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
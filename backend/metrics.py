@@ -0,0 +1,249 @@
+"""
+Request and database metrics for RMS.
+
+This module keeps per-route latency histograms, in-flight request gauges,
+connection pool statistics and per-request query accounting, and renders
+them in the Prometheus text exposition format for the /metrics endpoint.
+
+Query accounting hooks SQLAlchemy's before/after_cursor_execute events;
+the counts are attributed to the request running in the current context.
+"""
+import logging
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, shared by request and query histograms
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+def _escape(value: str) -> str:
+    """Escape a label value for the exposition format."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    """Render a label set as {k="v",...}."""
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in items) + "}"
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        """Increase the counter for a label set."""
+        key = tuple(sorted(labels.items()))
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        """Return the current value for a label set."""
+        return self._values.get(tuple(sorted(labels.items())), 0.0)
+
+    def render(self) -> List[str]:
+        """Render the counter in exposition format."""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        lines.extend(f"{self.name}{_format_labels(key)} {value}" for key, value in self._values.items())
+        return lines
+
+class Gauge(Counter):
+    """Gauge that can move in both directions."""
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        """Decrease the gauge for a label set."""
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        """Set the gauge for a label set."""
+        self._values[tuple(sorted(labels.items()))] = value
+
+    def render(self) -> List[str]:
+        """Render the gauge in exposition format."""
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+class Histogram:
+    """Cumulative histogram with fixed buckets and optional labels."""
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._series: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Record one observation for a label set."""
+        key = tuple(sorted(labels.items()))
+        series = self._series.get(key)
+        if series is None:
+            # Per-bucket counts, then +Inf count and sum
+            series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+                break
+        else:
+            series[len(self.buckets)] += 1
+        series[-1] += value
+
+    def count(self, **labels: str) -> int:
+        """Return the number of observations for a label set."""
+        series = self._series.get(tuple(sorted(labels.items())))
+        return int(sum(series[:-1])) if series else 0
+
+    def sum(self, **labels: str) -> float:
+        """Return the sum of observed values for a label set."""
+        series = self._series.get(tuple(sorted(labels.items())))
+        return series[-1] if series else 0.0
+
+    def render(self) -> List[str]:
+        """Render the histogram in exposition format."""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, series in self._series.items():
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', repr(bound)))} {cumulative}")
+            cumulative += series[len(self.buckets)]
+            lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+@dataclass
+class RequestStats:
+    """Database work attributed to one request."""
+    query_count: int = 0
+    query_time: float = 0.0
+
+# Stats of the request running in the current context, if any
+current_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("current_request_stats", default=None)
+
+REQUEST_LATENCY = Histogram("rms_http_request_duration_seconds", "HTTP request latency by route")
+REQUESTS_IN_FLIGHT = Gauge("rms_http_requests_in_flight", "HTTP requests currently being served")
+REQUEST_QUERIES = Histogram(
+    "rms_http_request_db_queries", "Database queries issued per request",
+    buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100)
+)
+QUERY_LATENCY = Histogram("rms_db_query_duration_seconds", "Database statement execution time by engine")
+POOL_CHECKOUT_WAIT = Histogram("rms_db_pool_checkout_seconds", "Time spent obtaining a pooled connection")
+POOL_CHECKOUTS = Counter("rms_db_pool_checkouts_total", "Connections checked out of the pool")
+LIVE_SUBSCRIBERS = Gauge("rms_live_subscribers", "Open live update connections")
+LIVE_PUBLISHES = Counter("rms_live_publishes_total", "Live distribution updates published")
+LIVE_DROPPED = Counter("rms_live_updates_dropped_total", "Live updates skipped by slow subscribers")
+MEDIA_JOBS = Counter("rms_media_jobs_total", "Media job runs finished, by outcome")
+ADMISSION_QUEUED = Gauge("rms_admission_queued", "Requests waiting for an in-flight slot")
+ADMISSION_WAIT = Histogram("rms_admission_wait_seconds", "Time queued requests waited for a slot")
+ADMISSION_QUEUE_FULL = Counter("rms_admission_queue_full_total", "Requests shed because the wait queue was full")
+ADMISSION_QUEUE_TIMEOUT = Counter("rms_admission_queue_timeout_total", "Requests shed after waiting too long")
+ADMISSION_SHED = Counter("rms_admission_shed_total", "Requests shed on arrival behind an overdue queue")
+RATE_LIMITED_CLIENT = Counter("rms_rate_limited_client_total", "Requests rejected by the per-client rate limit")
+LOG_RECORDS_DROPPED = Counter("rms_log_records_dropped_total", "Log records dropped because the log queue was full")
+RATE_LIMITED_PROJECT = Counter("rms_rate_limited_project_total", "Rating writes rejected by the per-project rate limit")
+SIMILARITY_REFRESH = Histogram("rms_similarity_refresh_seconds", "Time spent refreshing the similarity index, by kind")
+
+# Engines registered for pool statistics, by name
+_engines: Dict[str, Engine] = {}
+
+class _TimedCheckoutMixin:
+    """Pool mixin timing connect(), which includes any wait for a free slot."""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start, pool=self.logging_name or "default")
+
+class InstrumentedQueuePool(_TimedCheckoutMixin, QueuePool):
+    """QueuePool that records checkout wait time."""
+
+class InstrumentedAsyncQueuePool(_TimedCheckoutMixin, AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that records checkout wait time."""
+
+def instrument_engine(sync_engine: Engine, name: str) -> None:
+    """
+    Attach query accounting and pool statistics to an engine.
+
+    Args:
+        sync_engine: Engine, or the sync_engine of an async engine
+        name: Label identifying the engine in metrics
+    """
+    _engines[name] = sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        QUERY_LATENCY.observe(elapsed, engine=name)
+        stats = current_request_stats.get()
+        if stats is not None:
+            stats.query_count += 1
+            stats.query_time += elapsed
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(context):
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+    @event.listens_for(sync_engine, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        POOL_CHECKOUTS.inc(engine=name)
+
+def _pool_lines() -> List[str]:
+    """Render current pool size, checked-out and overflow gauges."""
+    samples = {"size": [], "checked_out": [], "overflow": []}
+    for name, sync_engine in _engines.items():
+        pool = sync_engine.pool
+        if not isinstance(pool, QueuePool):
+            continue
+        samples["size"].append((name, pool.size()))
+        samples["checked_out"].append((name, pool.checkedout()))
+        samples["overflow"].append((name, max(pool.overflow(), 0)))
+    lines = []
+    for metric, values in samples.items():
+        lines.append(f"# HELP rms_db_pool_{metric} Connection pool {metric.replace('_', ' ')}")
+        lines.append(f"# TYPE rms_db_pool_{metric} gauge")
+        lines.extend(f'rms_db_pool_{metric}{{engine="{name}"}} {value}' for name, value in values)
+    return lines
+
+def render_metrics(extra: Iterable[str] = ()) -> str:
+    """
+    Render every metric in the Prometheus text format.
+
+    Args:
+        extra: Additional pre-rendered exposition lines
+
+    Returns:
+        str: Exposition document
+    """
+    lines: List[str] = []
+    for metric in (REQUEST_LATENCY, REQUESTS_IN_FLIGHT, REQUEST_QUERIES,
+                   QUERY_LATENCY, POOL_CHECKOUT_WAIT, POOL_CHECKOUTS,
+                   LIVE_SUBSCRIBERS, LIVE_PUBLISHES, LIVE_DROPPED, MEDIA_JOBS,
+                   ADMISSION_QUEUED, ADMISSION_WAIT, ADMISSION_QUEUE_FULL, ADMISSION_QUEUE_TIMEOUT,
+                   ADMISSION_SHED, RATE_LIMITED_CLIENT, RATE_LIMITED_PROJECT, LOG_RECORDS_DROPPED,
+                   SIMILARITY_REFRESH):
+        lines.extend(metric.render())
+    lines.extend(_pool_lines())
+    lines.extend(extra)
+    return "\n".join(lines) + "\n"
@@ -5,8 +5,8 @@ This module defines SQLAlchemy ORM models for the core entities in the Rating Ma
 """
 from datetime import datetime
 from typing import List
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, JSON, Text, Boolean
-from sqlalchemy.orm import relationship, declarative_base
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, JSON, Text, Boolean, BigInteger, Index, LargeBinary, PrimaryKeyConstraint
+from sqlalchemy.orm import relationship, declarative_base, declared_attr
 import enum
 
 Base = declarative_base()
@@ -29,6 +29,13 @@ class Rasa(enum.Enum):
     BIBHATSA = "bibhatsa"    # Disgust
     RAUDRA = "raudra"        # Fiery
 
+class JobStatus(enum.Enum):
+    """Lifecycle states of a background media job."""
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
 class User(Base):
     """User model for authentication and authorization."""
     __tablename__ = "users"
@@ -77,6 +84,10 @@ class ContentItem(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        Index("ix_content_items_project_id", "project_id"),
+    )
+
     # Relationships
     project = relationship("Project", back_populates="content_items")
     philosophical_analysis = relationship("PhilosophicalAnalysis", back_populates="content_item")
@@ -95,6 +106,10 @@ class PhilosophicalAnalysis(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        Index("ix_philosophical_analyses_content_item_id", "content_item_id"),
+    )
+
     # Relationships
     content_item = relationship("ContentItem", back_populates="philosophical_analysis")
 
@@ -111,7 +126,144 @@ class Rating(Base):
     feedback = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Project listings, keyset pages and per-project time ranges
+        Index("ix_ratings_project_id_id", "project_id", "id"),
+        Index("ix_ratings_project_id_created_at_id", "project_id", "created_at", "id"),
+        Index("ix_ratings_content_item_id_rasa", "content_item_id", "rasa"),
+        Index("ix_ratings_user_id", "user_id"),
+        Index("ix_ratings_created_at", "created_at"),
+    )
+
     # Relationships
     user = relationship("User", back_populates="ratings")
     project = relationship("Project", back_populates="ratings")
     content_item = relationship("ContentItem", back_populates="ratings")
+
+class RasaStatsColumns:
+    """Running rating statistics shared by the per-rasa aggregate tables."""
+    rasa = Column(Enum(Rasa), primary_key=True)
+    rating_count = Column(BigInteger, nullable=False, default=0)
+    rating_sum = Column(BigInteger, nullable=False, default=0)
+    rating_sum_squares = Column(BigInteger, nullable=False, default=0)
+    rating_min = Column(Integer)
+    rating_max = Column(Integer)
+
+class ProjectRasaStats(RasaStatsColumns, Base):
+    """Incrementally maintained rating aggregates per project and rasa."""
+    __tablename__ = "project_rasa_stats"
+
+    project_id = Column(Integer, ForeignKey("projects.id"), primary_key=True)
+
+class ContentItemRasaStats(RasaStatsColumns, Base):
+    """Incrementally maintained rating aggregates per content item and rasa."""
+    __tablename__ = "content_item_rasa_stats"
+
+    content_item_id = Column(Integer, ForeignKey("content_items.id"), primary_key=True)
+
+class RasaSketchColumns:
+    """Serialized distinct-rater and rating-value sketches per day and rasa."""
+    bucket_start = Column(DateTime, nullable=False)
+    rasa = Column(Enum(Rasa), nullable=False)
+    raters = Column(LargeBinary, nullable=False, default=b"")
+    rating_values = Column(LargeBinary, nullable=False, default=b"")
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class ProjectRasaSketch(RasaSketchColumns, Base):
+    """Mergeable rating sketches per project, day and rasa."""
+    __tablename__ = "project_rasa_sketches"
+    __table_args__ = (PrimaryKeyConstraint("project_id", "bucket_start", "rasa"),)
+
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
+
+class ContentItemRasaSketch(RasaSketchColumns, Base):
+    """Mergeable rating sketches per content item, day and rasa."""
+    __tablename__ = "content_item_rasa_sketches"
+    __table_args__ = (PrimaryKeyConstraint("content_item_id", "bucket_start", "rasa"),)
+
+    content_item_id = Column(Integer, ForeignKey("content_items.id"), nullable=False)
+
+class RatingRollupColumns:
+    """Rating counts and sums per project, time bucket and rasa."""
+    bucket_start = Column(DateTime, nullable=False)
+    rasa = Column(Enum(Rasa), nullable=False)
+    rating_count = Column(BigInteger, nullable=False, default=0)
+    rating_sum = Column(BigInteger, nullable=False, default=0)
+
+    @declared_attr
+    def project_id(cls):
+        return Column(Integer, ForeignKey("projects.id"), nullable=False)
+
+    @declared_attr
+    def __table_args__(cls):
+        # Leading project_id and bucket_start serve trend range scans
+        return (PrimaryKeyConstraint("project_id", "bucket_start", "rasa"),)
+
+class RatingRollupMinute(RatingRollupColumns, Base):
+    """Ratings rolled up per minute."""
+    __tablename__ = "rating_rollups_minute"
+
+class RatingRollupHour(RatingRollupColumns, Base):
+    """Ratings rolled up per hour."""
+    __tablename__ = "rating_rollups_hour"
+
+class RatingRollupDay(RatingRollupColumns, Base):
+    """Ratings rolled up per day."""
+    __tablename__ = "rating_rollups_day"
+
+class RollupWatermark(Base):
+    """Highest rating id already folded into the rollup tables."""
+    __tablename__ = "rollup_watermarks"
+
+    name = Column(String(50), primary_key=True)
+    last_rating_id = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class MediaBlob(Base):
+    """Content-addressed media file, stored once per distinct SHA-256."""
+    __tablename__ = "media_blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    content_type = Column(String(100), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class Upload(Base):
+    """Resumable upload of one media file for a content item."""
+    __tablename__ = "uploads"
+
+    id = Column(String(32), primary_key=True)
+    content_item_id = Column(Integer, ForeignKey("content_items.id"), nullable=False)
+    filename = Column(String(255))
+    content_type = Column(String(100), nullable=False)
+    size = Column(BigInteger, nullable=False)
+    received = Column(BigInteger, nullable=False, default=0)
+    sha256 = Column(String(64), ForeignKey("media_blobs.sha256"))
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    completed_at = Column(DateTime)
+
+class MediaJob(Base):
+    """Media processing job for a content item; one row per item, reset on reprocessing."""
+    __tablename__ = "media_jobs"
+
+    id = Column(Integer, primary_key=True)
+    content_item_id = Column(Integer, ForeignKey("content_items.id"), nullable=False, unique=True)
+    sha256 = Column(String(64), nullable=False)
+    content_type = Column(String(100), nullable=False)
+    input_key = Column(String(80), nullable=False)  # sha256 and pipeline version
+    status = Column(Enum(JobStatus), nullable=False, default=JobStatus.QUEUED)
+    priority = Column(Integer, nullable=False, default=0)
+    attempts = Column(Integer, nullable=False, default=0)
+    run_after = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = Column(String(64))
+    lease_expires_at = Column(DateTime)
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    __table_args__ = (
+        # Claiming picks the highest priority due job
+        Index("ix_media_jobs_status_priority_run_after", "status", "priority", "run_after"),
+    )
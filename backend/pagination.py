@@ -0,0 +1,121 @@
+"""
+Keyset pagination helpers for RMS.
+
+Cursors are opaque, URL-safe tokens wrapping the sort key of the last
+row on a page, usually its primary key. Fetching the next page is an index
+seek on ``id > last_id``, so every page costs the same regardless of how
+deep it is.
+"""
+import base64
+import json
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import Select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+def encode_token(payload: Dict[str, Any]) -> str:
+    """
+    Encode a sort-key payload as an opaque cursor.
+
+    Args:
+        payload: JSON-serializable sort key of the last row returned
+
+    Returns:
+        str: URL-safe cursor token
+    """
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_token(cursor: str) -> Optional[Dict[str, Any]]:
+    """
+    Decode a cursor produced by encode_token.
+
+    Args:
+        cursor: Cursor token; an empty string requests the first page
+
+    Returns:
+        Decoded payload, or None for the first page
+
+    Raises:
+        ValueError: If the token is malformed
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if not isinstance(payload, dict):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return payload
+
+def encode_cursor(last_id: int) -> str:
+    """
+    Encode the last seen id as an opaque cursor.
+
+    Args:
+        last_id: Primary key of the last row returned
+
+    Returns:
+        str: URL-safe cursor token
+    """
+    return encode_token({"id": last_id})
+
+def decode_cursor(cursor: str) -> Optional[int]:
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Args:
+        cursor: Cursor token; an empty string requests the first page
+
+    Returns:
+        Last seen id, or None for the first page
+
+    Raises:
+        ValueError: If the token is malformed
+    """
+    payload = decode_token(cursor)
+    if payload is None:
+        return None
+    last_id = payload.get("id")
+    if not isinstance(last_id, int):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return last_id
+
+async def fetch_keyset_page(
+    db: AsyncSession,
+    query: Select,
+    id_column: Any,
+    cursor: str,
+    limit: int
+) -> Dict[str, Any]:
+    """
+    Run a query as one keyset page ordered by id.
+
+    Args:
+        db: Database session
+        query: Column select with any filters already applied; must include id
+        id_column: Primary key column the cursor is keyed on
+        cursor: Cursor from the previous page, empty for the first page
+        limit: Maximum number of rows to return
+
+    Returns:
+        Dict with the page ``items`` as row dicts and the ``next_cursor``
+        (None on the last page)
+
+    Raises:
+        ValueError: If the cursor is malformed or ``limit`` is below one
+    """
+    if limit < 1:
+        raise ValueError(f"Invalid page limit: {limit}")
+    last_id = decode_cursor(cursor)
+    if last_id is not None:
+        query = query.where(id_column > last_id)
+    result = await db.execute(query.order_by(id_column).limit(limit + 1))
+    items: List[Dict[str, Any]] = [row._asdict() for row in result.all()]
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1]["id"])
+    return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,195 @@
+"""
+Compound project detail for RMS.
+
+GET /projects/{id} returns a project together with the related data named
+in ``include``. Each include is loaded with a fixed strategy, so the number
+of SQL statements depends only on which includes are requested, never on
+how many content items or analyses a project has:
+
+- ``creator``: joined into the project query (many-to-one)
+- ``content_items``: one selectin query
+- ``content_items.philosophical_analysis``: one more selectin query
+- ``rating_summary``: one query over project_rasa_stats
+
+All other relationships raise on access, so a lazy load cannot slip in.
+``fields`` restricts each object to the listed attributes and narrows the
+columns loaded to match.
+"""
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, load_only, raiseload, selectinload
+
+import aggregates
+import models
+import schemas
+
+# Path of the project itself in ``fields``
+ROOT = ""
+
+# Includes and the schema/model of the objects they embed
+RELATIONS = {
+    ROOT: (schemas.ProjectOut, models.Project),
+    "creator": (schemas.UserOut, models.User),
+    "content_items": (schemas.ContentItemOut, models.ContentItem),
+    "content_items.philosophical_analysis": (schemas.PhilosophicalAnalysisOut, models.PhilosophicalAnalysis),
+}
+
+INCLUDES = ("creator", "content_items", "content_items.philosophical_analysis", "rating_summary")
+
+# Statements issued per include on top of the project query itself
+QUERY_COST = {
+    "creator": 0,
+    "content_items": 1,
+    "content_items.philosophical_analysis": 1,
+    "rating_summary": 1,
+}
+
+def parse_includes(raw: Optional[str]) -> Set[str]:
+    """
+    Parse a comma-separated ``include`` value.
+
+    A nested include implies its parent, so
+    ``content_items.philosophical_analysis`` also includes ``content_items``.
+
+    Args:
+        raw: Query parameter value, or None
+
+    Returns:
+        Set of include paths
+
+    Raises:
+        ValueError: If an include is not supported
+    """
+    includes = {part.strip() for part in (raw or "").split(",") if part.strip()}
+    unknown = includes - set(INCLUDES)
+    if unknown:
+        raise ValueError(f"Unknown include: {', '.join(sorted(unknown))}. Must be one of: {', '.join(INCLUDES)}")
+    for path in list(includes):
+        while "." in path:
+            path = path.rsplit(".", 1)[0]
+            includes.add(path)
+    return includes
+
+def parse_fields(raw: Optional[str], includes: Set[str]) -> Dict[str, Set[str]]:
+    """
+    Parse a comma-separated sparse fieldset.
+
+    Plain names select project fields; names prefixed with an include path
+    (``content_items.title``) select fields of the embedded objects. Objects
+    without any listed fields keep all of theirs, and ``id`` is always kept.
+
+    Args:
+        raw: Query parameter value, or None
+        includes: Parsed include paths
+
+    Returns:
+        Dict of include path (``""`` for the project) to selected field names
+
+    Raises:
+        ValueError: If a field or its path is not known
+    """
+    fields: Dict[str, Set[str]] = {}
+    for part in (raw or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        path, _, name = part.rpartition(".")
+        if path not in RELATIONS or (path and path not in includes):
+            raise ValueError(f"Field {part} does not belong to the project or an included relation")
+        schema, _ = RELATIONS[path]
+        if name not in schema.model_fields:
+            raise ValueError(f"Unknown field {part}")
+        fields.setdefault(path, {"id"}).add(name)
+    return fields
+
+def query_budget(includes: Set[str]) -> int:
+    """Return the number of statements a detail request may issue."""
+    return 1 + sum(QUERY_COST[include] for include in includes)
+
+def _field_names(path: str, fields: Dict[str, Set[str]]) -> List[str]:
+    """Return the selected field names of a path in schema order."""
+    schema, _ = RELATIONS[path]
+    selected = fields.get(path)
+    return [name for name in schema.model_fields if selected is None or name in selected]
+
+def _load_columns(path: str, fields: Dict[str, Set[str]], *required: str):
+    """Build a load_only option for the selected fields of a path."""
+    _, model = RELATIONS[path]
+    names = _field_names(path, fields)
+    return load_only(*(getattr(model, name) for name in dict.fromkeys([*names, *required])))
+
+def build_detail_query(project_id: int, includes: Set[str], fields: Dict[str, Set[str]]) -> Select:
+    """
+    Build the project query with one loader option per include.
+
+    Args:
+        project_id: Project ID
+        includes: Parsed include paths
+        fields: Parsed sparse fieldset
+
+    Returns:
+        Select for the project with its includes
+    """
+    # The rasa summary needs the expected rasa even if it was not requested
+    required = ("expected_rasa",) if "rating_summary" in includes else ()
+    options = [_load_columns(ROOT, fields, *required)]
+    if "creator" in includes:
+        options.append(joinedload(models.Project.creator).options(_load_columns("creator", fields)))
+    if "content_items" in includes:
+        item_options = [_load_columns("content_items", fields), raiseload("*")]
+        if "content_items.philosophical_analysis" in includes:
+            path = "content_items.philosophical_analysis"
+            item_options.insert(1, selectinload(models.ContentItem.philosophical_analysis).options(
+                _load_columns(path, fields), raiseload("*")
+            ))
+        options.append(selectinload(models.Project.content_items).options(*item_options))
+    options.append(raiseload("*"))
+    return select(models.Project).where(models.Project.id == project_id).options(*options)
+
+def _dump(obj: Any, path: str, fields: Dict[str, Set[str]]) -> Dict[str, Any]:
+    """Read the selected fields of a loaded object into a dict."""
+    return {name: getattr(obj, name) for name in _field_names(path, fields)}
+
+async def get_project_detail(
+    db: AsyncSession,
+    project_id: int,
+    includes: Set[str],
+    fields: Dict[str, Set[str]]
+) -> Optional[Dict[str, Any]]:
+    """
+    Load a project and its includes.
+
+    Args:
+        db: Database session
+        project_id: Project ID
+        includes: Parsed include paths
+        fields: Parsed sparse fieldset
+
+    Returns:
+        Project dict with the requested includes, or None if not found
+    """
+    result = await db.execute(build_detail_query(project_id, includes, fields))
+    project = result.unique().scalar_one_or_none()
+    if project is None:
+        return None
+
+    detail = _dump(project, ROOT, fields)
+    if "creator" in includes:
+        creator = project.creator
+        detail["creator"] = _dump(creator, "creator", fields) if creator is not None else None
+    if "content_items" in includes:
+        items = []
+        for content_item in project.content_items:
+            item = _dump(content_item, "content_items", fields)
+            if "content_items.philosophical_analysis" in includes:
+                item["philosophical_analysis"] = [
+                    _dump(analysis, "content_items.philosophical_analysis", fields)
+                    for analysis in content_item.philosophical_analysis
+                ]
+            items.append(item)
+        detail["content_items"] = items
+    if "rating_summary" in includes:
+        detail["rating_summary"] = await aggregates.get_project_summary(db, project)
+    return detail
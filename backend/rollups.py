@@ -0,0 +1,485 @@
+"""
+Time-bucketed rating rollups for RMS.
+
+Ratings are folded into per-minute, per-hour and per-day rows keyed by
+``(project_id, bucket_start, rasa)``. A background scheduler advances a
+rating-id watermark: each pass groups the ratings above the watermark by
+bucket in SQL, adds the counts onto existing rollup rows with
+ON CONFLICT DO UPDATE and moves the watermark, all in one transaction.
+
+Progress is tracked by id rather than by time, so late data (ratings
+ingested with an old ``created_at``) is still folded into the buckets it
+belongs to. The scheduler only advances to ids that have settled (see
+``RatingIdHorizon``), so a rating whose id was drawn before a higher one
+but committed after it is not skipped. ``python rollups.py rebuild`` recomputes everything from the
+ratings table.
+
+Trend queries read the coarsest rollup whose bucket size divides the
+requested resolution and merge its rows into the requested buckets.
+"""
+import argparse
+import asyncio
+import logging
+import math
+import re
+import time
+from collections import deque
+from contextlib import suppress
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncContextManager, Callable, Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import Table, delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import models
+from aggregates import UPSERT_INSERTS
+from config import get_settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+WATERMARK_NAME = "rating_rollups"
+
+# Rollup tables by bucket size in seconds, coarsest first
+ROLLUPS: List[Tuple[str, int, Table]] = [
+    ("day", 86400, models.RatingRollupDay.__table__),
+    ("hour", 3600, models.RatingRollupHour.__table__),
+    ("minute", 60, models.RatingRollupMinute.__table__),
+]
+
+# SQLite stores DateTime as text; bucket strings use the same layout so
+# that range comparisons against bound datetimes stay correct
+SQLITE_BUCKET_FORMATS = {
+    "minute": "%Y-%m-%d %H:%M:00.000000",
+    "hour": "%Y-%m-%d %H:00:00.000000",
+    "day": "%Y-%m-%d 00:00:00.000000",
+}
+
+# Trend resolutions tried, finest first, when no bucket is requested
+AUTO_BUCKETS = (60, 300, 900, 3600, 6 * 3600, 86400, 7 * 86400)
+
+BUCKET_UNITS = {"m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+BUCKET_ALIASES = {"minute": "1m", "hour": "1h", "day": "1d", "week": "1w"}
+BUCKET_PATTERN = re.compile(r"^(\d+)([mhdw])$")
+
+EPOCH = datetime(1970, 1, 1)
+
+def bucket_expression(dialect_name: str, granularity: str):
+    """Return a SQL expression truncating rating created_at to a bucket start."""
+    if dialect_name == "sqlite":
+        return func.strftime(SQLITE_BUCKET_FORMATS[granularity], models.Rating.created_at)
+    return func.date_trunc(granularity, models.Rating.created_at)
+
+def rollup_statement(dialect_name: str, granularity: str, table: Table, after_id: int, through_id: int):
+    """
+    Build an INSERT ... SELECT adding a rating id range onto a rollup table.
+
+    Args:
+        dialect_name: Database dialect
+        granularity: ``minute``, ``hour`` or ``day``
+        table: Rollup table of that granularity
+        after_id: Exclusive lower rating id
+        through_id: Inclusive upper rating id
+
+    Returns:
+        Executable upsert statement
+    """
+    rating = models.Rating
+    bucket = bucket_expression(dialect_name, granularity)
+    source = (
+        select(
+            rating.project_id,
+            bucket,
+            rating.rasa,
+            func.count(),
+            func.coalesce(func.sum(rating.rating_value), 0),
+        )
+        .where(
+            rating.id > after_id,
+            rating.id <= through_id,
+            rating.project_id.is_not(None),
+            rating.created_at.is_not(None),
+        )
+        .group_by(rating.project_id, bucket, rating.rasa)
+    )
+    stmt = UPSERT_INSERTS[dialect_name](table).from_select(
+        ["project_id", "bucket_start", "rasa", "rating_count", "rating_sum"], source
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=["project_id", "bucket_start", "rasa"],
+        set_={
+            "rating_count": table.c.rating_count + stmt.excluded.rating_count,
+            "rating_sum": table.c.rating_sum + stmt.excluded.rating_sum,
+        }
+    )
+
+def watermark_statement(dialect_name: str, last_rating_id: int):
+    """Build an upsert storing the rollup watermark."""
+    table = models.RollupWatermark.__table__
+    stmt = UPSERT_INSERTS[dialect_name](table).values(
+        name=WATERMARK_NAME, last_rating_id=last_rating_id, updated_at=datetime.utcnow()
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=["name"],
+        set_={"last_rating_id": stmt.excluded.last_rating_id, "updated_at": stmt.excluded.updated_at}
+    )
+
+class RatingIdHorizon:
+    """
+    Tracks the highest rating id below which no rating can still appear.
+
+    PostgreSQL draws ids from a sequence before commit, so a transaction
+    holding a lower id can commit after a higher id is already visible.
+    The highest id observed at least ``settle_seconds`` ago is taken as
+    settled: every transaction that drew a lower id has committed or
+    rolled back by then, provided none stays open that long. SQLite runs
+    one writer at a time, so there ids appear in order and the latest id
+    is settled at once.
+
+    Args:
+        settle_seconds: How long an observed maximum id must age
+    """
+
+    def __init__(self, settle_seconds: float = 10.0):
+        self.settle_seconds = settle_seconds
+        self.settled: Optional[int] = None
+        self._observed: Deque[Tuple[float, int]] = deque()
+
+    def observe(self, latest: int) -> Optional[int]:
+        """
+        Record the current maximum id.
+
+        Args:
+            latest: Highest rating id visible now
+
+        Returns:
+            The settled id, or None until an observation has aged enough
+        """
+        now = time.monotonic()
+        self._observed.append((now, latest))
+        while self._observed and now - self._observed[0][0] >= self.settle_seconds:
+            self.settled = self._observed.popleft()[1]
+        return self.settled
+
+    async def settle(self, db: AsyncSession) -> Tuple[int, Optional[int]]:
+        """
+        Read the current maximum rating id and the settled one.
+
+        Args:
+            db: Database session
+
+        Returns:
+            The latest id and the settled id (None while not yet known)
+        """
+        latest = await db.scalar(select(func.max(models.Rating.id))) or 0
+        if db.get_bind().dialect.name == "sqlite":
+            self.settled = latest
+            return latest, latest
+        return latest, self.observe(latest)
+
+    def wait_settled(self, db: Session) -> int:
+        """
+        Read the current maximum rating id and block until it has settled.
+
+        For one-shot jobs that cannot keep observing in the background.
+
+        Args:
+            db: Sync database session
+
+        Returns:
+            The settled id
+        """
+        latest = db.scalar(select(func.max(models.Rating.id))) or 0
+        if db.get_bind().dialect.name == "sqlite":
+            self.settled = latest
+            return latest
+        self.observe(latest)
+        time.sleep(self.settle_seconds)
+        return self.observe(db.scalar(select(func.max(models.Rating.id))) or 0)
+
+async def refresh_rollups(
+    db: AsyncSession,
+    batch_size: int = 100_000,
+    through_id: Optional[int] = None
+) -> int:
+    """
+    Fold every rating above the watermark into the rollup tables.
+
+    Ratings are processed in id ranges of ``batch_size``, each committed
+    together with its watermark so an interrupted run resumes cleanly.
+    Each range is claimed by moving the watermark with a compare-and-set
+    first, so when several worker processes refresh at once only one
+    folds a given range and the others stop.
+
+    Args:
+        db: Database session on the primary
+        batch_size: Rating ids per transaction
+        through_id: Highest rating id to fold, normally the settled id
+            from a ``RatingIdHorizon``; defaults to the latest id
+
+    Returns:
+        int: Number of rating ids advanced over
+    """
+    dialect_name = db.get_bind().dialect.name
+    watermarks = models.RollupWatermark
+    await db.execute(
+        UPSERT_INSERTS[dialect_name](watermarks.__table__)
+        .values(name=WATERMARK_NAME, last_rating_id=0, updated_at=datetime.utcnow())
+        .on_conflict_do_nothing(index_elements=["name"])
+    )
+    await db.commit()
+    watermark = await db.scalar(
+        select(watermarks.last_rating_id).where(watermarks.name == WATERMARK_NAME)
+    ) or 0
+    if through_id is None:
+        through_id = await db.scalar(select(func.max(models.Rating.id))) or 0
+    start = watermark
+    while watermark < through_id:
+        through = min(watermark + batch_size, through_id)
+        claimed = await db.execute(
+            update(watermarks)
+            .where(watermarks.name == WATERMARK_NAME, watermarks.last_rating_id == watermark)
+            .values(last_rating_id=through, updated_at=datetime.utcnow())
+        )
+        if claimed.rowcount != 1:
+            await db.rollback()
+            logger.debug(f"Rollup watermark moved past {watermark} in another process")
+            break
+        for granularity, _, table in ROLLUPS:
+            await db.execute(rollup_statement(dialect_name, granularity, table, watermark, through))
+        await db.commit()
+        watermark = through
+    if watermark > start:
+        logger.debug(f"Rolled up ratings {start + 1}..{watermark}")
+    return watermark - start
+
+def rebuild_rollups(db: Session) -> None:
+    """
+    Recompute all rollup tables from the ratings table.
+
+    Args:
+        db: Sync database session; the caller commits
+    """
+    dialect_name = db.get_bind().dialect.name
+    latest = db.scalar(select(func.max(models.Rating.id))) or 0
+    for granularity, _, table in ROLLUPS:
+        db.execute(delete(table))
+        db.execute(rollup_statement(dialect_name, granularity, table, 0, latest))
+        logger.info(f"Rebuilt {table.name}")
+    db.execute(watermark_statement(dialect_name, latest))
+
+def parse_bucket(raw: str) -> int:
+    """
+    Parse a trend resolution such as ``hour``, ``15m`` or ``7d``.
+
+    Args:
+        raw: Bucket name or ``<n><m|h|d|w>``
+
+    Returns:
+        int: Bucket size in seconds
+
+    Raises:
+        ValueError: If the value is not a supported resolution
+    """
+    match = BUCKET_PATTERN.match(BUCKET_ALIASES.get(raw, raw))
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Invalid bucket {raw}. Use minute, hour, day, week or <n>m/h/d/w")
+    return int(match.group(1)) * BUCKET_UNITS[match.group(2)]
+
+def choose_rollup(bucket_seconds: int) -> Tuple[str, Table]:
+    """Return the coarsest rollup whose bucket size divides the resolution."""
+    for granularity, size, table in ROLLUPS:
+        if bucket_seconds % size == 0:
+            return granularity, table
+    raise ValueError("Bucket must be a whole number of minutes")
+
+def to_naive_utc(moment: datetime) -> datetime:
+    """Convert an aware datetime to naive UTC, matching stored created_at values."""
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+def _floor(moment: datetime, bucket_seconds: int) -> datetime:
+    """Align a time to the start of its bucket (buckets count from the Unix epoch)."""
+    offset = int((moment - EPOCH).total_seconds()) // bucket_seconds * bucket_seconds
+    return EPOCH + timedelta(seconds=offset)
+
+def resolve_bucket(
+    bucket: Optional[str],
+    start: datetime,
+    end: datetime,
+    max_points: int
+) -> int:
+    """
+    Pick the trend resolution for a time range.
+
+    Args:
+        bucket: Requested resolution, or None to choose automatically
+        start: Range start
+        end: Range end
+        max_points: Largest number of buckets a response may contain
+
+    Returns:
+        int: Bucket size in seconds
+
+    Raises:
+        ValueError: If the range is empty or the resolution yields too many buckets
+    """
+    if end <= start:
+        raise ValueError("'to' must be after 'from'")
+    span = (end - start).total_seconds()
+    if bucket is None:
+        for candidate in AUTO_BUCKETS:
+            if span / candidate <= max_points:
+                return candidate
+        return AUTO_BUCKETS[-1] * math.ceil(span / (AUTO_BUCKETS[-1] * max_points))
+    bucket_seconds = parse_bucket(bucket)
+    if span / bucket_seconds > max_points:
+        raise ValueError(f"Range holds more than {max_points} buckets of {bucket}; use a coarser bucket")
+    return bucket_seconds
+
+async def get_trend(
+    db: AsyncSession,
+    project_id: int,
+    start: datetime,
+    end: datetime,
+    bucket_seconds: int
+) -> Dict[str, Any]:
+    """
+    Read a project's rasa mix over time from the rollups.
+
+    Args:
+        db: Database session
+        project_id: Project ID
+        start: Range start, rounded down to the bucket
+        end: Range end (exclusive)
+        bucket_seconds: Resolution in seconds
+
+    Returns:
+        Dict with the rollup used and one point per non-empty bucket
+    """
+    granularity, table = choose_rollup(bucket_seconds)
+    start = _floor(start, bucket_seconds)
+    result = await db.execute(
+        select(table.c.bucket_start, table.c.rasa, table.c.rating_count, table.c.rating_sum)
+        .where(table.c.project_id == project_id, table.c.bucket_start >= start, table.c.bucket_start < end)
+        .order_by(table.c.bucket_start)
+    )
+
+    points: Dict[datetime, Dict[str, Any]] = {}
+    for bucket_start, rasa, count, total in result:
+        point_start = _floor(bucket_start, bucket_seconds)
+        point = points.get(point_start)
+        if point is None:
+            point = points[point_start] = {"start": point_start, "total": 0, "rasas": {}}
+        point["total"] += count
+        stats = point["rasas"].setdefault(rasa.value, {"count": 0, "sum": 0})
+        stats["count"] += count
+        stats["sum"] += total
+
+    for point in points.values():
+        for stats in point["rasas"].values():
+            stats["mean"] = stats.pop("sum") / stats["count"] if stats["count"] else None
+    watermark = await db.scalar(
+        select(models.RollupWatermark.last_rating_id).where(models.RollupWatermark.name == WATERMARK_NAME)
+    )
+    return {
+        "project_id": project_id,
+        "bucket_seconds": bucket_seconds,
+        "rollup": granularity,
+        "from": start,
+        "to": end,
+        "as_of_rating_id": watermark or 0,
+        "points": list(points.values()),
+    }
+
+class RollupScheduler:
+    """
+    Background task refreshing the rollups at a fixed interval.
+
+    Args:
+        session_factory: Callable returning an async session context manager
+        interval_seconds: Pause between refresh passes
+        batch_size: Rating ids per transaction
+        settle_seconds: Age at which an observed maximum rating id is folded
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncContextManager[AsyncSession]],
+        interval_seconds: float = 10.0,
+        batch_size: int = 100_000,
+        settle_seconds: float = 10.0
+    ):
+        self.session_factory = session_factory
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.horizon = RatingIdHorizon(settle_seconds)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start the refresh loop on the running loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info("Rollup scheduler started")
+
+    async def stop(self) -> None:
+        """Cancel the refresh loop."""
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _run(self) -> None:
+        """Refresh, then sleep, until cancelled; failures are logged and retried."""
+        while True:
+            try:
+                async with self.session_factory() as db:
+                    _, settled = await self.horizon.settle(db)
+                    if settled is not None:
+                        await refresh_rollups(db, self.batch_size, settled)
+            except Exception as e:
+                logger.error(f"Rollup refresh failed: {e}", exc_info=True)
+            await asyncio.sleep(self.interval_seconds)
+
+# Process-wide scheduler, created on startup when rollups are enabled
+rollup_scheduler: Optional[RollupScheduler] = None
+
+def start_rollup_scheduler() -> None:
+    """Create and start the process-wide scheduler if enabled in settings."""
+    global rollup_scheduler
+    settings = get_settings()
+    if not settings.rollup_enabled:
+        return
+    from database import get_async_db
+
+    rollup_scheduler = RollupScheduler(
+        get_async_db,
+        interval_seconds=settings.rollup_interval_seconds,
+        batch_size=settings.rollup_batch_size,
+        settle_seconds=settings.rating_id_settle_seconds,
+    )
+    rollup_scheduler.start()
+
+async def stop_rollup_scheduler() -> None:
+    """Stop the process-wide scheduler if it is running."""
+    if rollup_scheduler is not None:
+        await rollup_scheduler.stop()
+
+def main() -> None:
+    """Command line entry point for rollup maintenance."""
+    from config import init_logging
+    from database import get_db
+
+    parser = argparse.ArgumentParser(description="Maintain RMS rating rollups")
+    parser.add_argument("command", choices=["rebuild"], help="Maintenance command to run")
+    parser.parse_args()
+
+    init_logging()
+    with get_db() as db:
+        rebuild_rollups(db)
+
+if __name__ == "__main__":
+    main()
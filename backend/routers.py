@@ -4,15 +4,42 @@ API routers for the RMS application.
 This module contains FastAPI routers for handling different API endpoints
 including projects, ratings, and user management.
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Path, Query, Request, Response, WebSocket, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import List, Optional, Tuple, Union
+import asyncio
 import logging
-from datetime import datetime
-from pydantic import BaseModel
+import uuid
+from contextlib import suppress
+from datetime import datetime, timedelta
+from pydantic import BaseModel, Field
+from starlette.requests import ClientDisconnect
 
 import models
-from database import get_db_session
+import admission
+import aggregates
+import auth
+import export
+import ingest
+import live
+import media
+import media_jobs
+import pagination
+import project_detail
+import rollups
+import schemas
+import search
+import similarity
+import sketches
+import snapshot
+import write_buffer
+from cache import CONTENT_SCOPE, PROJECTS_SCOPE, RATINGS_SCOPE, project_scope, response_cache
+from database import get_db_session, get_read_session, get_write_session
 from config import get_settings
 
 # Configure logging
@@ -25,44 +52,131 @@ class ProjectCreate(BaseModel):
     description: Optional[str] = None
     expected_rasa: Optional[str] = "SHRINGARA"
 
+class UploadCreate(BaseModel):
+    """Schema for starting a media upload, for an existing or a new content item."""
+    content_type: str
+    size: int = Field(..., ge=1)
+    filename: Optional[str] = Field(None, max_length=255)
+    content_item_id: Optional[int] = None
+    project_id: Optional[int] = None
+    title: Optional[str] = Field(None, max_length=255)
+
+class MediaJobCreate(BaseModel):
+    """Schema for a media reprocessing request."""
+    content_item_id: int
+    force: bool = False
+
 class RatingCreate(BaseModel):
     """Schema for rating creation request."""
     project_id: int
+    content_item_id: Optional[int] = None
     rasa: str
-    rating_value: int
+    rating_value: int = Field(..., ge=1, le=10)
     feedback: Optional[str] = None
 
+class QueuedRating(RatingCreate):
+    """A rating queued for write-behind together with its authenticated rater."""
+    user_id: Optional[int] = None
+
+class UserCreate(BaseModel):
+    """Schema for user registration request."""
+    username: str = Field(..., min_length=3, max_length=50)
+    email: str = Field(..., max_length=100, pattern=r"^[^@\s]+@[^@\s]+$")
+    password: str = Field(..., min_length=8, max_length=128)
+
+USER_COLUMNS = (
+    models.User.id, models.User.username, models.User.email,
+    models.User.is_active, models.User.is_admin, models.User.created_at,
+)
+
 # Create routers
 projects_router = APIRouter(prefix="/projects", tags=["Projects"])
 ratings_router = APIRouter(prefix="/ratings", tags=["Ratings"])
 users_router = APIRouter(prefix="/users", tags=["Users"])
+search_router = APIRouter(prefix="/search", tags=["Search"])
+uploads_router = APIRouter(prefix="/uploads", tags=["Uploads"])
+media_router = APIRouter(prefix="/media", tags=["Media"])
+media_jobs_router = APIRouter(prefix="/media-jobs", tags=["Media jobs"])
+content_items_router = APIRouter(prefix="/content-items", tags=["Content items"])
+
+async def _keyset_page(db: AsyncSession, query, id_column, cursor: str, limit: int) -> dict:
+    """Fetch one keyset page, mapping malformed cursors to a 400."""
+    try:
+        return await pagination.fetch_keyset_page(db, query, id_column, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+async def _read_body(request: Request, max_bytes: int) -> bytes:
+    """
+    Read a request body, refusing it as soon as it is known to exceed ``max_bytes``.
+
+    Raises:
+        HTTPException: 413 if the declared or received size is too large
+    """
+    too_large = HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Request body exceeds {max_bytes} bytes"
+    )
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise too_large
+    chunks, received = [], 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > max_bytes:
+            raise too_large
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+async def _titles(db: AsyncSession, model, ids: List[int]) -> dict:
+    """Look up the titles of a page of projects or content items by id."""
+    if not ids:
+        return {}
+    result = await db.execute(select(model.id, model.title).where(model.id.in_(ids)))
+    return {row.id: row.title for row in result}
 
 # Project endpoints
-@projects_router.get("/")
+@projects_router.get("/", response_model=Union[List[schemas.ProjectOut], schemas.ProjectPage])
 async def get_projects(
-    skip: int = 0,
-    limit: int = 10,
-    db: Session = Depends(get_db_session)
+    request: Request,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_session)
 ):
     """
     Get list of projects with pagination.
     
+    Passing ``cursor`` (empty for the first page) switches to keyset
+    pagination, which returns ``{"items": [...], "next_cursor": ...}``.
+    
     Args:
+        request: Incoming request, used for response caching
         skip: Number of records to skip
         limit: Maximum number of records to return
+        cursor: Opaque cursor from a previous page
         db: Database session
     
     Returns:
-        List of projects
+        List of projects, or a keyset page when a cursor is given
     """
-    logger.info(f"Fetching projects with skip={skip}, limit={limit}")
-    projects = db.query(models.Project).offset(skip).limit(limit).all()
-    return projects
+    logger.debug(f"Fetching projects with skip={skip}, limit={limit}")
+    scopes = (PROJECTS_SCOPE,)
+    cached = response_cache.respond(request, scopes)
+    if cached is not None:
+        return cached
+    versions = response_cache.versions(scopes)
+    query = select(*schemas.PROJECT_COLUMNS)
+    if cursor is not None:
+        page = await _keyset_page(db, query, models.Project.id, cursor, limit)
+        return response_cache.store(request, versions, page)
+    result = await db.execute(query.offset(skip).limit(limit))
+    return response_cache.store(request, versions, schemas.rows_to_dicts(result))
 
-@projects_router.post("/", status_code=status.HTTP_201_CREATED)
+@projects_router.post("/", response_model=schemas.ProjectOut, status_code=status.HTTP_201_CREATED)
 async def create_project(
     project: ProjectCreate,
-    db: Session = Depends(get_db_session)
+    db: AsyncSession = Depends(get_write_session)
 ):
     """
     Create a new project.
@@ -89,54 +203,485 @@ async def create_project(
         expected_rasa=rasa_enum
     )
     db.add(db_project)
-    db.commit()
-    db.refresh(db_project)
+    await db.commit()
+    response_cache.invalidate(PROJECTS_SCOPE)
+    await db.refresh(db_project)
     return db_project
 
+@projects_router.get("/divergence")
+async def get_divergent_projects(
+    limit: int = Query(10, ge=1, le=100),
+    min_ratings: int = Query(1, ge=1),
+    db: AsyncSession = Depends(get_read_session)
+):
+    """
+    List the projects whose audience response strays furthest from their expected rasa.
+    
+    Answered from the in-memory similarity index, refreshed from the
+    aggregates when it is older than ``similarity_refresh_seconds``.
+    
+    Args:
+        limit: Most projects returned
+        min_ratings: Skip projects with fewer ratings
+        db: Database session
+    
+    Returns:
+        Projects ranked by divergence, with their dominant rasa and distribution
+    """
+    index = similarity.similarity_index
+    await index.ensure_fresh(db)
+    results = index.divergent_projects(limit, min_ratings)
+    titles = await _titles(db, models.Project, [result["project_id"] for result in results])
+    for result in results:
+        result["title"] = titles.get(result["project_id"])
+    return {"as_of_rating_id": index.last_rating_id, "results": results}
+
+@projects_router.get("/{project_id}")
+async def get_project(
+    project_id: int,
+    request: Request,
+    include: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_session)
+):
+    """
+    Get a project with optional related data.
+    
+    ``include`` takes a comma-separated list of ``creator``,
+    ``content_items``, ``content_items.philosophical_analysis`` and
+    ``rating_summary``. ``fields`` restricts the returned attributes, e.g.
+    ``title,content_items.title``; ``id`` is always returned.
+    
+    Args:
+        project_id: Project ID
+        request: Incoming request, used for response caching
+        include: Related data to embed
+        fields: Sparse fieldset
+        db: Database session
+    
+    Returns:
+        Project with the requested includes
+    """
+    logger.debug(f"Fetching project {project_id} with include={include}")
+    try:
+        includes = project_detail.parse_includes(include)
+        selected = project_detail.parse_fields(fields, includes)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    scopes = (PROJECTS_SCOPE, project_scope(project_id))
+    cached = response_cache.respond(request, scopes)
+    if cached is not None:
+        return cached
+    versions = response_cache.versions(scopes)
+    detail = await project_detail.get_project_detail(db, project_id, includes, selected)
+    if detail is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Project with id {project_id} not found"
+        )
+    return response_cache.store(request, versions, detail)
+
+@projects_router.get("/{project_id}/rasa-summary")
+async def get_project_rasa_summary(
+    project_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_read_session)
+):
+    """
+    Get the Navarasa rating distribution for a project.
+    
+    Reads the pre-aggregated project_rasa_stats rows rather than the
+    ratings themselves, so the cost does not grow with rating volume.
+    
+    Args:
+        project_id: Project ID
+        request: Incoming request, used for response caching
+        db: Database session
+    
+    Returns:
+        Per-rasa counts, shares and mean ratings plus the expected-rasa match rate
+    """
+    logger.debug(f"Fetching rasa summary for project {project_id}")
+    scopes = (project_scope(project_id),)
+    cached = response_cache.respond(request, scopes)
+    if cached is not None:
+        return cached
+    versions = response_cache.versions(scopes)
+    project = await db.get(models.Project, project_id)
+    if not project:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Project with id {project_id} not found"
+        )
+    summary = await aggregates.get_project_summary(db, project)
+    return response_cache.store(request, versions, summary)
+
+@projects_router.get("/{project_id}/trend")
+async def get_project_trend(
+    project_id: int,
+    bucket: Optional[str] = None,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    db: AsyncSession = Depends(get_read_session)
+):
+    """
+    Get a project's rasa mix over time.
+    
+    Reads the coarsest minute/hour/day rollup that divides the requested
+    resolution. Without ``bucket`` the finest resolution that stays within
+    ``trend_max_points`` buckets is chosen. Rollups trail new ratings by up
+    to ``rollup_interval_seconds``; ``as_of_rating_id`` tells how far.
+    
+    Args:
+        project_id: Project ID
+        bucket: Resolution: minute, hour, day, week or <n>m/h/d/w
+        start: Range start (``from``), defaults to ``trend_default_days`` ago
+        end: Range end (``to``, exclusive), defaults to now
+        db: Database session
+    
+    Returns:
+        Per-bucket rating totals with counts and means per rasa
+    """
+    settings = get_settings()
+    end = rollups.to_naive_utc(end) if end else datetime.utcnow()
+    start = rollups.to_naive_utc(start) if start else end - timedelta(days=settings.trend_default_days)
+    try:
+        bucket_seconds = rollups.resolve_bucket(bucket, start, end, settings.trend_max_points)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    logger.debug(f"Fetching trend for project {project_id} at {bucket_seconds}s buckets")
+    if await db.get(models.Project, project_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Project with id {project_id} not found"
+        )
+    return await rollups.get_trend(db, project_id, start, end, bucket_seconds)
+
+def _parse_quantiles(raw: str) -> List[float]:
+    """Parse a comma-separated list of quantiles in [0, 1]."""
+    try:
+        quantiles = [float(part) for part in raw.split(",") if part.strip()]
+    except ValueError:
+        quantiles = None
+    if not quantiles or any(not 0 <= q <= 1 for q in quantiles):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="quantiles must be comma-separated numbers between 0 and 1"
+        )
+    return quantiles
+
+def _sketch_range(
+    since: Optional[datetime],
+    until: Optional[datetime]
+) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Convert a since/until range to naive UTC, rejecting one that ends before it starts."""
+    since = rollups.to_naive_utc(since) if since else None
+    until = rollups.to_naive_utc(until) if until else None
+    if since is not None and until is not None and since > until:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="since must not be later than until"
+        )
+    return since, until
+
+@projects_router.get("/{project_id}/rater-stats")
+async def get_project_rater_stats(
+    project_id: int,
+    request: Request,
+    quantiles: str = "0.5,0.9",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_read_session)
+):
+    """
+    Get approximate unique raters and rating quantiles for a project.
+    
+    Served from the per-day, per-rasa sketches, so the cost does not grow
+    with rating volume. Unique rater counts carry the HyperLogLog relative
+    error reported in ``error_bounds``; quantiles are exact.
+    
+    Args:
+        project_id: Project ID
+        request: Incoming request, used for response caching
+        quantiles: Comma-separated rating_value quantiles to report
+        since: Only count ratings from this day on (UTC)
+        until: Only count ratings up to and including this day (UTC)
+        db: Database session
+    
+    Returns:
+        Unique raters overall and per rasa, quantiles per rasa and error bounds
+    """
+    logger.debug(f"Fetching rater stats for project {project_id}")
+    parsed = _parse_quantiles(quantiles)
+    since, until = _sketch_range(since, until)
+    scopes = (project_scope(project_id),)
+    cached = response_cache.respond(request, scopes)
+    if cached is not None:
+        return cached
+    versions = response_cache.versions(scopes)
+    if await db.get(models.Project, project_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Project with id {project_id} not found"
+        )
+    merged = await sketches.load_sketches(db, models.ProjectRasaSketch, "project_id", [project_id], since, until)
+    stats = {"project_id": project_id, **sketches.describe_sketches(merged, parsed)}
+    return response_cache.store(request, versions, stats)
+
+async def _live_subscription(project_id: int):
+    """Check a project and open a live subscription, mapping failures to HTTP errors."""
+    hub = live.live_hub
+    if hub is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Live updates are disabled")
+    if not await hub.project_exists(project_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Project with id {project_id} not found"
+        )
+    try:
+        return hub.subscribe(project_id)
+    except live.SubscriberLimitError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+
+@projects_router.get("/{project_id}/live")
+async def stream_project_live(project_id: int):
+    """
+    Stream a project's Navarasa distribution as Server-Sent Events.
+    
+    The current distribution is sent first, then an update whenever new
+    ratings land, coalesced to at most ``live_max_updates_per_second``.
+    No database session is held while the stream is open.
+    
+    Args:
+        project_id: Project ID
+    
+    Returns:
+        ``text/event-stream`` response of ``rasa-summary`` events
+    """
+    logger.info(f"Opening live stream for project {project_id}")
+    updates = await _live_subscription(project_id)
+    return StreamingResponse(
+        live.sse_events(updates),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@projects_router.websocket("/{project_id}/live/ws")
+async def project_live_socket(websocket: WebSocket, project_id: int):
+    """
+    WebSocket equivalent of the live SSE stream.
+    
+    Sends ``{"type": "rasa-summary", "version": ..., "data": ...}``
+    messages and periodic ``{"type": "heartbeat"}`` keep-alives.
+    
+    Args:
+        websocket: Client connection
+        project_id: Project ID
+    """
+    try:
+        updates = await _live_subscription(project_id)
+    except HTTPException as e:
+        logger.warning(f"Rejecting live socket for project {project_id}: {e.detail}")
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=e.detail)
+        return
+    await websocket.accept()
+
+    async def pump():
+        async for frame in updates:
+            await websocket.send_text(frame.message if frame is not None else live.WS_HEARTBEAT)
+
+    sender = asyncio.create_task(pump())
+    try:
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    finally:
+        sender.cancel()
+        with suppress(asyncio.CancelledError, Exception):
+            await sender
+
 # Rating endpoints
-@ratings_router.get("/")
+@ratings_router.get("/", response_model=Union[List[schemas.RatingOut], schemas.RatingPage])
 async def get_ratings(
+    request: Request,
     project_id: Optional[int] = None,
-    skip: int = 0,
-    limit: int = 10,
-    db: Session = Depends(get_db_session)
+    skip: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_session)
 ):
     """
     Get list of ratings with optional project filter.
     
+    Passing ``cursor`` (empty for the first page) switches to keyset
+    pagination, which returns ``{"items": [...], "next_cursor": ...}``.
+    
     Args:
+        request: Incoming request, used for response caching
         project_id: Optional project ID to filter ratings
         skip: Number of records to skip
         limit: Maximum number of records to return
+        cursor: Opaque cursor from a previous page
         db: Database session
     
     Returns:
-        List of ratings
+        List of ratings, or a keyset page when a cursor is given
     """
-    logger.info(f"Fetching ratings for project_id={project_id}")
-    query = db.query(models.Rating)
+    logger.debug(f"Fetching ratings for project_id={project_id}")
+    scopes = (project_scope(project_id),) if project_id else (RATINGS_SCOPE,)
+    cached = response_cache.respond(request, scopes)
+    if cached is not None:
+        return cached
+    versions = response_cache.versions(scopes)
+    query = select(*schemas.RATING_COLUMNS)
     if project_id:
-        query = query.filter(models.Rating.project_id == project_id)
-    return query.offset(skip).limit(limit).all()
+        query = query.where(models.Rating.project_id == project_id)
+    if cursor is not None:
+        page = await _keyset_page(db, query, models.Rating.id, cursor, limit)
+        return response_cache.store(request, versions, page)
+    result = await db.execute(query.offset(skip).limit(limit))
+    return response_cache.store(request, versions, schemas.rows_to_dicts(result))
+
+@ratings_router.get("/rater-stats")
+async def get_merged_rater_stats(
+    request: Request,
+    project_id: List[int] = Query([]),
+    content_item_id: List[int] = Query([]),
+    quantiles: str = "0.5,0.9",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_read_session)
+):
+    """
+    Get unique raters and rating quantiles merged across several projects or content items.
+    
+    Sketches merge without double counting raters shared between them
+    or between days. Pass either ``project_id`` or ``content_item_id``,
+    each repeatable.
+    
+    Args:
+        request: Incoming request, used for response caching
+        project_id: Projects to merge
+        content_item_id: Content items to merge
+        quantiles: Comma-separated rating_value quantiles to report
+        since: Only count ratings from this day on (UTC)
+        until: Only count ratings up to and including this day (UTC)
+        db: Database session
+    
+    Returns:
+        Unique raters overall and per rasa, quantiles per rasa and error bounds
+    """
+    if bool(project_id) == bool(content_item_id):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Pass project_id or content_item_id, but not both"
+        )
+    parsed = _parse_quantiles(quantiles)
+    since, until = _sketch_range(since, until)
+    logger.debug(f"Fetching merged rater stats for projects={project_id} content_items={content_item_id}")
+    scopes = (RATINGS_SCOPE,)
+    cached = response_cache.respond(request, scopes)
+    if cached is not None:
+        return cached
+    versions = response_cache.versions(scopes)
+    if project_id:
+        merged = await sketches.load_sketches(db, models.ProjectRasaSketch, "project_id", project_id, since, until)
+        stats = {"project_ids": sorted(set(project_id))}
+    else:
+        merged = await sketches.load_sketches(db, models.ContentItemRasaSketch, "content_item_id", content_item_id, since, until)
+        stats = {"content_item_ids": sorted(set(content_item_id))}
+    stats.update(sketches.describe_sketches(merged, parsed))
+    return response_cache.store(request, versions, stats)
+
+@ratings_router.get("/export")
+async def export_ratings(
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    project_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    after_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_read_session)
+):
+    """
+    Stream ratings as NDJSON or CSV.
+    
+    Rows are read through a server-side cursor and ordered by id, so an
+    interrupted export resumes by passing the last received id as
+    ``after_id``.
+    
+    Args:
+        export_format: ``ndjson`` (default) or ``csv``
+        project_id: Optional project ID to filter ratings
+        since: Only include ratings created at or after this time
+        after_id: Resume after this rating id
+        db: Database session
+    
+    Returns:
+        Streaming response with the encoded ratings
+    """
+    logger.info(f"Exporting ratings as {export_format} for project_id={project_id}")
+    query = export.build_export_query(project_id=project_id, since=since, after_id=after_id)
+    return StreamingResponse(
+        export.stream_export(db, query, export_format),
+        media_type=export.MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="ratings.{export_format}"'}
+    )
+
+@ratings_router.post("/snapshot")
+def create_ratings_snapshot(
+    db: Session = Depends(get_db_session)
+):
+    """
+    Append new ratings to the Parquet analytics snapshot.
+    
+    Runs in the threadpool with a sync session because the Parquet writer
+    does blocking file I/O. Outside SQLite it first waits for the highest
+    rating id to settle.
+    
+    Args:
+        db: Sync database session
+    
+    Returns:
+        Rows written and the previous and new watermarks
+    """
+    settings = get_settings()
+    logger.info(f"Writing ratings snapshot to {settings.snapshot_dir}")
+    try:
+        return snapshot.write_snapshot(
+            db,
+            settings.snapshot_dir,
+            batch_size=settings.snapshot_batch_size,
+            settle_seconds=settings.rating_id_settle_seconds
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
 
-@ratings_router.post("/", status_code=status.HTTP_201_CREATED)
+@ratings_router.post("/", response_model=schemas.RatingOut, status_code=status.HTTP_201_CREATED)
 async def create_rating(
     rating: RatingCreate,
-    db: Session = Depends(get_db_session)
+    db: AsyncSession = Depends(get_write_session),
+    principal: Optional[auth.Principal] = Depends(auth.get_optional_user)
 ):
     """
     Create a new rating for a project.
     
+    With write-behind enabled the rating is queued for a group commit and
+    the response is 202 with an acknowledgement id instead of the rating.
+    Ratings sent with a bearer token are attributed to its user.
+    
     Args:
         rating: Rating creation data
         db: Database session
+        principal: Authenticated user, None for anonymous ratings
     
     Returns:
-        Created rating
+        Created rating, or an acknowledgement when write-behind is enabled
     """
-    logger.info(f"Creating new rating for project {rating.project_id}")
+    logger.debug(f"Creating new rating for project {rating.project_id}")
+    admission.limit_project(rating.project_id)
+    if write_buffer.rating_buffer is not None:
+        queued = QueuedRating(**rating.model_dump(), user_id=principal.id if principal else None)
+        return await _enqueue_rating(write_buffer.rating_buffer, queued)
     # Verify project exists
-    project = db.query(models.Project).filter(models.Project.id == rating.project_id).first()
+    project = await db.get(models.Project, rating.project_id)
     if not project:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -151,43 +696,743 @@ async def create_rating(
             detail=f"Invalid rasa value. Must be one of: {', '.join(models.Rasa.__members__.keys())}"
         )
 
+    if rating.content_item_id is not None:
+        content_item = await db.get(models.ContentItem, rating.content_item_id)
+        if not content_item or content_item.project_id != rating.project_id:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Content item {rating.content_item_id} not found in project {rating.project_id}"
+            )
+
     db_rating = models.Rating(
         project_id=rating.project_id,
+        content_item_id=rating.content_item_id,
         rasa=rasa_enum,
         rating_value=rating.rating_value,
-        feedback=rating.feedback
+        feedback=rating.feedback,
+        user_id=principal.id if principal else None
     )
     db.add(db_rating)
-    db.commit()
-    db.refresh(db_rating)
+    await aggregates.apply_ratings(db, [{
+        "project_id": rating.project_id,
+        "content_item_id": rating.content_item_id,
+        "rasa": rasa_enum,
+        "rating_value": rating.rating_value,
+        "user_id": db_rating.user_id,
+    }])
+    await db.commit()
+    response_cache.invalidate(RATINGS_SCOPE, project_scope(rating.project_id))
+    live.notify_ratings(rating.project_id)
+    await db.refresh(db_rating)
     return db_rating
 
-# User endpoints
-@users_router.get("/me")
-async def get_current_user():
-    """Get current user profile."""
-    # TODO: Implement user authentication
-    return {"message": "Current user profile"}
+@ratings_router.post("/batch", status_code=status.HTTP_201_CREATED)
+async def create_ratings_batch(
+    request: Request,
+    db: AsyncSession = Depends(get_write_session),
+    principal: Optional[auth.Principal] = Depends(auth.get_optional_user)
+):
+    """
+    Create many ratings in a single transaction.
+
+    Accepts a JSON array of rating objects, or NDJSON when sent with an
+    ``application/x-ndjson`` content type. Invalid rows are reported and
+    skipped; the remaining rows are inserted.
+
+    Args:
+        request: Incoming request carrying the batch body
+        db: Database session
+        principal: Authenticated user the ratings are attributed to, if any
+
+    Returns:
+        Counts of inserted and rejected rows with per-row errors
+    """
+    settings = get_settings()
+    body = await _read_body(request, settings.rating_batch_max_bytes)
+    try:
+        records, errors = ingest.parse_payload(body, request.headers.get("content-type"))
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid batch body: {e}"
+        )
+    if len(records) + len(errors) > settings.rating_batch_max_rows:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch exceeds {settings.rating_batch_max_rows} rows"
+        )
+
+    logger.info(f"Creating rating batch of {len(records) + len(errors)} rows")
+    ratings, validation_errors = ingest.validate_records(records, RatingCreate)
+    # A batch counts as one write against each project it touches
+    for project_id in sorted({rating.project_id for _, rating in ratings}):
+        admission.limit_project(project_id)
+    rows, row_errors = await ingest.build_rating_rows(db, ratings)
+    if principal is not None:
+        for row in rows:
+            row["user_id"] = principal.id
+    inserted = await ingest.insert_ratings(db, rows)
+    await db.commit()
+    if rows:
+        project_ids = {row["project_id"] for row in rows}
+        response_cache.invalidate(RATINGS_SCOPE, *(project_scope(project_id) for project_id in project_ids))
+        live.notify_ratings(*project_ids)
+
+    errors = sorted(errors + validation_errors + row_errors, key=lambda e: e["index"])
+    return {"inserted": inserted, "failed": len(errors), "errors": errors}
+
+async def _enqueue_rating(buffer: write_buffer.RatingWriteBuffer, rating: RatingCreate) -> JSONResponse:
+    """Validate a rating without touching the database and queue it."""
+    if rating.rasa.upper() not in models.Rasa.__members__:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid rasa value. Must be one of: {', '.join(models.Rasa.__members__.keys())}"
+        )
+    try:
+        ack_id = await buffer.submit(rating)
+    except write_buffer.BufferFullError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "1"}
+        )
+    location = f"{get_settings().api_prefix}/ratings/acks/{ack_id}"
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={"ack_id": ack_id, "status": write_buffer.QUEUED, "status_url": location},
+        headers={"Location": location}
+    )
+
+@ratings_router.get("/acks/{ack_id}")
+async def get_rating_ack(ack_id: str):
+    """
+    Get the status of a rating queued by the write-behind buffer.
+    
+    Args:
+        ack_id: Acknowledgement id returned by create_rating
+    
+    Returns:
+        Status (queued, committed or failed) and queue depth
+    """
+    buffer = write_buffer.rating_buffer
+    ack = buffer.status(ack_id) if buffer is not None else None
+    if ack is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Acknowledgement {ack_id} not found"
+        )
+    return {"ack_id": ack_id, **ack, "queue_depth": buffer.depth}
 
+# User endpoints
 @users_router.post("/register", status_code=status.HTTP_201_CREATED)
 async def register_user(
-    username: str,
-    email: str,
-    password: str,
-    db: Session = Depends(get_db_session)
+    user: UserCreate,
+    db: AsyncSession = Depends(get_write_session)
 ):
     """
     Register a new user.
     
     Args:
-        username: Username
-        email: Email address
-        password: Password
+        user: Username, email and password
         db: Database session
     
     Returns:
         Created user
     """
-    logger.info(f"Registering new user: {username}")
-    # TODO: Implement password hashing and user creation
-    return {"message": "User registration endpoint"}
+    logger.info(f"Registering new user: {user.username}")
+    taken = (await db.execute(
+        select(models.User.id).where(or_(models.User.username == user.username, models.User.email == user.email))
+    )).first()
+    if taken is not None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Username or email is already registered"
+        )
+    db_user = models.User(
+        username=user.username,
+        email=user.email,
+        hashed_password=await auth.hash_password(user.password)
+    )
+    db.add(db_user)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Lost a race with a concurrent registration
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Username or email is already registered"
+        )
+    return {column.key: getattr(db_user, column.key) for column in USER_COLUMNS}
+
+@users_router.post("/login")
+async def login(
+    form: OAuth2PasswordRequestForm = Depends(),
+    db: AsyncSession = Depends(get_write_session)
+):
+    """
+    Exchange a username and password for a bearer token.
+    
+    Args:
+        form: OAuth2 password form with username and password
+        db: Database session
+    
+    Returns:
+        Access token, token type and lifetime in seconds
+    """
+    user = (await db.execute(
+        select(models.User).where(models.User.username == form.username)
+    )).scalar_one_or_none()
+    valid, new_hash = await auth.verify_password(form.password, user.hashed_password if user else None)
+    if not valid or not user.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect username or password",
+            headers=auth.BEARER_CHALLENGE
+        )
+    if new_hash is not None:
+        user.hashed_password = new_hash
+        await db.commit()
+    token, expires_in = auth.create_access_token(user.id)
+    return {"access_token": token, "token_type": "bearer", "expires_in": expires_in}
+
+@users_router.get("/me")
+async def get_current_user(
+    principal: auth.Principal = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_read_session)
+):
+    """
+    Get current user profile.
+    
+    Args:
+        principal: Authenticated user
+        db: Database session
+    
+    Returns:
+        The user's profile
+    """
+    row = (await db.execute(select(*USER_COLUMNS).where(models.User.id == principal.id))).first()
+    if row is None:
+        # Deleted after its principal was cached
+        auth.principal_cache.invalidate(principal.id)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User is inactive or does not exist",
+            headers=auth.BEARER_CHALLENGE
+        )
+    return row._asdict()
+
+@users_router.post("/{user_id}/deactivate", status_code=status.HTTP_204_NO_CONTENT)
+async def deactivate_user(
+    user_id: int,
+    principal: auth.Principal = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_write_session)
+):
+    """
+    Deactivate a user; their tokens stop working immediately in this process.
+    
+    Args:
+        user_id: User to deactivate; users may deactivate themselves, admins anyone
+        principal: Authenticated user
+        db: Database session
+    """
+    if principal.id != user_id and not principal.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins can deactivate other users"
+        )
+    user = await db.get(models.User, user_id)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"User with id {user_id} not found"
+        )
+    user.is_active = False
+    await db.commit()
+    auth.principal_cache.invalidate(user_id)
+    logger.info(f"User {user_id} deactivated by {principal.id}")
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+# Search endpoints
+@search_router.get("/")
+async def search_documents(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    type: Optional[str] = None,
+    cursor: str = "",
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_session)
+):
+    """
+    Full-text search over project titles and descriptions, content item
+    titles and rating feedback.
+    
+    Terms are ANDed and a trailing ``*`` makes a term a prefix match.
+    Results come best match first, in keyset pages.
+    
+    Args:
+        request: Incoming request, used for response caching
+        q: Query text
+        type: Comma-separated document types: project, content_item, rating
+        cursor: Cursor from a previous page, empty for the first page
+        limit: Maximum number of results
+        db: Database session
+    
+    Returns:
+        Results with type, id, project_id, title, snippet and rank, and the ``next_cursor``
+    """
+    types = sorted({part.strip() for part in type.split(",") if part.strip()}) if type else []
+    unknown = set(types) - set(search.DOC_TYPES)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown search types: {', '.join(sorted(unknown))}"
+        )
+    try:
+        after = pagination.decode_token(cursor)
+        after = (float(after["score"]), int(after["id"])) if after is not None else None
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid cursor: {cursor}")
+    logger.debug(f"Searching for {q!r} in {types or 'all types'}")
+    # Content items are indexed too, so content writes invalidate search
+    scopes = (PROJECTS_SCOPE, RATINGS_SCOPE, CONTENT_SCOPE)
+    cached = response_cache.respond(request, scopes)
+    if cached is not None:
+        return cached
+    versions = response_cache.versions(scopes)
+    try:
+        items, next_after = await search.search(db, q, types, after, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    next_cursor = (
+        pagination.encode_token({"score": next_after[0], "id": next_after[1]}) if next_after else None
+    )
+    return response_cache.store(request, versions, {"items": items, "next_cursor": next_cursor})
+
+# Upload endpoints
+def _upload_status(upload: models.Upload, received: int) -> JSONResponse:
+    """Describe an upload, with its offset also in the Upload-Offset header."""
+    return JSONResponse(
+        {
+            "id": upload.id,
+            "content_item_id": upload.content_item_id,
+            "content_type": upload.content_type,
+            "size": upload.size,
+            "offset": received,
+            "complete": upload.completed_at is not None,
+            "sha256": upload.sha256,
+            "url": media.media_url(upload.sha256) if upload.sha256 else None,
+        },
+        headers={"Upload-Offset": str(received), "Location": f"/api/v1/uploads/{upload.id}"},
+    )
+
+async def _get_upload(db: AsyncSession, upload_id: str) -> models.Upload:
+    """Load an upload or raise 404."""
+    upload = await db.get(models.Upload, upload_id)
+    if upload is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Upload with id {upload_id} not found"
+        )
+    return upload
+
+@uploads_router.post("/", status_code=status.HTTP_201_CREATED)
+async def create_upload(
+    upload: UploadCreate,
+    db: AsyncSession = Depends(get_write_session),
+    store: media.MediaStore = Depends(media.get_media_store)
+):
+    """
+    Start a resumable media upload.
+    
+    The upload is attached to ``content_item_id``, or to a new content
+    item created in ``project_id``. Send the bytes with PATCH requests
+    carrying an ``Upload-Offset`` header.
+    
+    Args:
+        upload: Declared content type and size, and the content item to attach to
+        db: Database session
+        store: Media store
+    
+    Returns:
+        Upload status with its id and offset 0
+    """
+    try:
+        store.check_upload(upload.content_type, upload.size)
+    except media.UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    if upload.content_item_id is not None:
+        content_item = await db.get(models.ContentItem, upload.content_item_id)
+        if content_item is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Content item with id {upload.content_item_id} not found"
+            )
+    elif upload.project_id is not None:
+        if await db.get(models.Project, upload.project_id) is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Project with id {upload.project_id} not found"
+            )
+        content_item = models.ContentItem(
+            project_id=upload.project_id,
+            title=upload.title or upload.filename or "Untitled",
+            content_type=upload.content_type.split("/")[0],
+        )
+        db.add(content_item)
+        await db.flush()
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Pass content_item_id or project_id"
+        )
+    db_upload = models.Upload(
+        id=uuid.uuid4().hex,
+        content_item_id=content_item.id,
+        filename=upload.filename,
+        content_type=upload.content_type,
+        size=upload.size,
+        received=0,
+    )
+    db.add(db_upload)
+    await db.commit()
+    response_cache.invalidate(CONTENT_SCOPE, project_scope(content_item.project_id))
+    logger.info(f"Started upload {db_upload.id} of {upload.size} bytes for content item {content_item.id}")
+    response = _upload_status(db_upload, 0)
+    response.status_code = status.HTTP_201_CREATED
+    return response
+
+@uploads_router.api_route("/{upload_id}", methods=["GET", "HEAD"])
+async def get_upload(
+    upload_id: str,
+    db: AsyncSession = Depends(get_read_session),
+    store: media.MediaStore = Depends(media.get_media_store)
+):
+    """
+    Get an upload's progress; clients resume from the returned offset.
+    
+    Args:
+        upload_id: Upload ID
+        db: Database session
+        store: Media store
+    
+    Returns:
+        Upload status
+    """
+    upload = await _get_upload(db, upload_id)
+    received = upload.size if upload.completed_at else store.received(upload_id)
+    return _upload_status(upload, received)
+
+@uploads_router.patch("/{upload_id}")
+async def append_upload(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(..., alias="Upload-Offset", ge=0),
+    db: AsyncSession = Depends(get_write_session),
+    store: media.MediaStore = Depends(media.get_media_store)
+):
+    """
+    Append the request body to an upload.
+    
+    The body is streamed to disk; bytes received before a disconnect are
+    kept. When the last byte arrives the file is hashed into
+    content-addressed storage and the content item's ``content_url``
+    points at it.
+    
+    Args:
+        upload_id: Upload ID
+        request: Incoming request whose body is the next chunk
+        upload_offset: Offset of the body; must equal the upload's current offset
+        db: Database session
+        store: Media store
+    
+    Returns:
+        Upload status after the append
+    """
+    upload = await _get_upload(db, upload_id)
+    # Release the connection while the body streams in
+    await db.commit()
+    if upload.completed_at is not None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Upload {upload_id} is already complete")
+    offset = store.received(upload_id)
+    if upload_offset != offset:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Upload offset is {offset}, not {upload_offset}",
+            headers={"Upload-Offset": str(offset)}
+        )
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and offset + int(content_length) > upload.size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Upload {upload_id} is larger than its declared {upload.size} bytes"
+        )
+
+    error = None
+    try:
+        await store.append(upload_id, upload.content_type, offset, upload.size, request.stream())
+    except media.UploadError as e:
+        error = e
+    except ClientDisconnect:
+        logger.info(f"Upload {upload_id} interrupted at {store.received(upload_id)} bytes")
+    received = store.received(upload_id)
+    upload.received = received
+    if error is None and received == upload.size:
+        digest = await store.finish(upload_id, upload.size)
+        dialect_name = db.get_bind().dialect.name
+        await db.execute(
+            aggregates.UPSERT_INSERTS[dialect_name](models.MediaBlob.__table__)
+            .values(sha256=digest, size=upload.size, content_type=upload.content_type, created_at=datetime.utcnow())
+            .on_conflict_do_nothing(index_elements=["sha256"])
+        )
+        upload.sha256 = digest
+        upload.completed_at = datetime.utcnow()
+        content_item = await db.get(models.ContentItem, upload.content_item_id)
+        content_item.content_url = media.media_url(digest)
+        content_item.content_type = upload.content_type.split("/")[0]
+        await media_jobs.enqueue_processing(db, content_item, digest, upload.content_type)
+    db.add(upload)
+    await db.commit()
+    if upload.completed_at is not None:
+        response_cache.invalidate(CONTENT_SCOPE, project_scope(content_item.project_id))
+        media_jobs.notify_jobs()
+    if error is not None:
+        raise HTTPException(
+            status_code=error.status_code,
+            detail=str(error),
+            headers={"Upload-Offset": str(store.received(upload_id))}
+        )
+    return _upload_status(upload, received)
+
+@uploads_router.delete("/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_upload(
+    upload_id: str,
+    db: AsyncSession = Depends(get_write_session),
+    store: media.MediaStore = Depends(media.get_media_store)
+):
+    """
+    Abandon an unfinished upload and delete its received bytes.
+    
+    Args:
+        upload_id: Upload ID
+        db: Database session
+        store: Media store
+    """
+    upload = await _get_upload(db, upload_id)
+    if upload.completed_at is not None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Upload {upload_id} is already complete")
+    store.discard(upload_id)
+    await db.delete(upload)
+    await db.commit()
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+@media_router.api_route("/{sha256}", methods=["GET", "HEAD"])
+async def get_media(
+    request: Request,
+    sha256: str = Path(..., pattern="^[0-9a-f]{64}$"),
+    db: AsyncSession = Depends(get_read_session),
+    store: media.MediaStore = Depends(media.get_media_store)
+):
+    """
+    Download stored media, whole or as a single byte range.
+    
+    Args:
+        request: Incoming request; Range, If-Range and If-None-Match are honoured
+        sha256: Content digest
+        db: Database session
+        store: Media store
+    
+    Returns:
+        The media bytes with 200 or 206, 304 when unchanged, 416 for unsatisfiable ranges
+    """
+    blob = await db.get(models.MediaBlob, sha256)
+    if blob is None or not store.blob_path(sha256).exists():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Media {sha256} not found"
+        )
+    # Streaming the file must not hold a pooled connection
+    await db.close()
+    return media.media_response(
+        store.blob_path(sha256), f'"{sha256}"', blob.content_type, request.headers, store.read_chunk_size
+    )
+
+@media_router.api_route("/{sha256}/thumbnails/{width}", methods=["GET", "HEAD"])
+async def get_media_thumbnail(
+    request: Request,
+    width: int,
+    sha256: str = Path(..., pattern="^[0-9a-f]{64}$"),
+    store: media.MediaStore = Depends(media.get_media_store)
+):
+    """
+    Download a JPEG thumbnail written by media processing.
+    
+    Args:
+        request: Incoming request; conditional and range headers are honoured
+        width: Requested thumbnail width
+        sha256: Content digest
+        store: Media store
+    
+    Returns:
+        The thumbnail bytes
+    """
+    path = store.thumbnail_path(sha256, width)
+    if not path.exists():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No {width}px thumbnail for media {sha256}"
+        )
+    # Reprocessing may rewrite a thumbnail, so it is revalidated rather than immutable
+    stat = path.stat()
+    return media.media_response(
+        path, f'"{sha256}-{width}-{stat.st_mtime_ns}"', "image/jpeg", request.headers,
+        store.read_chunk_size, cache_control="public, max-age=3600"
+    )
+
+# Media job endpoints
+@media_jobs_router.get("/")
+async def get_media_jobs(
+    job_status: Optional[str] = Query(None, alias="status"),
+    content_item_id: Optional[int] = None,
+    cursor: str = "",
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_session)
+):
+    """
+    List media processing jobs in keyset pages.
+    
+    Args:
+        job_status: Optional status filter: queued, running, succeeded or failed
+        content_item_id: Optional content item filter
+        cursor: Cursor from a previous page, empty for the first page
+        limit: Maximum number of jobs to return
+        db: Database session
+    
+    Returns:
+        Page of jobs with ``next_cursor``
+    """
+    query = select(*media_jobs.JOB_COLUMNS)
+    if job_status is not None:
+        try:
+            query = query.where(models.MediaJob.status == models.JobStatus(job_status))
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid status: {job_status}")
+    if content_item_id is not None:
+        query = query.where(models.MediaJob.content_item_id == content_item_id)
+    return await _keyset_page(db, query, models.MediaJob.id, cursor, limit)
+
+@media_jobs_router.get("/stats")
+async def get_media_job_stats(db: AsyncSession = Depends(get_read_session)):
+    """
+    Get media queue depth and job counts per status.
+    
+    Args:
+        db: Database session
+    
+    Returns:
+        Due queued jobs, counts per status, the oldest due job's age and
+        this process's worker utilisation
+    """
+    stats = await media_jobs.queue_stats(db)
+    worker = media_jobs.media_worker
+    stats["worker"] = {
+        "running": worker is not None,
+        "processes": worker.processes if worker else 0,
+        "busy": worker.busy if worker else 0,
+    }
+    return stats
+
+@media_jobs_router.get("/{job_id}")
+async def get_media_job(job_id: int, db: AsyncSession = Depends(get_read_session)):
+    """
+    Get one media job.
+    
+    Args:
+        job_id: Job ID
+        db: Database session
+    
+    Returns:
+        The job's state, attempts and last error
+    """
+    row = (await db.execute(select(*media_jobs.JOB_COLUMNS).where(models.MediaJob.id == job_id))).first()
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Media job with id {job_id} not found"
+        )
+    return row._asdict()
+
+@media_jobs_router.post("/", status_code=status.HTTP_202_ACCEPTED)
+async def reprocess_media(request_body: MediaJobCreate, db: AsyncSession = Depends(get_write_session)):
+    """
+    Queue processing of a content item's uploaded media.
+    
+    Content already processed by the current pipeline is left alone
+    unless ``force`` is set.
+    
+    Args:
+        request_body: Content item to process and whether to force it
+        db: Database session
+    
+    Returns:
+        The item's job
+    """
+    content_item = await db.get(models.ContentItem, request_body.content_item_id)
+    if content_item is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Content item with id {request_body.content_item_id} not found"
+        )
+    prefix = media.media_url("")
+    sha256 = content_item.content_url[len(prefix):] if (content_item.content_url or "").startswith(prefix) else None
+    blob = await db.get(models.MediaBlob, sha256) if sha256 else None
+    if blob is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Content item {content_item.id} has no uploaded media"
+        )
+    job = await media_jobs.enqueue_processing(db, content_item, blob.sha256, blob.content_type, force=request_body.force)
+    await db.commit()
+    media_jobs.notify_jobs()
+    return {column.key: getattr(job, column.key) for column in media_jobs.JOB_COLUMNS}
+
+# Content item endpoints
+@content_items_router.get("/{content_item_id}/similar")
+async def get_similar_content_items(
+    content_item_id: int,
+    limit: int = Query(10, ge=1, le=100),
+    min_ratings: int = Query(1, ge=1),
+    project_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_read_session)
+):
+    """
+    Find the content items that evoke the most similar mix of rasas.
+    
+    Items are compared by the cosine of their rasa distributions in the
+    in-memory similarity index, refreshed from the aggregates when it is
+    older than ``similarity_refresh_seconds``.
+    
+    Args:
+        content_item_id: Content item to compare against
+        limit: Most items returned
+        min_ratings: Skip items with fewer ratings
+        project_id: Only consider items of this project
+        db: Database session
+    
+    Returns:
+        Similar items, most similar first; empty while the item is unrated
+    """
+    index = similarity.similarity_index
+    await index.ensure_fresh(db)
+    results = index.similar_content_items(content_item_id, limit, min_ratings, project_id)
+    if results is None:
+        if await db.get(models.ContentItem, content_item_id) is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Content item with id {content_item_id} not found"
+            )
+        results = []
+    titles = await _titles(db, models.ContentItem, [result["content_item_id"] for result in results])
+    for result in results:
+        result["title"] = titles.get(result["content_item_id"])
+    return {"content_item_id": content_item_id, "as_of_rating_id": index.last_rating_id, "results": results}
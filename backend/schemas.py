@@ -0,0 +1,105 @@
+"""
+Response schemas for the RMS API.
+
+Each schema documents a response shape and also defines which columns the
+routes select, so list endpoints fetch plain row tuples instead of ORM
+objects and hand them to orjson without per-object reflection.
+"""
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from pydantic import BaseModel, ConfigDict
+from sqlalchemy import Row
+
+import models
+
+class ProjectOut(BaseModel):
+    """Project as returned by the API."""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    title: str
+    description: Optional[str] = None
+    creator_id: Optional[int] = None
+    expected_rasa: models.Rasa
+    reference_links: Optional[Any] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class RatingOut(BaseModel):
+    """Rating as returned by the API."""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    user_id: Optional[int] = None
+    project_id: Optional[int] = None
+    content_item_id: Optional[int] = None
+    rasa: models.Rasa
+    rating_value: Optional[int] = None
+    feedback: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+class ContentItemOut(BaseModel):
+    """Content item as returned by the API."""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    project_id: Optional[int] = None
+    title: str
+    content_type: Optional[str] = None
+    content_url: Optional[str] = None
+    content_data: Optional[Any] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class PhilosophicalAnalysisOut(BaseModel):
+    """Philosophical analysis as returned by the API."""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    content_item_id: Optional[int] = None
+    gender_perspective: Optional[models.Gender] = None
+    race_perspective: Optional[str] = None
+    religious_perspective: Optional[str] = None
+    analysis_notes: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class UserOut(BaseModel):
+    """Public view of a user, as embedded in other resources."""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    username: str
+
+class ProjectPage(BaseModel):
+    """Keyset page of projects."""
+    items: List[ProjectOut]
+    next_cursor: Optional[str] = None
+
+class RatingPage(BaseModel):
+    """Keyset page of ratings."""
+    items: List[RatingOut]
+    next_cursor: Optional[str] = None
+
+def columns_for(schema: type, model: type) -> List[Any]:
+    """
+    Return the model columns backing a schema's fields, in field order.
+
+    Args:
+        schema: Response schema class
+        model: ORM model the columns belong to
+
+    Returns:
+        List of column attributes to pass to select()
+    """
+    return [getattr(model, field) for field in schema.model_fields]
+
+def rows_to_dicts(rows: Iterable[Row]) -> List[Dict[str, Any]]:
+    """Convert selected row tuples to dicts keyed by column name."""
+    return [row._asdict() for row in rows]
+
+PROJECT_COLUMNS = columns_for(ProjectOut, models.Project)
+RATING_COLUMNS = columns_for(RatingOut, models.Rating)
+CONTENT_ITEM_COLUMNS = columns_for(ContentItemOut, models.ContentItem)
+PHILOSOPHICAL_ANALYSIS_COLUMNS = columns_for(PhilosophicalAnalysisOut, models.PhilosophicalAnalysis)
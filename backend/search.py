@@ -0,0 +1,279 @@
+"""
+Full-text search over projects, content items and rating feedback for RMS.
+
+All searchable text lives in one inverted index with a row per document:
+an FTS5 virtual table on SQLite, a table with a weighted ``tsvector``
+column and a GIN index on PostgreSQL. Triggers on the source tables keep
+it in step with every insert, update and delete, including bulk loads
+that bypass the ORM. The index is created, and backfilled from existing
+rows, together with the rest of the schema by ``create_all``.
+
+Index row ids encode the source row as ``id * 4 + type code``, so a source
+row's index entry is found by primary key. Titles weigh more than bodies
+in the ranking. Query terms are ANDed; a trailing ``*`` makes a term a
+prefix match.
+"""
+import logging
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import get_settings
+from models import Base
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+SQLITE_INDEX = "search_index"
+POSTGRES_INDEX = "search_documents"
+
+# Markers placed around matched terms in snippets
+SNIPPET_START = "<mark>"
+SNIPPET_END = "</mark>"
+
+# Ranking weight of titles relative to bodies
+TITLE_WEIGHT = 4.0
+
+@dataclass(frozen=True)
+class SearchSource:
+    """A source table whose rows are indexed as one document type."""
+    doc_type: str
+    code: int
+    table: str
+    title: Optional[str]
+    body: Optional[str]
+    project_id: str
+    condition: Optional[str] = None
+
+SOURCES = (
+    SearchSource("project", 1, "projects", "title", "description", "id"),
+    SearchSource("content_item", 2, "content_items", "title", None, "project_id"),
+    SearchSource("rating", 3, "ratings", None, "feedback", "project_id", "feedback IS NOT NULL"),
+)
+
+DOC_TYPES = tuple(source.doc_type for source in SOURCES)
+
+TERM = re.compile(r"\w+\*?")
+
+def search_language() -> str:
+    """PostgreSQL text search configuration from settings, checked to be a plain name."""
+    language = get_settings().search_language
+    if not re.fullmatch(r"\w+", language):
+        raise ValueError(f"Invalid search language: {language}")
+    return language
+
+def parse_terms(query: str) -> List[Tuple[str, bool]]:
+    """
+    Split a user query into search terms.
+
+    Args:
+        query: Raw query text
+
+    Returns:
+        List of (term, is_prefix) pairs; punctuation and operators are dropped
+    """
+    return [(token.rstrip("*").lower(), token.endswith("*")) for token in TERM.findall(query)]
+
+def _values(source: SearchSource, row: str) -> str:
+    """Index column values of a source row, as SQL over ``row`` (NEW, OLD or the table)."""
+    def column(name: Optional[str]) -> str:
+        return f"{row}.{name}" if name else "NULL"
+
+    return (
+        f"{row}.id * 4 + {source.code}, '{source.doc_type}', {row}.id, "
+        f"{column(source.project_id)}, {column(source.title)}, {column(source.body)}"
+    )
+
+def _backfill(source: SearchSource, index: str, id_column: str) -> str:
+    """INSERT ... SELECT adding every existing row of a source to the index."""
+    where = f" WHERE {source.condition}" if source.condition else ""
+    return (
+        f"INSERT INTO {index} ({id_column}, doc_type, doc_id, project_id, title, body) "
+        f"SELECT {_values(source, source.table)} FROM {source.table}{where}"
+    )
+
+def sqlite_ddl() -> List[str]:
+    """Statements creating the FTS5 index and its sync triggers."""
+    statements = [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_INDEX} USING fts5("
+        "doc_type UNINDEXED, doc_id UNINDEXED, project_id UNINDEXED, title, body, "
+        "tokenize = 'porter unicode61', prefix = '2 3')"
+    ]
+    for source in SOURCES:
+        columns = "rowid, doc_type, doc_id, project_id, title, body"
+        insert = f"INSERT INTO {SQLITE_INDEX} ({columns}) SELECT {_values(source, 'NEW')}"
+        if source.condition:
+            insert += f" WHERE NEW.{source.condition}"
+        delete = f"DELETE FROM {SQLITE_INDEX} WHERE rowid = OLD.id * 4 + {source.code}"
+        prefix = f"CREATE TRIGGER IF NOT EXISTS search_{source.table}"
+        statements += [
+            f"{prefix}_insert AFTER INSERT ON {source.table} BEGIN {insert}; END",
+            f"{prefix}_update AFTER UPDATE ON {source.table} BEGIN {delete}; {insert}; END",
+            f"{prefix}_delete AFTER DELETE ON {source.table} BEGIN {delete}; END",
+        ]
+    return statements
+
+def postgres_ddl() -> List[str]:
+    """Statements creating the tsvector index table and its sync triggers."""
+    language = search_language()
+    statements = [
+        f"CREATE TABLE IF NOT EXISTS {POSTGRES_INDEX} ("
+        "id BIGINT PRIMARY KEY, doc_type VARCHAR(16) NOT NULL, doc_id INTEGER NOT NULL, "
+        "project_id INTEGER, title TEXT, body TEXT, "
+        f"document tsvector GENERATED ALWAYS AS ("
+        f"setweight(to_tsvector('{language}', coalesce(title, '')), 'A') || "
+        f"setweight(to_tsvector('{language}', coalesce(body, '')), 'B')) STORED)",
+        f"CREATE INDEX IF NOT EXISTS ix_{POSTGRES_INDEX}_document ON {POSTGRES_INDEX} USING GIN (document)",
+    ]
+    for source in SOURCES:
+        function = f"search_sync_{source.table}"
+        condition = f" AND NEW.{source.condition}" if source.condition else ""
+        statements += [
+            f"CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$ BEGIN "
+            f"IF TG_OP <> 'INSERT' THEN DELETE FROM {POSTGRES_INDEX} WHERE id = OLD.id * 4 + {source.code}; END IF; "
+            f"IF TG_OP <> 'DELETE'{condition} THEN "
+            f"INSERT INTO {POSTGRES_INDEX} (id, doc_type, doc_id, project_id, title, body) "
+            f"VALUES ({_values(source, 'NEW')}); END IF; "
+            "RETURN NULL; END $$ LANGUAGE plpgsql",
+            f"DROP TRIGGER IF EXISTS search_sync ON {source.table}",
+            f"CREATE TRIGGER search_sync AFTER INSERT OR UPDATE OR DELETE ON {source.table} "
+            f"FOR EACH ROW EXECUTE FUNCTION {function}()",
+        ]
+    return statements
+
+@event.listens_for(Base.metadata, "after_create")
+def create_search_index(target, connection: Connection, **kw) -> None:
+    """Create the search index and triggers, backfilling a new index from existing rows."""
+    dialect_name = connection.dialect.name
+    if dialect_name == "sqlite":
+        index, id_column, statements = SQLITE_INDEX, "rowid", sqlite_ddl()
+    elif dialect_name == "postgresql":
+        index, id_column, statements = POSTGRES_INDEX, "id", postgres_ddl()
+    else:
+        logger.warning(f"Full-text search is not supported on {dialect_name}")
+        return
+    is_new = not inspect(connection).has_table(index)
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+    if is_new:
+        for source in SOURCES:
+            connection.exec_driver_sql(_backfill(source, index, id_column))
+        logger.info(f"Created and backfilled search index {index}")
+
+@event.listens_for(Base.metadata, "before_drop")
+def drop_search_index(target, connection: Connection, **kw) -> None:
+    """Drop the search index; its triggers go with the source tables."""
+    if connection.dialect.name == "sqlite":
+        connection.exec_driver_sql(f"DROP TABLE IF EXISTS {SQLITE_INDEX}")
+    elif connection.dialect.name == "postgresql":
+        connection.exec_driver_sql(f"DROP TABLE IF EXISTS {POSTGRES_INDEX}")
+        for source in SOURCES:
+            connection.exec_driver_sql(f"DROP FUNCTION IF EXISTS search_sync_{source.table}() CASCADE")
+
+def _sqlite_search(match: str, types: Sequence[str], after: Optional[Tuple[float, int]], limit: int):
+    """Build the FTS5 search statement; scores sort ascending (bm25 is negative)."""
+    score = f"bm25({SQLITE_INDEX}, 0, 0, 0, {TITLE_WEIGHT}, 1.0)"
+    where = [f"{SQLITE_INDEX} MATCH :match"]
+    params: Dict[str, Any] = {"match": match, "limit": limit}
+    if types:
+        where.append("doc_type IN ({})".format(", ".join(f":type_{i}" for i in range(len(types)))))
+        params.update({f"type_{i}": doc_type for i, doc_type in enumerate(types)})
+    if after is not None:
+        where.append(f"({score}, rowid) > (:after_score, :after_id)")
+        params.update(after_score=after[0], after_id=after[1])
+    statement = text(
+        f"SELECT rowid AS id, doc_type, doc_id, project_id, title, "
+        f"snippet({SQLITE_INDEX}, -1, '{SNIPPET_START}', '{SNIPPET_END}', '…', 16) AS snippet, "
+        f"{score} AS score FROM {SQLITE_INDEX} WHERE {' AND '.join(where)} "
+        f"ORDER BY score, rowid LIMIT :limit"
+    )
+    return statement, params
+
+def _postgres_search(match: str, types: Sequence[str], after: Optional[Tuple[float, int]], limit: int):
+    """Build the tsvector search statement; headlines are computed for the page rows only."""
+    tsquery = f"to_tsquery('{search_language()}', :match)"
+    score = f"-ts_rank_cd(document, {tsquery})"
+    where = [f"document @@ {tsquery}"]
+    params: Dict[str, Any] = {"match": match, "limit": limit}
+    if types:
+        where.append("doc_type = ANY(:types)")
+        params["types"] = list(types)
+    if after is not None:
+        where.append(f"({score}, id) > (:after_score, :after_id)")
+        params.update(after_score=after[0], after_id=after[1])
+    statement = text(
+        f"SELECT id, doc_type, doc_id, project_id, title, "
+        f"ts_headline('{search_language()}', coalesce(body, title, ''), {tsquery}, "
+        f"'StartSel={SNIPPET_START}, StopSel={SNIPPET_END}, MaxWords=20, MinWords=5') AS snippet, score "
+        f"FROM (SELECT id, doc_type, doc_id, project_id, title, body, {score} AS score "
+        f"FROM {POSTGRES_INDEX} WHERE {' AND '.join(where)} ORDER BY score, id LIMIT :limit) AS page "
+        f"ORDER BY score, id"
+    )
+    return statement, params
+
+def match_expression(dialect_name: str, terms: Sequence[Tuple[str, bool]]) -> str:
+    """
+    Render parsed terms in the backend's query syntax.
+
+    Args:
+        dialect_name: sqlite or postgresql
+        terms: Output of parse_terms
+
+    Returns:
+        FTS5 MATCH string or to_tsquery input
+    """
+    if dialect_name == "postgresql":
+        return " & ".join(term + (":*" if prefix else "") for term, prefix in terms)
+    return " ".join(f'"{term}"' + ("*" if prefix else "") for term, prefix in terms)
+
+async def search(
+    db: AsyncSession,
+    query: str,
+    types: Sequence[str],
+    after: Optional[Tuple[float, int]],
+    limit: int
+) -> Tuple[List[Dict[str, Any]], Optional[Tuple[float, int]]]:
+    """
+    Run a ranked full-text search.
+
+    Args:
+        db: Database session
+        query: Raw query text
+        types: Document types to include; empty for all
+        after: (score, index id) of the last result on the previous page
+        limit: Maximum number of results
+
+    Returns:
+        Results best match first, and the sort key to continue after
+        (None on the last page)
+
+    Raises:
+        ValueError: If the query has no searchable terms
+    """
+    terms = parse_terms(query)
+    if not terms:
+        raise ValueError("Search query has no searchable terms")
+    dialect_name = db.get_bind().dialect.name
+    build = _postgres_search if dialect_name == "postgresql" else _sqlite_search
+    statement, params = build(match_expression(dialect_name, terms), types, after, limit + 1)
+    rows = (await db.execute(statement, params)).mappings().all()
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = (rows[-1]["score"], rows[-1]["id"])
+    results = [
+        {
+            "type": row["doc_type"],
+            "id": row["doc_id"],
+            "project_id": row["project_id"],
+            "title": row["title"],
+            "snippet": row["snippet"],
+            "rank": -row["score"],
+        }
+        for row in rows
+    ]
+    return results, next_after
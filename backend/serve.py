@@ -0,0 +1,97 @@
+"""
+Multi-process server launcher for RMS.
+
+Usage:
+    python serve.py --host 0.0.0.0 --port 8056 [--workers 4]
+
+One worker is started unless ``--workers`` asks for more.
+
+The schema is created once, here, before any worker starts; the workers
+are told to skip it. Each worker is a separate uvicorn process started
+with ``spawn``, so nothing created in this process, database connections
+included, is shared with them. Every worker builds its own engines on
+first use, with pools sized so that all of them together stay within
+``db_max_connections``.
+
+Features whose state lives in one process cannot be kept consistent
+across workers, so with more than one worker they are turned off, with
+a warning naming each one: the
+response cache (a write on one worker would not invalidate the others'
+entries), live updates (subscribers would only see ratings written
+through their own worker) and write-behind (an ack id is only known to
+the worker that issued it). In-memory rate limit buckets are per worker;
+set ``rate_limit_store = "sqlite"`` to share them. Rollup refreshes,
+media jobs and the similarity index read from the database and are safe
+in every worker.
+"""
+import argparse
+import logging
+import os
+from typing import List
+
+import uvicorn
+
+from config import get_settings, init_logging
+from database import init_db, primary_pool_limits
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Settings of features that only work within a single process
+PER_PROCESS_FEATURES = ("response_cache_enabled", "live_updates_enabled", "write_behind_enabled")
+
+def disable_per_process_features(workers: int) -> List[str]:
+    """
+    Turn off single-process features for the workers when there is more than one.
+
+    Settings are passed to the workers through the environment.
+
+    Args:
+        workers: Number of worker processes
+
+    Returns:
+        Names of the settings that were turned off
+    """
+    if workers <= 1:
+        return []
+    settings = get_settings()
+    disabled = [name for name in PER_PROCESS_FEATURES if getattr(settings, name)]
+    for name in disabled:
+        os.environ[name] = "false"
+        logger.warning(f"Turning off {name}: its state would not be shared between {workers} workers")
+    get_settings.cache_clear()
+    return disabled
+
+def main() -> None:
+    """Command line entry point: prepare the database once, then run the workers."""
+    parser = argparse.ArgumentParser(description="Run the RMS API with several worker processes")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind")
+    parser.add_argument("--port", type=int, default=8056, help="Port to bind")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Worker processes; more than one turns off the response cache, live updates and write-behind"
+    )
+    parser.add_argument("--log-level", default="warning", help="uvicorn log level")
+    args = parser.parse_args()
+
+    # Settings are read from the environment, which the workers inherit
+    os.environ["workers"] = str(args.workers)
+    get_settings.cache_clear()
+    init_logging()
+    disabled = disable_per_process_features(args.workers)
+    if disabled:
+        logger.warning(f"Running {args.workers} workers without {', '.join(disabled)}; use --workers 1 to keep them")
+    init_db()
+    os.environ["db_init_on_startup"] = "false"
+
+    pool_size, max_overflow = primary_pool_limits()
+    logger.info(
+        f"Starting {args.workers} workers on {args.host}:{args.port}, "
+        f"primary pool {pool_size}+{max_overflow} connections each"
+    )
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers, log_level=args.log_level)
+
+if __name__ == "__main__":
+    main()
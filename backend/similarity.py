@@ -0,0 +1,420 @@
+"""
+In-memory Navarasa similarity index for RMS.
+
+Every content item and project with ratings is a row in a NumPy matrix
+holding its rasa distribution: each rasa weighted by the sum of its rating
+values, so both how often and how strongly it is felt count, scaled to
+unit length. Cosine similarity against every row is then one
+matrix-vector product, and the best ``k`` rows are picked with
+``argpartition`` instead of a full sort.
+
+The rows come from the project_rasa_stats and content_item_rasa_stats
+aggregates. A query finding the index older than
+``similarity_refresh_seconds`` first re-reads the aggregate rows of just
+the items and projects rated above the settled rating id (see
+``rollups.RatingIdHorizon``). Ids above it are read again on every
+refresh until they settle, so a rating committed after a higher id was
+seen is still picked up. Rows are replaced with the absolute values read,
+never added to, so reading a rating twice is harmless. The first use, or
+a ratings table that went backwards, loads everything again into fresh
+arrays; a load made before any id had settled is repeated once one has.
+
+Each process holds its own copy: about 60 bytes per content item.
+"""
+import asyncio
+import logging
+import time
+from contextlib import suppress
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import distinct, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import metrics
+import models
+from config import get_settings
+from rollups import RatingIdHorizon
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+RASAS = list(models.Rasa)
+RASA_INDEX = {rasa: position for position, rasa in enumerate(RASAS)}
+
+# Keys per IN list when re-reading changed aggregate rows
+CHANGED_KEYS_PER_QUERY = 500
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Find the highest scores without sorting all of them.
+
+    Args:
+        scores: Candidate scores
+        k: Results wanted
+
+    Returns:
+        Positions in ``scores``, highest first, ties by position
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(scores, -k)[-k:]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.lexsort((candidates, -scores[candidates]))]
+
+def fold_stats(rows: Sequence[Tuple]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Turn aggregate rows into one weight vector per entity.
+
+    Args:
+        rows: ``(entity_id, group, rasa, rating_sum, rating_count)`` tuples;
+            all rows of an entity must be present
+
+    Returns:
+        Entity ids, their rasa weight matrix, total rating counts and groups
+    """
+    keys, groups, rasas, sums, counts = zip(*rows)
+    ids, first, inverse = np.unique(np.array(keys, dtype=np.int64), return_index=True, return_inverse=True)
+    weights = np.zeros((len(ids), len(RASAS)), dtype=np.float64)
+    weights[inverse, [RASA_INDEX[rasa] for rasa in rasas]] = sums
+    totals = np.bincount(inverse, weights=counts, minlength=len(ids)).astype(np.int64)
+    return ids, weights, totals, np.array(groups, dtype=np.int64)[first]
+
+class RasaMatrix:
+    """
+    Unit-length rasa vectors for one kind of entity.
+
+    Rows are appended as entities first appear and updated in place after
+    that; arrays grow by doubling. Vectors are stored rasa-major, one
+    contiguous array of ``capacity`` values per rasa, which makes the
+    product with a query vector several times faster than row-major
+    storage. ``groups`` holds one integer per row whose meaning depends on
+    the kind: the project of a content item, or the expected rasa of a
+    project.
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.rows: Dict[int, int] = {}
+        self.ids = np.empty(0, dtype=np.int64)
+        self.vectors = np.empty((len(RASAS), 0), dtype=np.float32)
+        self.totals = np.empty(0, dtype=np.int64)
+        self.groups = np.empty(0, dtype=np.int64)
+
+    def _reserve(self, extra: int) -> None:
+        """Make room for ``extra`` more rows."""
+        needed = self.size + extra
+        if needed <= len(self.ids):
+            return
+        capacity = max(needed, 2 * len(self.ids), 1024)
+        for name in ("ids", "totals", "groups"):
+            current = getattr(self, name)
+            grown = np.zeros(capacity, dtype=current.dtype)
+            grown[:self.size] = current[:self.size]
+            setattr(self, name, grown)
+        vectors = np.zeros((len(RASAS), capacity), dtype=np.float32)
+        vectors[:, :self.size] = self.vectors[:, :self.size]
+        self.vectors = vectors
+
+    def upsert(self, ids: np.ndarray, weights: np.ndarray, totals: np.ndarray, groups: np.ndarray) -> None:
+        """
+        Store entities' current distributions, replacing earlier ones.
+
+        Args:
+            ids: Entity ids
+            weights: Rasa weights per entity, one row each
+            totals: Ratings counted per entity
+            groups: Group value per entity
+        """
+        norms = np.linalg.norm(weights, axis=1, keepdims=True)
+        vectors = np.divide(weights, norms, out=np.zeros_like(weights), where=norms > 0)
+        positions = np.fromiter((self.rows.get(key, -1) for key in ids.tolist()), dtype=np.int64, count=len(ids))
+        new = positions < 0
+        added = int(new.sum())
+        self._reserve(added)
+        positions[new] = np.arange(self.size, self.size + added)
+        self.rows.update(zip(ids[new].tolist(), positions[new].tolist()))
+        self.size += added
+        self.ids[positions] = ids
+        self.vectors[:, positions] = vectors.T
+        self.totals[positions] = totals
+        self.groups[positions] = groups
+
+    def distribution(self, row: int) -> Dict[str, float]:
+        """Shares of the rasa weights of one row, summing to one."""
+        vector = self.vectors[:, row].astype(np.float64)
+        total = vector.sum()
+        return {rasa.value: round(float(weight / total), 4) if total else 0.0 for rasa, weight in zip(RASAS, vector)}
+
+# Aggregate rows in the shape fold_stats expects, ordered by entity
+CONTENT_ITEM_ROWS = (
+    select(
+        models.ContentItemRasaStats.content_item_id,
+        func.coalesce(models.ContentItem.project_id, -1),
+        models.ContentItemRasaStats.rasa,
+        models.ContentItemRasaStats.rating_sum,
+        models.ContentItemRasaStats.rating_count,
+    )
+    .join(models.ContentItem, models.ContentItem.id == models.ContentItemRasaStats.content_item_id)
+    .order_by(models.ContentItemRasaStats.content_item_id)
+)
+
+PROJECT_ROWS = (
+    select(
+        models.ProjectRasaStats.project_id,
+        models.Project.expected_rasa,
+        models.ProjectRasaStats.rasa,
+        models.ProjectRasaStats.rating_sum,
+        models.ProjectRasaStats.rating_count,
+    )
+    .join(models.Project, models.Project.id == models.ProjectRasaStats.project_id)
+    .order_by(models.ProjectRasaStats.project_id)
+)
+
+def _project_rows(rows: Sequence[Tuple]) -> List[Tuple]:
+    """Replace the expected rasa in project rows with its column index."""
+    return [(key, RASA_INDEX[expected], rasa, total, count) for key, expected, rasa, total, count in rows]
+
+class SimilarityIndex:
+    """
+    Content item and project rasa matrices kept in step with the aggregates.
+
+    Args:
+        refresh_seconds: Age after which a query first folds in newer ratings
+        chunk_size: Aggregate rows fetched per batch on a full load
+        settle_seconds: Age at which an observed maximum rating id is taken as complete
+    """
+
+    def __init__(self, refresh_seconds: float = 5.0, chunk_size: int = 50_000, settle_seconds: float = 10.0):
+        self.refresh_seconds = refresh_seconds
+        self.chunk_size = chunk_size
+        self.settle_seconds = settle_seconds
+        self.clear()
+
+    def clear(self) -> None:
+        """Forget everything; the next query loads the index again."""
+        self.content_items = RasaMatrix()
+        self.projects = RasaMatrix()
+        self.horizon = RatingIdHorizon(self.settle_seconds)
+        self.last_rating_id = 0
+        # Every rating at or below this id is reflected; None while that is unknown
+        self.settled_id: Optional[int] = None
+        self.loaded = False
+        self.refreshed_at = float("-inf")
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _is_fresh(self) -> bool:
+        """Whether the index was loaded and refreshed recently enough."""
+        return self.loaded and time.monotonic() - self.refreshed_at < self.refresh_seconds
+
+    async def ensure_fresh(self, db: AsyncSession) -> None:
+        """
+        Refresh the index if it is older than ``refresh_seconds``.
+
+        Concurrent callers wait for a single refresh.
+
+        Args:
+            db: Database session
+        """
+        if self._is_fresh():
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self._is_fresh():
+                await self.refresh(db)
+
+    async def refresh(self, db: AsyncSession) -> None:
+        """
+        Fold in everything rated since the last refresh.
+
+        Args:
+            db: Database session
+        """
+        start_time = time.perf_counter()
+        latest, settled = await self.horizon.settle(db)
+        if (not self.loaded or latest < self.last_rating_id
+                or (self.settled_id is None and settled is not None)):
+            kind = "full"
+            content_items, projects = RasaMatrix(), RasaMatrix()
+            await self._load_all(db, content_items, CONTENT_ITEM_ROWS, list)
+            await self._load_all(db, projects, PROJECT_ROWS, _project_rows)
+            self.content_items, self.projects = content_items, projects
+        else:
+            # Until an id settles, ratings below the last full load's latest
+            # id wait for the repeated full load instead
+            floor = self.settled_id if self.settled_id is not None else self.last_rating_id
+            kind = "incremental" if latest > floor else "unchanged"
+            if latest > floor:
+                await self._load_changed(db, floor, latest)
+        if settled is not None:
+            self.settled_id = min(settled, latest)
+        self.last_rating_id = latest
+        self.loaded = True
+        self.refreshed_at = time.monotonic()
+        duration = time.perf_counter() - start_time
+        metrics.SIMILARITY_REFRESH.observe(duration, kind=kind)
+        if kind == "full":
+            logger.info(
+                f"Loaded similarity index: {self.content_items.size} content items, "
+                f"{self.projects.size} projects in {duration * 1000:.1f}ms"
+            )
+
+    async def _load_all(self, db: AsyncSession, matrix: RasaMatrix, query, convert) -> None:
+        """Stream every aggregate row into ``matrix``, never splitting an entity across batches."""
+        result = await db.stream(query.execution_options(yield_per=self.chunk_size))
+        carried: List[Tuple] = []
+        async for partition in result.partitions():
+            rows = carried + list(partition)
+            split = len(rows)
+            while split > 0 and rows[split - 1][0] == rows[-1][0]:
+                split -= 1
+            carried = rows[split:]
+            if split:
+                matrix.upsert(*fold_stats(convert(rows[:split])))
+        if carried:
+            matrix.upsert(*fold_stats(convert(carried)))
+
+    async def _load_changed(self, db: AsyncSession, floor: int, latest: int) -> None:
+        """Re-read the aggregate rows of entities with ratings in ``(floor, latest]``."""
+        rating = models.Rating
+        rated = (rating.id > floor, rating.id <= latest)
+        targets = (
+            (self.content_items, rating.content_item_id, CONTENT_ITEM_ROWS,
+             models.ContentItemRasaStats.content_item_id, list),
+            (self.projects, rating.project_id, PROJECT_ROWS, models.ProjectRasaStats.project_id, _project_rows),
+        )
+        for matrix, rated_key, query, stats_key, convert in targets:
+            keys = (await db.scalars(select(distinct(rated_key)).where(*rated, rated_key.is_not(None)))).all()
+            for start in range(0, len(keys), CHANGED_KEYS_PER_QUERY):
+                chunk = keys[start:start + CHANGED_KEYS_PER_QUERY]
+                rows = (await db.execute(query.where(stats_key.in_(chunk)))).all()
+                if rows:
+                    matrix.upsert(*fold_stats(convert(rows)))
+
+    def similar_content_items(
+        self,
+        content_item_id: int,
+        limit: int,
+        min_ratings: int = 1,
+        project_id: Optional[int] = None
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Find the content items whose rasa mix is closest to one item's.
+
+        Args:
+            content_item_id: Item to compare against
+            limit: Most results returned
+            min_ratings: Skip items with fewer ratings
+            project_id: Only consider items of this project
+
+        Returns:
+            Matches, most similar first, or None if the item has no ratings
+        """
+        matrix = self.content_items
+        row = matrix.rows.get(content_item_id)
+        if row is None:
+            return None
+        size = matrix.size
+        query = matrix.vectors[:, row]
+        if project_id is None and min_ratings <= 1:
+            # Every indexed item has a rating, so only the item itself is left out
+            scores = query @ matrix.vectors[:, :size]
+            scores[row] = -np.inf
+            matches = top_k(scores, limit)
+            scores = scores[matches]
+        else:
+            eligible = matrix.totals[:size] >= min_ratings
+            if project_id is not None:
+                eligible &= matrix.groups[:size] == project_id
+            eligible[row] = False
+            positions = np.flatnonzero(eligible)
+            if len(positions) < size // 4:
+                scores = query @ matrix.vectors[:, positions]
+            else:
+                scores = (query @ matrix.vectors[:, :size])[positions]
+            best = top_k(scores, limit)
+            matches, scores = positions[best], scores[best]
+        return [
+            {
+                "content_item_id": int(matrix.ids[match]),
+                "project_id": int(matrix.groups[match]) if matrix.groups[match] >= 0 else None,
+                "similarity": round(float(score), 6),
+                "total_ratings": int(matrix.totals[match]),
+            }
+            for match, score in zip(matches, scores) if np.isfinite(score)
+        ]
+
+    def divergent_projects(self, limit: int, min_ratings: int = 1) -> List[Dict[str, Any]]:
+        """
+        Find the projects whose audience response strays furthest from their expected rasa.
+
+        Divergence is one minus the cosine between a project's distribution
+        and one made entirely of its expected rasa, which is simply the
+        expected rasa's component of the unit vector.
+
+        Args:
+            limit: Most results returned
+            min_ratings: Skip projects with fewer ratings
+
+        Returns:
+            Projects, most divergent first
+        """
+        matrix = self.projects
+        if min_ratings <= 1:
+            positions = np.arange(matrix.size)
+        else:
+            positions = np.flatnonzero(matrix.totals[:matrix.size] >= min_ratings)
+        alignment = matrix.vectors[matrix.groups[positions], positions]
+        results = []
+        for best in top_k(1.0 - alignment, limit):
+            match = positions[best]
+            results.append({
+                "project_id": int(matrix.ids[match]),
+                "expected_rasa": RASAS[matrix.groups[match]].value,
+                "dominant_rasa": RASAS[int(matrix.vectors[:, match].argmax())].value,
+                "alignment": round(float(alignment[best]), 6),
+                "divergence": round(float(1.0 - alignment[best]), 6),
+                "total_ratings": int(matrix.totals[match]),
+                "distribution": matrix.distribution(match),
+            })
+        return results
+
+def _build_index() -> SimilarityIndex:
+    """Create the process-wide index from settings."""
+    settings = get_settings()
+    return SimilarityIndex(
+        settings.similarity_refresh_seconds, settings.similarity_load_chunk_size, settings.rating_id_settle_seconds
+    )
+
+similarity_index = _build_index()
+
+_warm_task: Optional[asyncio.Task] = None
+
+async def _warm() -> None:
+    """Load the index so the first query does not pay for it."""
+    from database import get_async_db
+
+    try:
+        async with get_async_db() as db:
+            await similarity_index.ensure_fresh(db)
+    except Exception as e:
+        logger.error(f"Similarity index warm-up failed: {e}", exc_info=True)
+
+def start_similarity_index() -> None:
+    """Start loading the process-wide index in the background if enabled in settings."""
+    global _warm_task
+    if get_settings().similarity_warm_on_startup and _warm_task is None:
+        _warm_task = asyncio.create_task(_warm())
+
+async def stop_similarity_index() -> None:
+    """Cancel a warm-up that is still running."""
+    global _warm_task
+    if _warm_task is not None:
+        _warm_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await _warm_task
+        _warm_task = None
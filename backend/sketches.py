@@ -0,0 +1,393 @@
+"""
+Mergeable rating sketches for RMS.
+
+Each ``(project_id, day, rasa)`` and ``(content_item_id, day, rasa)`` row
+keeps two compact byte-serialized sketches next to the running stats:
+
+- a HyperLogLog of rater user ids, estimating unique raters with a
+  relative standard error of ``1.04 / sqrt(2 ** precision)``
+- a histogram of rating values; ratings are integers on a 1-10 scale, so
+  exact per-value counts take a few bytes and answer any quantile exactly
+
+Both merge by union/addition, so sketches of several days, rasas,
+projects or content items combine into one without touching the ratings
+table. Days are UTC buckets of the rating's ``created_at``. Sketch rows
+are updated inside the rating insert transaction; the rows being changed
+are locked while they are merged so concurrent writers never lose counts.
+"""
+import hashlib
+import logging
+import math
+import struct
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import aggregates
+import models
+from config import get_settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+HLL_MIN_PRECISION = 4
+HLL_MAX_PRECISION = 16
+
+# Serialized layouts: format byte, precision byte, then registers
+HLL_DENSE = 1
+HLL_SPARSE = 2
+HISTOGRAM_PAIR = struct.Struct("<iQ")
+
+def _hash64(value: Any) -> int:
+    """Stable 64-bit hash of a value."""
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big")
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct counter.
+
+    Args:
+        precision: log2 of the register count
+    """
+
+    def __init__(self, precision: int = 12):
+        if not HLL_MIN_PRECISION <= precision <= HLL_MAX_PRECISION:
+            raise ValueError(f"HyperLogLog precision must be between {HLL_MIN_PRECISION} and {HLL_MAX_PRECISION}")
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    @property
+    def relative_error(self) -> float:
+        """Relative standard error of the estimate."""
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def add(self, value: Any) -> None:
+        """Add one value."""
+        hashed = _hash64(value)
+        remaining_bits = 64 - self.precision
+        index = hashed >> remaining_bits
+        rank = remaining_bits - (hashed & ((1 << remaining_bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def reduce(self, precision: int) -> "HyperLogLog":
+        """Return a copy at a lower precision, as if built at that precision."""
+        if precision > self.precision:
+            raise ValueError("Cannot increase HyperLogLog precision")
+        if precision == self.precision:
+            return self.copy()
+        shift = self.precision - precision
+        reduced = HyperLogLog(precision)
+        for index, rank in enumerate(self.registers):
+            if not rank:
+                continue
+            # The dropped index bits become the leading bits of the rank's bit string
+            dropped = index & ((1 << shift) - 1)
+            new_rank = shift - dropped.bit_length() + 1 if dropped else shift + rank
+            target = index >> shift
+            if new_rank > reduced.registers[target]:
+                reduced.registers[target] = new_rank
+        return reduced
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        """Union another sketch into this one, lowering precision if they differ."""
+        if other.precision < self.precision:
+            reduced = self.reduce(other.precision)
+            self.precision, self.registers = reduced.precision, reduced.registers
+        elif other.precision > self.precision:
+            other = other.reduce(self.precision)
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def copy(self) -> "HyperLogLog":
+        """Return an independent copy."""
+        clone = HyperLogLog(self.precision)
+        clone.registers = bytearray(self.registers)
+        return clone
+
+    def estimate(self) -> int:
+        """Estimate the number of distinct values added."""
+        m = len(self.registers)
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+        raw = alpha * m * m / sum(2.0 ** -rank for rank in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            return round(m * math.log(m / zeros))
+        return round(raw)
+
+    def to_bytes(self) -> bytes:
+        """Serialize, as sparse (index, rank) pairs while that is smaller."""
+        nonzero = [(index, rank) for index, rank in enumerate(self.registers) if rank]
+        if len(nonzero) * 3 < len(self.registers):
+            return bytes((HLL_SPARSE, self.precision)) + b"".join(
+                struct.pack("<HB", index, rank) for index, rank in nonzero
+            )
+        return bytes((HLL_DENSE, self.precision)) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data: Optional[bytes], precision: int = 12) -> "HyperLogLog":
+        """Deserialize; empty data gives an empty sketch of ``precision``."""
+        if not data:
+            return cls(precision)
+        sketch = cls(data[1])
+        if data[0] == HLL_DENSE:
+            sketch.registers = bytearray(data[2:])
+        else:
+            for index, rank in struct.iter_unpack("<HB", data[2:]):
+                sketch.registers[index] = rank
+        return sketch
+
+class ValueHistogram:
+    """Exact counts of integer rating values, usable as a quantile sketch."""
+
+    def __init__(self, counts: Optional[Dict[int, int]] = None):
+        self.counts: Dict[int, int] = dict(counts or {})
+
+    @property
+    def total(self) -> int:
+        """Number of values added."""
+        return sum(self.counts.values())
+
+    def add(self, value: int, count: int = 1) -> None:
+        """Add a value ``count`` times."""
+        self.counts[value] = self.counts.get(value, 0) + count
+
+    def merge(self, other: "ValueHistogram") -> "ValueHistogram":
+        """Add another histogram's counts into this one."""
+        for value, count in other.counts.items():
+            self.add(value, count)
+        return self
+
+    def quantile(self, q: float) -> Optional[int]:
+        """Nearest-rank quantile; None when empty."""
+        total = self.total
+        if not total:
+            return None
+        rank = max(1, math.ceil(q * total))
+        seen = 0
+        for value in sorted(self.counts):
+            seen += self.counts[value]
+            if seen >= rank:
+                return value
+        return max(self.counts)
+
+    def to_bytes(self) -> bytes:
+        """Serialize as sorted (value, count) pairs."""
+        return b"".join(HISTOGRAM_PAIR.pack(value, self.counts[value]) for value in sorted(self.counts))
+
+    @classmethod
+    def from_bytes(cls, data: Optional[bytes]) -> "ValueHistogram":
+        """Deserialize; empty data gives an empty histogram."""
+        return cls(dict(HISTOGRAM_PAIR.iter_unpack(data or b"")))
+
+SKETCH_MODELS = (
+    (models.ProjectRasaSketch, "project_id"),
+    (models.ContentItemRasaSketch, "content_item_id"),
+)
+
+SketchPair = Tuple[HyperLogLog, ValueHistogram]
+SketchKey = Tuple[int, datetime, models.Rasa]
+
+def bucket_start(moment: datetime) -> datetime:
+    """Start of the UTC day a moment falls in."""
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def fold_sketches(rows: Iterable[Dict[str, Any]], key: str, precision: int) -> Dict[SketchKey, SketchPair]:
+    """
+    Build one pair of sketches per (key, day, rasa) from rating rows.
+
+    Args:
+        rows: Rating row dicts with ``rasa``, ``rating_value``, ``user_id``,
+            ``created_at`` and the key column; a missing ``created_at`` means now
+        key: Grouping column, ``project_id`` or ``content_item_id``
+        precision: HyperLogLog precision
+
+    Returns:
+        Dict of (key id, bucket start, rasa) to (raters, values) sketches
+    """
+    folded: Dict[SketchKey, SketchPair] = {}
+    now = datetime.utcnow()
+    for row in rows:
+        key_id = row.get(key)
+        if key_id is None:
+            continue
+        sketch_key = (key_id, bucket_start(row.get("created_at") or now), row["rasa"])
+        pair = folded.get(sketch_key)
+        if pair is None:
+            pair = folded[sketch_key] = (HyperLogLog(precision), ValueHistogram())
+        if row.get("user_id") is not None:
+            pair[0].add(row["user_id"])
+        if row.get("rating_value") is not None:
+            pair[1].add(row["rating_value"])
+    return folded
+
+def _merged_rows(key: str, existing: Sequence[Any], folded: Dict[SketchKey, SketchPair]) -> List[Dict[str, Any]]:
+    """Merge stored (key, bucket, rasa, raters, values) rows with new sketches into row dicts."""
+    stored = {tuple(row[:3]): row for row in existing}
+    updated_at = datetime.utcnow()
+    params = []
+    for (key_id, bucket, rasa), (raters, values) in folded.items():
+        row = stored.get((key_id, bucket, rasa))
+        if row is not None:
+            raters = HyperLogLog.from_bytes(row[3], raters.precision).merge(raters)
+            values = ValueHistogram.from_bytes(row[4]).merge(values)
+        params.append({
+            key: key_id, "bucket_start": bucket, "rasa": rasa, "raters": raters.to_bytes(),
+            "rating_values": values.to_bytes(), "updated_at": updated_at,
+        })
+    return params
+
+async def apply_ratings(db: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+    """
+    Merge newly inserted ratings into the stored sketches.
+
+    Missing sketch rows are created empty first, then exactly the
+    (key, day, rasa) rows the ratings touch are locked with SELECT ...
+    FOR UPDATE and rewritten by one upsert. Other days and rasas of the
+    same project or content item stay unlocked.
+
+    Args:
+        db: Database session holding the insert transaction
+        rows: Rating row dicts that were inserted
+    """
+    precision = get_settings().sketch_hll_precision
+    dialect_name = db.get_bind().dialect.name
+    for model, key in SKETCH_MODELS:
+        folded = fold_sketches(rows, key, precision)
+        if not folded:
+            continue
+        table = model.__table__
+        index_elements = [key, "bucket_start", "rasa"]
+        columns = [table.c[name] for name in index_elements]
+        upsert = aggregates.UPSERT_INSERTS[dialect_name](table)
+        await db.execute(
+            upsert.on_conflict_do_nothing(index_elements=index_elements),
+            [{key: key_id, "bucket_start": bucket, "rasa": rasa, "raters": b"", "rating_values": b""}
+             for key_id, bucket, rasa in folded]
+        )
+        # Lock in primary key order so concurrent writers cannot deadlock
+        result = await db.execute(
+            select(*columns, table.c.raters, table.c.rating_values)
+            .where(tuple_(*columns).in_(list(folded)))
+            .order_by(*columns)
+            .with_for_update()
+        )
+        # Every row exists by now; the upsert batches into multi-row
+        # INSERTs where an executemany UPDATE costs a round trip per row
+        await db.execute(
+            upsert.on_conflict_do_update(
+                index_elements=index_elements,
+                set_={
+                    "raters": upsert.excluded.raters,
+                    "rating_values": upsert.excluded.rating_values,
+                    "updated_at": upsert.excluded.updated_at,
+                }
+            ),
+            _merged_rows(key, result.all(), folded)
+        )
+
+def rebuild_sketches(db: Session, batch_size: int = 100_000) -> None:
+    """
+    Recompute both sketch tables from the ratings table.
+
+    Args:
+        db: Sync database session; the caller commits
+        batch_size: Ratings read per batch
+    """
+    precision = get_settings().sketch_hll_precision
+    rating = models.Rating
+    for model, key in SKETCH_MODELS:
+        key_column = getattr(rating, key)
+        db.query(model).delete()
+        folded: Dict[SketchKey, SketchPair] = {}
+        result = db.execute(
+            select(key_column, rating.rasa, rating.user_id, rating.rating_value, rating.created_at)
+            .where(key_column.is_not(None))
+            .execution_options(yield_per=batch_size)
+        )
+        for partition in result.mappings().partitions():
+            for sketch_key, (raters, values) in fold_sketches(partition, key, precision).items():
+                pair = folded.get(sketch_key)
+                if pair is None:
+                    folded[sketch_key] = (raters, values)
+                else:
+                    pair[0].merge(raters)
+                    pair[1].merge(values)
+        if folded:
+            db.execute(model.__table__.insert(), _merged_rows(key, [], folded))
+        logger.info(f"Rebuilt {model.__tablename__}")
+
+async def load_sketches(
+    db: AsyncSession,
+    model: type,
+    key: str,
+    key_ids: Sequence[int],
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+) -> Dict[models.Rasa, SketchPair]:
+    """
+    Load and merge the sketches of several keys and days, per rasa.
+
+    Sketches are kept per UTC day, so the range covers every day it touches.
+
+    Args:
+        db: Database session
+        model: ProjectRasaSketch or ContentItemRasaSketch
+        key: Key column name of the model
+        key_ids: Projects or content items to merge
+        since: Earliest rating time to include, or None for all history
+        until: Latest rating time to include, or None for no upper bound
+
+    Returns:
+        Dict of rasa to merged (raters, values) sketches
+    """
+    precision = get_settings().sketch_hll_precision
+    query = select(model.rasa, model.raters, model.rating_values).where(getattr(model, key).in_(key_ids))
+    if since is not None:
+        query = query.where(model.bucket_start >= bucket_start(since))
+    if until is not None:
+        query = query.where(model.bucket_start < bucket_start(until) + timedelta(days=1))
+    result = await db.execute(query)
+    merged: Dict[models.Rasa, SketchPair] = {}
+    for rasa, raters, values in result:
+        pair = (HyperLogLog.from_bytes(raters, precision), ValueHistogram.from_bytes(values))
+        if rasa in merged:
+            merged[rasa][0].merge(pair[0])
+            merged[rasa][1].merge(pair[1])
+        else:
+            merged[rasa] = pair
+    return merged
+
+def describe_sketches(merged: Dict[models.Rasa, SketchPair], quantiles: Sequence[float]) -> Dict[str, Any]:
+    """
+    Summarize merged sketches for the API.
+
+    Args:
+        merged: Per-rasa sketches from load_sketches
+        quantiles: Quantiles of rating_value to report
+
+    Returns:
+        Unique raters overall and per rasa, quantiles per rasa and error bounds
+    """
+    precision = get_settings().sketch_hll_precision
+    overall = HyperLogLog(precision)
+    rasas = {}
+    for rasa in models.Rasa:
+        raters, values = merged.get(rasa, (HyperLogLog(precision), ValueHistogram()))
+        overall.merge(raters)
+        rasas[rasa.value] = {
+            "ratings": values.total,
+            "unique_raters": raters.estimate(),
+            "quantiles": {str(q): values.quantile(q) for q in quantiles},
+        }
+    return {
+        "unique_raters": overall.estimate(),
+        "rasas": rasas,
+        "error_bounds": {
+            "unique_raters_relative_error": overall.relative_error,
+            "quantile_rank_error": 0.0,
+        },
+    }
@@ -0,0 +1,246 @@
+"""
+Columnar rating snapshots for offline analytics.
+
+This module writes ratings joined with their project's expected rasa and
+content item metadata to a Hive-partitioned Parquet dataset
+(``project_id=<id>/month=<YYYY-MM>``). Rows are read from the database in
+batches and converted column-wise into Arrow record batches; low
+cardinality columns such as rasa and gender are dictionary encoded.
+
+Each run appends only ratings newer than the watermark stored alongside
+the dataset, up to the settled rating id (see ``rollups.RatingIdHorizon``)
+so that ratings committing late with a lower id are not skipped. Every
+batch is written to a staging directory, moved into place and only then
+recorded in the watermark, so a failed run resumes after its last
+complete batch; point a full re-export at a fresh directory. Run
+``python snapshot.py --help`` for the command line.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+from sqlalchemy import Row, Select, select
+from sqlalchemy.orm import Session
+
+import models
+from rollups import RatingIdHorizon
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+WATERMARK_FILE = "_watermark.json"
+
+DICTIONARY = pa.dictionary(pa.int8(), pa.string())
+
+SNAPSHOT_SCHEMA = pa.schema([
+    ("rating_id", pa.int64()),
+    ("user_id", pa.int64()),
+    ("project_id", pa.int64()),
+    ("content_item_id", pa.int64()),
+    ("rasa", DICTIONARY),
+    ("expected_rasa", DICTIONARY),
+    ("rating_value", pa.int16()),
+    ("created_at", pa.timestamp("us")),
+    ("month", pa.string()),
+    ("content_title", pa.string()),
+    ("content_type", DICTIONARY),
+    ("gender_perspective", DICTIONARY),
+])
+
+PARTITIONING = ds.partitioning(
+    pa.schema([("project_id", pa.int64()), ("month", pa.string())]),
+    flavor="hive"
+)
+
+# Columns whose values are enums and are stored by their value
+ENUM_COLUMNS = {"rasa", "expected_rasa", "gender_perspective"}
+
+# Only one snapshot may write to a dataset at a time in this process
+_snapshot_lock = threading.Lock()
+
+def build_snapshot_query(after_id: int, through_id: Optional[int] = None) -> Select:
+    """
+    Build the snapshot query.
+
+    Args:
+        after_id: Watermark; only ratings with a larger id are selected
+        through_id: Highest rating id to select, or None for no limit
+
+    Returns:
+        Select of ratings joined with project and content item metadata
+    """
+    analysis = models.PhilosophicalAnalysis
+    gender = (
+        select(analysis.gender_perspective)
+        .where(analysis.content_item_id == models.Rating.content_item_id)
+        .order_by(analysis.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    query = (
+        select(
+            models.Rating.id.label("rating_id"),
+            models.Rating.user_id,
+            models.Rating.project_id,
+            models.Rating.content_item_id,
+            models.Rating.rasa,
+            models.Project.expected_rasa,
+            models.Rating.rating_value,
+            models.Rating.created_at,
+            models.ContentItem.title.label("content_title"),
+            models.ContentItem.content_type,
+            gender.label("gender_perspective"),
+        )
+        .join(models.Project, models.Project.id == models.Rating.project_id)
+        .outerjoin(models.ContentItem, models.ContentItem.id == models.Rating.content_item_id)
+        .where(models.Rating.id > after_id)
+        .order_by(models.Rating.id)
+    )
+    if through_id is not None:
+        query = query.where(models.Rating.id <= through_id)
+    return query
+
+def rows_to_batch(rows: Sequence[Row]) -> pa.RecordBatch:
+    """
+    Convert a partition of result rows to an Arrow record batch.
+
+    Args:
+        rows: Rows produced by build_snapshot_query
+
+    Returns:
+        Record batch matching SNAPSHOT_SCHEMA
+    """
+    columns: Dict[str, List[Any]] = {key: list(values) for key, values in zip(rows[0]._fields, zip(*rows))}
+    for name in ENUM_COLUMNS:
+        columns[name] = [value.value if value is not None else None for value in columns[name]]
+    columns["month"] = [
+        created_at.strftime("%Y-%m") if created_at is not None else "unknown"
+        for created_at in columns["created_at"]
+    ]
+    arrays = []
+    for field in SNAPSHOT_SCHEMA:
+        if pa.types.is_dictionary(field.type):
+            arrays.append(pa.array(columns[field.name], type=pa.string()).dictionary_encode().cast(field.type))
+        else:
+            arrays.append(pa.array(columns[field.name], type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=SNAPSHOT_SCHEMA)
+
+def read_watermark(output_dir: Path) -> int:
+    """Return the last rating id written to a dataset, or 0 if none."""
+    path = output_dir / WATERMARK_FILE
+    if not path.exists():
+        return 0
+    return json.loads(path.read_text())["last_rating_id"]
+
+def write_watermark(output_dir: Path, last_rating_id: int) -> None:
+    """Atomically record the last rating id written to a dataset."""
+    path = output_dir / WATERMARK_FILE
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps({
+        "last_rating_id": last_rating_id,
+        "updated_at": datetime.utcnow().isoformat()
+    }))
+    os.replace(tmp_path, path)
+
+def _publish(staging: Path, root: Path) -> None:
+    """Move the files of a staged batch into the dataset, keeping their partition paths."""
+    for path in staging.rglob("*.parquet"):
+        target = root / path.relative_to(staging)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(path, target)
+
+def write_snapshot(
+    db: Session,
+    output_dir: str,
+    batch_size: int = 100_000,
+    settle_seconds: float = 10.0
+) -> Dict[str, Any]:
+    """
+    Append settled ratings newer than the watermark to a Parquet dataset.
+
+    Args:
+        db: Sync database session
+        output_dir: Dataset root directory
+        batch_size: Rows per database fetch and per written batch
+        settle_seconds: How long the highest rating id must age before it
+            is exported; waited out once per run outside SQLite
+
+    Returns:
+        Dict with rows written and the previous and new watermarks
+
+    Raises:
+        RuntimeError: If another snapshot is already running
+    """
+    if not _snapshot_lock.acquire(blocking=False):
+        raise RuntimeError("A snapshot is already running")
+    try:
+        root = Path(output_dir)
+        root.mkdir(parents=True, exist_ok=True)
+        previous = read_watermark(root)
+        through_id = RatingIdHorizon(settle_seconds).wait_settled(db)
+        run_id = uuid.uuid4().hex[:12]
+        # Dataset discovery skips paths starting with "_"
+        staging = root / f"_staging-{run_id}"
+        watermark, rows_written = previous, 0
+
+        try:
+            query = build_snapshot_query(previous, through_id)
+            result = db.execute(query.execution_options(yield_per=batch_size))
+            for batch_number, rows in enumerate(result.partitions()):
+                batch = rows_to_batch(rows)
+                ds.write_dataset(
+                    batch,
+                    staging,
+                    format="parquet",
+                    partitioning=PARTITIONING,
+                    basename_template=f"part-{run_id}-{batch_number}-{{i}}.parquet",
+                    existing_data_behavior="overwrite_or_ignore",
+                )
+                _publish(staging, root)
+                watermark = rows[-1].rating_id
+                write_watermark(root, watermark)
+                rows_written += batch.num_rows
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        logger.info(f"Snapshot wrote {rows_written} ratings to {root} (watermark {watermark})")
+        return {
+            "rows_written": rows_written,
+            "previous_watermark": previous,
+            "watermark": watermark,
+            "output_dir": str(root),
+        }
+    finally:
+        _snapshot_lock.release()
+
+def main() -> None:
+    """Command line entry point for writing snapshots."""
+    from config import get_settings, init_logging
+    from database import get_db
+
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Write a Parquet snapshot of RMS ratings")
+    parser.add_argument("--output", default=settings.snapshot_dir, help="Dataset root directory")
+    parser.add_argument("--batch-size", type=int, default=settings.snapshot_batch_size)
+    args = parser.parse_args()
+
+    init_logging()
+    with get_db() as db:
+        summary = write_snapshot(
+            db,
+            args.output,
+            batch_size=args.batch_size,
+            settle_seconds=settings.rating_id_settle_seconds
+        )
+    print(json.dumps(summary))
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,8 @@ This module contains tests for the FastAPI endpoints using pytest and the TestCl
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
 import os
 import sys
 
@@ -14,27 +15,47 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from main import app
-from database import Base, get_db_session
+from database import Base, get_async_database_url, get_read_session, get_write_session
+from cache import response_cache
+import admission
+import auth
+import metrics
+import schemas
+import similarity
 from models import Project, Rating, User, Rasa
 
-# Create test database
+# Create test database; the sync engine only manages the schema
 SQLALCHEMY_TEST_DATABASE_URL = "sqlite:///./test.db"
 engine = create_engine(
     SQLALCHEMY_TEST_DATABASE_URL,
     connect_args={"check_same_thread": False}
 )
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# NullPool: each TestClient request runs on its own event loop
+async_engine = create_async_engine(
+    get_async_database_url(SQLALCHEMY_TEST_DATABASE_URL),
+    poolclass=NullPool
+)
+TestingAsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
 
-def override_get_db():
+async def override_get_db():
     """Override database session for testing."""
-    try:
-        db = TestingSessionLocal()
+    async with TestingAsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
-# Override the database session with our test database
-app.dependency_overrides[get_db_session] = override_get_db
+# Count test queries in the per-request metrics
+metrics.instrument_engine(async_engine.sync_engine, "test")
+
+# Override the database sessions with our test database
+app.dependency_overrides[get_write_session] = override_get_db
+app.dependency_overrides[get_read_session] = override_get_db
+
+# Tests send bursts from one client; only the in-flight cap stays on
+admission.admission_controller = admission.AdmissionController(admission.MemoryBucketStore(), max_in_flight=100)
+
+# Similarity queries see every rating written before them
+similarity.similarity_index = similarity.SimilarityIndex(refresh_seconds=0)
 
 # Create test client
 client = TestClient(app)
@@ -43,6 +64,9 @@ client = TestClient(app)
 def setup_database():
     """Setup test database before each test."""
     Base.metadata.create_all(bind=engine)
+    response_cache.clear()
+    auth.principal_cache.clear()
+    similarity.similarity_index.clear()
     yield
     Base.metadata.drop_all(bind=engine)
 
@@ -58,6 +82,33 @@ def test_health_check():
     assert response.status_code == 200
     assert response.json()["status"] == "healthy"
 
+def test_health_check_probes_database():
+    """Test that the health check reports a timed database probe."""
+    response = client.get("/health")
+    data = response.json()
+    assert data["services"]["database"] == "up"
+    assert data["database_latency_ms"] >= 0
+
+def test_metrics_endpoint():
+    """Test Prometheus exposition with route latency and query counts."""
+    client.post("/api/v1/projects/", json={"title": "Project 1"})
+    labels = {"method": "GET", "route": "/api/v1/projects/"}
+    before = metrics.REQUEST_QUERIES.sum(**labels)
+    # One SELECT on a cache miss, none on the cached repeat
+    client.get("/api/v1/projects/", params={"limit": 7})
+    assert metrics.REQUEST_QUERIES.sum(**labels) == before + 1
+    client.get("/api/v1/projects/", params={"limit": 7})
+    assert metrics.REQUEST_QUERIES.sum(**labels) == before + 1
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'rms_http_request_duration_seconds_bucket{method="GET",route="/api/v1/projects/",status="200",le="+Inf"}' in body
+    assert "rms_http_requests_in_flight" in body
+    assert 'rms_db_query_duration_seconds_count{engine="test"}' in body
+    assert f'rms_http_request_db_queries_sum{{method="GET",route="/api/v1/projects/"}} {before + 1}' in body
+
 def test_create_project():
     """Test project creation endpoint."""
     project_data = {
@@ -88,6 +139,23 @@ def test_get_projects():
     assert data[0]["title"] == "Project 1"
     assert data[1]["title"] == "Project 2"
 
+def test_list_payloads_match_response_schemas():
+    """Test that list endpoints return exactly the documented schema fields."""
+    created = client.post("/api/v1/projects/", json={"title": "Schema Project"}).json()
+    client.post("/api/v1/ratings/", json={
+        "project_id": created["id"], "rasa": "SHANTA", "rating_value": 7
+    })
+
+    project = client.get("/api/v1/projects/").json()[0]
+    assert set(project) == set(schemas.ProjectOut.model_fields)
+    assert project == created
+    assert project["expected_rasa"] == Rasa.SHRINGARA.value
+
+    rating = client.get("/api/v1/ratings/").json()[0]
+    assert set(rating) == set(schemas.RatingOut.model_fields)
+    assert rating["rasa"] == Rasa.SHANTA.value
+    schemas.RatingOut.model_validate(rating)
+
 def test_create_rating():
     """Test rating creation endpoint."""
     # First create a project
@@ -154,3 +222,1150 @@ def test_invalid_rating_value():
     }
     response = client.post("/api/v1/ratings/", json=rating_data)
     assert response.status_code == 422  # Validation error
+
+def test_create_ratings_batch():
+    """Test batch rating creation with per-row errors."""
+    project_response = client.post("/api/v1/projects/",
+        json={"title": "Test Project", "description": "Test Description"})
+    project_id = project_response.json()["id"]
+
+    batch = [
+        {"project_id": project_id, "rasa": "SHRINGARA", "rating_value": 8},
+        {"project_id": 999, "rasa": "HASYA", "rating_value": 7},
+        {"project_id": project_id, "rasa": "UNKNOWN", "rating_value": 5},
+        {"project_id": project_id, "rasa": "karuna", "rating_value": 11},
+        {"project_id": project_id, "rasa": "karuna", "rating_value": 3}
+    ]
+    response = client.post("/api/v1/ratings/batch", json=batch)
+    assert response.status_code == 201
+    data = response.json()
+    assert data["inserted"] == 2
+    assert [error["index"] for error in data["errors"]] == [1, 2, 3]
+
+    response = client.get(f"/api/v1/ratings/?project_id={project_id}")
+    assert [r["rasa"] for r in response.json()] == ["shringara", "karuna"]
+
+def test_create_ratings_batch_ndjson():
+    """Test batch rating creation from an NDJSON body."""
+    project_response = client.post("/api/v1/projects/",
+        json={"title": "Test Project", "description": "Test Description"})
+    project_id = project_response.json()["id"]
+
+    body = "\n".join([
+        f'{{"project_id": {project_id}, "rasa": "VEERA", "rating_value": 9}}',
+        "not json",
+        f'{{"project_id": {project_id}, "rasa": "ADBHUTA", "rating_value": 6}}'
+    ])
+    response = client.post(
+        "/api/v1/ratings/batch",
+        content=body,
+        headers={"Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 201
+    data = response.json()
+    assert data["inserted"] == 2
+    assert data["errors"][0]["index"] == 1
+
+def test_create_ratings_batch_body_cap(monkeypatch):
+    """Test oversized batch bodies are refused before being read in full."""
+    from config import get_settings
+
+    project_id = client.post("/api/v1/projects/", json={"title": "Test Project"}).json()["id"]
+    line = f'{{"project_id": {project_id}, "rasa": "VEERA", "rating_value": 9}}\n'.encode()
+    monkeypatch.setattr(get_settings(), "rating_batch_max_bytes", len(line) * 2)
+    headers = {"Content-Type": "application/x-ndjson"}
+
+    assert client.post("/api/v1/ratings/batch", content=line * 3, headers=headers).status_code == 413
+    # Without a Content-Length the body is cut off once it passes the cap
+    streamed = client.post("/api/v1/ratings/batch", content=iter([line] * 3), headers=headers)
+    assert streamed.status_code == 413
+    response = client.post("/api/v1/ratings/batch", content=line * 2, headers=headers)
+    assert response.status_code == 201 and response.json()["inserted"] == 2
+
+def test_get_ratings_cursor_pagination():
+    """Test keyset pagination over ratings."""
+    project_response = client.post("/api/v1/projects/",
+        json={"title": "Test Project", "description": "Test Description"})
+    project_id = project_response.json()["id"]
+    batch = [{"project_id": project_id, "rasa": "HASYA", "rating_value": v} for v in range(1, 6)]
+    client.post("/api/v1/ratings/batch", json=batch)
+
+    seen, cursor = [], ""
+    while cursor is not None:
+        response = client.get(
+            "/api/v1/ratings/",
+            params={"project_id": project_id, "limit": 2, "cursor": cursor}
+        )
+        assert response.status_code == 200
+        page = response.json()
+        seen.extend(r["rating_value"] for r in page["items"])
+        cursor = page["next_cursor"]
+    assert seen == [1, 2, 3, 4, 5]
+
+    response = client.get("/api/v1/ratings/", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+def test_page_limits_are_validated():
+    """Test out-of-range page limits are rejected instead of failing the request."""
+    import asyncio
+    import pagination
+    from sqlalchemy import select
+
+    client.post("/api/v1/projects/", json={"title": "Test Project"})
+    for path in ("/api/v1/projects/", "/api/v1/ratings/"):
+        for params in ({"cursor": "", "limit": 0}, {"cursor": "", "limit": -1}, {"limit": 101}, {"skip": -1}):
+            assert client.get(path, params=params).status_code == 422
+    assert len(client.get("/api/v1/projects/", params={"cursor": "", "limit": 1}).json()["items"]) == 1
+
+    async def page(limit):
+        async with TestingAsyncSessionLocal() as db:
+            return await pagination.fetch_keyset_page(db, select(Project.id), Project.id, "", limit)
+    with pytest.raises(ValueError):
+        asyncio.run(page(0))
+
+def test_project_detail_includes_and_query_budget():
+    """Test compound project detail loads includes in a bounded number of queries."""
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+    from models import ContentItem, PhilosophicalAnalysis
+    import project_detail
+
+    project_id = client.post("/api/v1/projects/", json={"title": "Detail Project"}).json()["id"]
+    with Session(engine) as db:
+        creator = User(username="creator", email="creator@example.com", hashed_password="x")
+        db.add(creator)
+        db.flush()
+        db.get(Project, project_id).creator_id = creator.id
+        for i in range(5):
+            item = ContentItem(project_id=project_id, title=f"Item {i}", content_type="text")
+            item.philosophical_analysis = [PhilosophicalAnalysis(analysis_notes=f"Notes {i}")]
+            db.add(item)
+        db.commit()
+    client.post("/api/v1/ratings/", json={"project_id": project_id, "rasa": "KARUNA", "rating_value": 6})
+
+    statements = []
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count)
+    try:
+        include = "creator,content_items.philosophical_analysis,rating_summary"
+        response = client.get(f"/api/v1/projects/{project_id}", params={
+            "include": include,
+            "fields": "title,content_items.title,content_items.philosophical_analysis.analysis_notes"
+        })
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", count)
+
+    assert response.status_code == 200
+    assert len(statements) <= project_detail.query_budget(project_detail.parse_includes(include))
+    data = response.json()
+    assert set(data) == {"id", "title", "creator", "content_items", "rating_summary"}
+    assert data["creator"] == {"id": 1, "username": "creator"}
+    assert len(data["content_items"]) == 5
+    assert data["content_items"][0] == {
+        "id": 1, "title": "Item 0",
+        "philosophical_analysis": [{"id": 1, "analysis_notes": "Notes 0"}]
+    }
+    assert data["rating_summary"]["total_ratings"] == 1
+
+    assert set(client.get(f"/api/v1/projects/{project_id}").json()) == set(schemas.ProjectOut.model_fields)
+    assert client.get(f"/api/v1/projects/{project_id}", params={"include": "ratings"}).status_code == 400
+    assert client.get(f"/api/v1/projects/{project_id}", params={"fields": "content_items.title"}).status_code == 400
+    assert client.get("/api/v1/projects/999").status_code == 404
+
+def test_project_rasa_summary():
+    """Test aggregate summary maintained by single and batch inserts."""
+    project_response = client.post("/api/v1/projects/",
+        json={"title": "Test Project", "expected_rasa": "HASYA"})
+    project_id = project_response.json()["id"]
+
+    client.post("/api/v1/ratings/", json={"project_id": project_id, "rasa": "HASYA", "rating_value": 8})
+    client.post("/api/v1/ratings/batch", json=[
+        {"project_id": project_id, "rasa": "HASYA", "rating_value": 4},
+        {"project_id": project_id, "rasa": "KARUNA", "rating_value": 6},
+        {"project_id": project_id, "rasa": "KARUNA", "rating_value": 10}
+    ])
+
+    response = client.get(f"/api/v1/projects/{project_id}/rasa-summary")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total_ratings"] == 4
+    assert data["match_rate"] == 0.5
+    assert data["distribution"]["hasya"]["mean"] == 6
+    assert data["distribution"]["karuna"]["min"] == 6
+    assert data["distribution"]["karuna"]["max"] == 10
+    assert data["distribution"]["raudra"]["count"] == 0
+
+    assert client.get("/api/v1/projects/999/rasa-summary").status_code == 404
+
+def test_rebuild_rasa_stats():
+    """Test that a rebuild reproduces the incrementally maintained stats."""
+    from sqlalchemy.orm import Session
+    from aggregates import rebuild_rasa_stats
+
+    project_id = client.post("/api/v1/projects/", json={"title": "Test Project"}).json()["id"]
+    client.post("/api/v1/ratings/batch", json=[
+        {"project_id": project_id, "rasa": "VEERA", "rating_value": v} for v in (2, 5, 9)
+    ])
+    before = client.get(f"/api/v1/projects/{project_id}/rasa-summary").json()
+
+    with Session(engine) as db:
+        rebuild_rasa_stats(db)
+        db.commit()
+    after = client.get(f"/api/v1/projects/{project_id}/rasa-summary").json()
+    assert after == before
+
+def test_projects_etag_and_invalidation():
+    """Test conditional GETs and cache invalidation on writes."""
+    client.post("/api/v1/projects/", json={"title": "Project 1"})
+    first = client.get("/api/v1/projects/")
+    etag = first.headers["etag"]
+
+    repeat = client.get("/api/v1/projects/", headers={"If-None-Match": etag})
+    assert repeat.status_code == 304
+
+    client.post("/api/v1/projects/", json={"title": "Project 2"})
+    changed = client.get("/api/v1/projects/", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert len(changed.json()) == 2
+    assert changed.headers["etag"] != etag
+
+def test_ratings_cache_scoped_per_project():
+    """Test that a rating only invalidates its own project's entries."""
+    first_id = client.post("/api/v1/projects/", json={"title": "Project 1"}).json()["id"]
+    second_id = client.post("/api/v1/projects/", json={"title": "Project 2"}).json()["id"]
+    first_etag = client.get(f"/api/v1/ratings/?project_id={first_id}").headers["etag"]
+    second_etag = client.get(f"/api/v1/ratings/?project_id={second_id}").headers["etag"]
+
+    client.post("/api/v1/ratings/", json={"project_id": second_id, "rasa": "HASYA", "rating_value": 5})
+
+    key = "/api/v1/ratings/?project_id={}"
+    assert client.get(key.format(first_id), headers={"If-None-Match": first_etag}).status_code == 304
+    response = client.get(key.format(second_id), headers={"If-None-Match": second_etag})
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+
+def test_export_ratings_ndjson_and_resume():
+    """Test NDJSON export and resuming from the last received id."""
+    import json
+
+    project_id = client.post("/api/v1/projects/", json={"title": "Test Project"}).json()["id"]
+    client.post("/api/v1/ratings/batch", json=[
+        {"project_id": project_id, "rasa": "SHANTA", "rating_value": v} for v in range(1, 5)
+    ])
+
+    response = client.get("/api/v1/ratings/export", params={"project_id": project_id})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["rating_value"] for row in rows] == [1, 2, 3, 4]
+    assert rows[0]["rasa"] == "shanta"
+
+    resumed = client.get("/api/v1/ratings/export", params={"after_id": rows[1]["id"]})
+    assert [json.loads(line)["rating_value"] for line in resumed.text.splitlines()] == [3, 4]
+
+def test_export_ratings_csv():
+    """Test CSV export with header row."""
+    project_id = client.post("/api/v1/projects/", json={"title": "Test Project"}).json()["id"]
+    client.post("/api/v1/ratings/", json={"project_id": project_id, "rasa": "RAUDRA", "rating_value": 9})
+
+    response = client.get("/api/v1/ratings/export", params={"format": "csv"})
+    assert response.status_code == 200
+    lines = response.text.splitlines()
+    assert lines[0].startswith("id,user_id,project_id")
+    assert ",raudra,9," in lines[1]
+    assert client.get("/api/v1/ratings/export", params={"format": "xml"}).status_code == 422
+
+def test_ratings_snapshot_is_incremental(tmp_path, monkeypatch):
+    """Test Parquet snapshot partitioning and watermark-based appends."""
+    import pyarrow.dataset as ds
+    from sqlalchemy.orm import Session
+    import snapshot
+    from snapshot import PARTITIONING, read_watermark, write_snapshot
+
+    project_id = client.post("/api/v1/projects/",
+        json={"title": "Test Project", "expected_rasa": "ADBHUTA"}).json()["id"]
+    client.post("/api/v1/ratings/batch", json=[
+        {"project_id": project_id, "rasa": "ADBHUTA", "rating_value": v} for v in (3, 7)
+    ])
+    with Session(engine) as db:
+        first = write_snapshot(db, str(tmp_path))
+    assert first["rows_written"] == 2
+
+    client.post("/api/v1/ratings/", json={"project_id": project_id, "rasa": "HASYA", "rating_value": 5})
+    with Session(engine) as db:
+        second = write_snapshot(db, str(tmp_path))
+    assert second["rows_written"] == 1
+    assert read_watermark(tmp_path) == second["watermark"]
+
+    # A run failing midway keeps its complete batches and resumes after them
+    client.post("/api/v1/ratings/batch", json=[
+        {"project_id": project_id, "rasa": "HASYA", "rating_value": v} for v in (1, 2)
+    ])
+    write_dataset = ds.write_dataset
+    calls = []
+    def failing_write(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 2:
+            raise OSError("disk full")
+        return write_dataset(*args, **kwargs)
+    monkeypatch.setattr(snapshot.ds, "write_dataset", failing_write)
+    with Session(engine) as db:
+        with pytest.raises(OSError):
+            write_snapshot(db, str(tmp_path), batch_size=1)
+    monkeypatch.setattr(snapshot.ds, "write_dataset", write_dataset)
+    assert read_watermark(tmp_path) == second["watermark"] + 1
+    assert not list(tmp_path.glob("_staging-*"))
+    with Session(engine) as db:
+        assert write_snapshot(db, str(tmp_path))["rows_written"] == 1
+
+    table = ds.dataset(tmp_path, format="parquet", partitioning=PARTITIONING).to_table()
+    assert table.num_rows == 5
+    assert sorted(table.column("rating_id").to_pylist()) == list(range(first["watermark"] - 1, first["watermark"] + 4))
+    assert set(table.column("expected_rasa").to_pylist()) == {"adbhuta"}
+    assert (tmp_path / f"project_id={project_id}").is_dir()
+
+def test_write_behind_rating_buffer():
+    """Test queued ratings, acknowledgement status and drain on stop."""
+    import asyncio
+    import write_buffer
+
+    project_id = client.post("/api/v1/projects/", json={"title": "Test Project"}).json()["id"]
+    buffer = write_buffer.RatingWriteBuffer(TestingAsyncSessionLocal)
+    write_buffer.rating_buffer = buffer
+    try:
+        accepted = client.post("/api/v1/ratings/",
+            json={"project_id": project_id, "rasa": "HASYA", "rating_value": 6})
+        orphan = client.post("/api/v1/ratings/",
+            json={"project_id": 999, "rasa": "HASYA", "rating_value": 6})
+        assert accepted.status_code == 202
+        status_url = accepted.json()["status_url"]
+        assert client.get(status_url).json()["status"] == "queued"
+
+        asyncio.run(buffer.stop())
+        assert client.get(status_url).json()["status"] == "committed"
+        assert client.get(orphan.json()["status_url"]).json()["status"] == "failed"
+    finally:
+        write_buffer.rating_buffer = None
+
+    response = client.get(f"/api/v1/ratings/?project_id={project_id}")
+    assert len(response.json()) == 1
+
+def test_write_behind_backpressure_and_group_commit():
+    """Test that a full queue rejects and a running buffer flushes in batches."""
+    import asyncio
+    import write_buffer
+    from routers import RatingCreate
+
+    project_id = client.post("/api/v1/projects/", json={"title": "Test Project"}).json()["id"]
+    rating = RatingCreate(project_id=project_id, rasa="VEERA", rating_value=7)
+
+    async def scenario():
+        buffer = write_buffer.RatingWriteBuffer(
+            TestingAsyncSessionLocal, max_queue=2, enqueue_timeout_ms=10
+        )
+        await buffer.submit(rating)
+        await buffer.submit(rating)
+        with pytest.raises(write_buffer.BufferFullError):
+            await buffer.submit(rating)
+
+        buffer.start()
+        ack_ids = [await buffer.submit(rating) for _ in range(3)]
+        await asyncio.sleep(0.2)
+        statuses = [buffer.status(ack_id)["status"] for ack_id in ack_ids]
+        await buffer.stop()
+        return statuses
+
+    assert asyncio.run(scenario()) == ["committed"] * 3
+    assert client.get(f"/api/v1/projects/{project_id}/rasa-summary").json()["total_ratings"] == 5
+
+def test_live_updates_coalesce_and_drop_oldest():
+    """Test coalesced publishing and drop-oldest delivery to a slow subscriber."""
+    import asyncio
+    import live
+
+    project_id = client.post("/api/v1/projects/", json={"title": "Test Project"}).json()["id"]
+
+    async def scenario():
+        hub = live.LiveHub(TestingAsyncSessionLocal, max_updates_per_second=100, queue_size=3)
+        updates = hub.subscribe(project_id)
+        first = await updates.__anext__()
+
+        published = metrics.LIVE_PUBLISHES.value()
+        for _ in range(50):
+            hub.notify(project_id)
+        coalesced = await updates.__anext__()
+        await asyncio.sleep(0.05)
+        publishes = metrics.LIVE_PUBLISHES.value() - published
+
+        # Five updates while the subscriber is not reading; only three fit its queue
+        dropped = metrics.LIVE_DROPPED.value()
+        topic = hub._topics[project_id]
+        for total in range(5):
+            topic.publish({"total_ratings": total})
+        backlog = [(await updates.__anext__()).version for _ in range(3)]
+        dropped = metrics.LIVE_DROPPED.value() - dropped
+
+        await updates.aclose()
+        await hub.stop()
+        return first, coalesced, publishes, backlog, dropped, hub.subscribers
+
+    first, coalesced, publishes, backlog, dropped, subscribers = asyncio.run(scenario())
+    assert first.version == 1 and b"event: rasa-summary" in first.sse
+    assert coalesced.version == 2
+    assert publishes == 1
+    assert backlog == [5, 6, 7]
+    assert dropped == 2
+    assert subscribers == 0
+
+def test_live_rating_websocket():
+    """Test that ratings written through the API reach a live WebSocket subscriber."""
+    import live
+    from starlette.websockets import WebSocketDisconnect
+
+    project_id = client.post("/api/v1/projects/", json={"title": "Test Project"}).json()["id"]
+    live.live_hub = live.LiveHub(TestingAsyncSessionLocal, max_updates_per_second=50, heartbeat_seconds=0.2)
+    try:
+        with client.websocket_connect(f"/api/v1/projects/{project_id}/live/ws") as websocket:
+            initial = websocket.receive_json()
+            assert initial["type"] == "rasa-summary"
+            assert initial["data"]["total_ratings"] == 0
+
+            client.post("/api/v1/ratings/", json={"project_id": project_id, "rasa": "KARUNA", "rating_value": 6})
+            client.post("/api/v1/ratings/batch", json=[
+                {"project_id": project_id, "rasa": "KARUNA", "rating_value": 8},
+                {"project_id": project_id, "rasa": "HASYA", "rating_value": 4}
+            ])
+            total = 0
+            for _ in range(20):
+                message = websocket.receive_json()
+                if message["type"] == "rasa-summary":
+                    total = message["data"]["total_ratings"]
+                    if total == 3:
+                        break
+            assert total == 3
+            assert message["data"]["distribution"]["karuna"]["count"] == 2
+
+        with pytest.raises(WebSocketDisconnect):
+            with client.websocket_connect("/api/v1/projects/999/live/ws") as websocket:
+                websocket.receive_json()
+    finally:
+        live.live_hub = None
+
+    assert client.get(f"/api/v1/projects/{project_id}/live").status_code == 503
+
+def test_project_trend_rollups():
+    """Test incremental rollups, late data and rollup selection for trends."""
+    import asyncio
+    from datetime import datetime, timedelta
+    from sqlalchemy.orm import Session
+    import rollups
+
+    async def refresh():
+        async with TestingAsyncSessionLocal() as db:
+            return await rollups.refresh_rollups(db, batch_size=2)
+
+    project_id = client.post("/api/v1/projects/", json={"title": "Test Project"}).json()["id"]
+    client.post("/api/v1/ratings/batch", json=[
+        {"project_id": project_id, "rasa": "HASYA", "rating_value": 8},
+        {"project_id": project_id, "rasa": "HASYA", "rating_value": 6},
+        {"project_id": project_id, "rasa": "VEERA", "rating_value": 5}
+    ])
+    assert asyncio.run(refresh()) == 3
+
+    # A late rating lands in the bucket of its own created_at
+    late = datetime.utcnow() - timedelta(days=3)
+    with Session(engine) as db:
+        db.add(Rating(project_id=project_id, rasa=Rasa.KARUNA, rating_value=4, created_at=late))
+        db.commit()
+    assert asyncio.run(refresh()) == 1
+    assert asyncio.run(refresh()) == 0
+
+    url = f"/api/v1/projects/{project_id}/trend"
+    daily = client.get(url, params={"bucket": "day", "from": (late - timedelta(days=1)).isoformat()}).json()
+    assert daily["rollup"] == "day"
+    assert daily["as_of_rating_id"] == 4
+    assert [point["total"] for point in daily["points"]] == [1, 3]
+    assert daily["points"][1]["rasas"]["hasya"] == {"count": 2, "mean": 7.0}
+
+    assert client.get(url, params={"bucket": "6h"}).json()["rollup"] == "hour"
+    assert client.get(url, params={"bucket": "90m"}).json()["rollup"] == "minute"
+    assert sum(point["total"] for point in client.get(url).json()["points"]) == 4
+    assert client.get(url, params={"bucket": "minute", "from": "2000-01-01T00:00:00"}).status_code == 400
+
+    # Ids drawn before commit: only ids seen settle_seconds ago are folded
+    clock = [100.0]
+    horizon = rollups.RatingIdHorizon(settle_seconds=10)
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(rollups.time, "monotonic", lambda: clock[0])
+        assert horizon.observe(7) is None
+        clock[0] = 105.0
+        assert horizon.observe(9) is None
+        clock[0] = 110.0
+        assert horizon.observe(12) == 7
+        clock[0] = 130.0
+        assert horizon.observe(12) == 12
+    with Session(engine) as db:
+        db.add_all([Rating(project_id=project_id, rasa=Rasa.HASYA, rating_value=5) for _ in range(2)])
+        db.commit()
+
+    async def refresh_through(through_id):
+        async with TestingAsyncSessionLocal() as db:
+            return await rollups.refresh_rollups(db, through_id=through_id)
+    assert asyncio.run(refresh_through(5)) == 1
+    assert client.get(url).json()["as_of_rating_id"] == 5
+    assert asyncio.run(refresh()) == 1
+    assert client.get(url, params={"bucket": "fortnight"}).status_code == 400
+    assert client.get("/api/v1/projects/999/trend").status_code == 404
+
+def test_rater_sketches():
+    """Test HyperLogLog accuracy and merging, and the rater stats endpoints."""
+    from sqlalchemy.orm import Session
+    import aggregates
+    from sketches import HyperLogLog, ValueHistogram
+
+    first, second = HyperLogLog(12), HyperLogLog(12)
+    for user_id in range(20000):
+        first.add(user_id)
+    for user_id in range(10000, 30000):
+        second.add(user_id)
+    merged = HyperLogLog.from_bytes(first.to_bytes()).merge(second)
+    assert abs(merged.estimate() - 30000) < 30000 * 3 * merged.relative_error
+    assert abs(first.merge(second.reduce(10)).estimate() - 30000) < 30000 * 3 * HyperLogLog(10).relative_error
+    assert HyperLogLog.from_bytes(b"").estimate() == 0
+
+    histogram = ValueHistogram()
+    for value in (3, 7, 7, 9):
+        histogram.add(value)
+    histogram = ValueHistogram.from_bytes(histogram.to_bytes())
+    assert [histogram.quantile(q) for q in (0, 0.5, 0.75, 1)] == [3, 7, 7, 9]
+
+    project_id = client.post("/api/v1/projects/", json={"title": "Test Project"}).json()["id"]
+    other_id = client.post("/api/v1/projects/", json={"title": "Other Project"}).json()["id"]
+    client.post("/api/v1/ratings/batch", json=[
+        {"project_id": project_id, "rasa": "HASYA", "rating_value": 8},
+        {"project_id": project_id, "rasa": "HASYA", "rating_value": 6},
+        {"project_id": other_id, "rasa": "HASYA", "rating_value": 2}
+    ])
+    url = f"/api/v1/projects/{project_id}/rater-stats"
+    stats = client.get(url, params={"quantiles": "0.5,1"}).json()
+    assert stats["rasas"]["hasya"]["ratings"] == 2
+    assert stats["rasas"]["hasya"]["quantiles"] == {"0.5": 6, "1.0": 8}
+    assert stats["unique_raters"] == 0
+
+    # Rater ids stored on ratings are counted once sketches are rebuilt
+    with Session(engine) as db:
+        db.add_all(
+            Rating(project_id=pid, user_id=user_id, rasa=Rasa.VEERA, rating_value=5)
+            for pid, user_id in ((project_id, 1), (project_id, 2), (project_id, 2), (other_id, 2), (other_id, 3))
+        )
+        db.flush()
+        aggregates.rebuild_rasa_stats(db)
+        db.commit()
+    stats = client.get(url).json()
+    assert stats["unique_raters"] == 2
+    assert stats["rasas"]["veera"]["ratings"] == 3
+    assert stats["error_bounds"]["quantile_rank_error"] == 0.0
+    merged = client.get("/api/v1/ratings/rater-stats", params={"project_id": [project_id, other_id]}).json()
+    assert merged["unique_raters"] == 3
+    assert merged["rasas"]["hasya"]["quantiles"]["0.5"] == 6
+    assert client.get("/api/v1/ratings/rater-stats").status_code == 400
+    assert client.get(url, params={"quantiles": "2"}).status_code == 400
+
+    # Sketches are kept per day and merge across any range of days
+    from datetime import datetime, timedelta
+    week_ago = datetime.utcnow() - timedelta(days=7)
+    with Session(engine) as db:
+        db.add_all(
+            Rating(project_id=project_id, user_id=user_id, rasa=Rasa.VEERA, rating_value=9, created_at=created_at)
+            for user_id, created_at in ((2, week_ago), (4, week_ago), (5, week_ago - timedelta(days=1)))
+        )
+        db.flush()
+        aggregates.rebuild_rasa_stats(db)
+        db.commit()
+    response_cache.clear()
+    assert client.get(url).json()["rasas"]["veera"]["ratings"] == 6
+    assert client.get(url).json()["unique_raters"] == 4
+    old = client.get(url, params={"since": week_ago.replace(hour=0).isoformat(), "until": week_ago.isoformat()}).json()
+    assert old["rasas"]["veera"]["ratings"] == 2 and old["unique_raters"] == 2
+    recent = client.get(url, params={"since": (week_ago + timedelta(days=1)).isoformat()}).json()
+    assert recent["rasas"]["veera"]["ratings"] == 3 and recent["rasas"]["hasya"]["ratings"] == 2
+    merged = client.get("/api/v1/ratings/rater-stats", params={
+        "project_id": [project_id, other_id], "until": (week_ago - timedelta(days=1)).isoformat()
+    }).json()
+    assert merged["unique_raters"] == 1
+    assert client.get(url, params={"since": "2024-02-01T00:00:00", "until": "2024-01-01T00:00:00"}).status_code == 400
+
+    # New ratings merge into the existing row of their day
+    client.post("/api/v1/ratings/batch", json=[{"project_id": project_id, "rasa": "HASYA", "rating_value": 10}])
+    assert client.get(url, params={"since": datetime.utcnow().isoformat()}).json()["rasas"]["hasya"]["ratings"] == 3
+    assert client.get("/api/v1/projects/999/rater-stats").status_code == 404
+
+def test_full_text_search():
+    """Test ranked, prefix and typed search with snippets and keyset pages."""
+    from sqlalchemy.orm import Session
+    from models import ContentItem
+
+    project_id = client.post("/api/v1/projects/", json={
+        "title": "Monsoon Ragas", "description": "Evening melodies of longing"
+    }).json()["id"]
+    client.post("/api/v1/projects/", json={"title": "Temple Dances", "description": "Ragas in stone"})
+    with Session(engine) as db:
+        db.add(ContentItem(project_id=project_id, title="Raga Megh recording"))
+        db.commit()
+    client.post("/api/v1/ratings/batch", json=[
+        {"project_id": project_id, "rasa": "KARUNA", "rating_value": 8, "feedback": "The ragas moved me to tears"},
+        {"project_id": project_id, "rasa": "HASYA", "rating_value": 3}
+    ])
+
+    results = client.get("/api/v1/search/", params={"q": "ragas"}).json()
+    # Stemming matches "ragas" to "raga"; all four documents mention it
+    assert len(results["items"]) == 4
+    assert {item["type"] for item in results["items"]} == {"project", "content_item", "rating"}
+    assert all("<mark>" in item["snippet"] for item in results["items"])
+    assert results["items"][0]["rank"] >= results["items"][-1]["rank"]
+
+    prefix = client.get("/api/v1/search/", params={"q": "rag*", "type": "content_item"}).json()
+    assert [item["title"] for item in prefix["items"]] == ["Raga Megh recording"]
+    assert client.get("/api/v1/search/", params={"q": "monsoon longing"}).json()["items"][0]["id"] == project_id
+
+    seen = []
+    page = client.get("/api/v1/search/", params={"q": "rag*", "limit": 2}).json()
+    while True:
+        seen += [(item["type"], item["id"]) for item in page["items"]]
+        if page["next_cursor"] is None:
+            break
+        page = client.get("/api/v1/search/", params={"q": "rag*", "limit": 2, "cursor": page["next_cursor"]}).json()
+    assert len(seen) == len(set(seen)) == 4
+
+    # Triggers keep the index in step with updates and deletes
+    with Session(engine) as db:
+        db.get(Project, project_id).title = "Winter Ragas"
+        db.query(Rating).filter(Rating.feedback.is_not(None)).delete()
+        db.commit()
+    response_cache.clear()
+    assert client.get("/api/v1/search/", params={"q": "monsoon"}).json()["items"] == []
+    assert client.get("/api/v1/search/", params={"q": "tears"}).json()["items"] == []
+    assert client.get("/api/v1/search/", params={"q": "winter"}).json()["items"][0]["id"] == project_id
+
+    assert client.get("/api/v1/search/", params={"q": "***"}).status_code == 400
+    assert client.get("/api/v1/search/", params={"q": "raga", "type": "user"}).status_code == 400
+    assert client.get("/api/v1/search/", params={"q": "raga", "cursor": "bogus"}).status_code == 400
+
+def test_resumable_media_upload(tmp_path):
+    """Test chunked uploads, resumption, deduplication and ranged downloads."""
+    import hashlib
+    import media
+
+    store = media.MediaStore(tmp_path, max_size=1 << 20, allowed_types=["video/mp4", "image/png"],
+                             write_buffer_size=4096, read_chunk_size=1000)
+    app.dependency_overrides[media.get_media_store] = lambda: store
+    try:
+        project_id = client.post("/api/v1/projects/", json={"title": "Test Project"}).json()["id"]
+        data = b"\x00\x00\x00\x18ftypmp42" + os.urandom(100_000)
+        assert client.get("/api/v1/search/", params={"q": "trailer"}).json()["items"] == []
+        created = client.post("/api/v1/uploads/", json={
+            "project_id": project_id, "title": "Trailer", "content_type": "video/mp4", "size": len(data)
+        })
+        assert created.status_code == 201
+        # Search results cached before the upload do not hide the new item
+        found = client.get("/api/v1/search/", params={"q": "trailer"}).json()["items"]
+        assert [(item["type"], item["title"]) for item in found] == [("content_item", "Trailer")]
+        upload_url = created.headers["location"]
+
+        first = client.patch(upload_url, content=data[:30_000], headers={"Upload-Offset": "0"})
+        assert first.json()["offset"] == 30_000
+        assert client.head(upload_url).headers["upload-offset"] == "30000"
+        conflict = client.patch(upload_url, content=data[10:20], headers={"Upload-Offset": "10"})
+        assert conflict.status_code == 409 and conflict.headers["upload-offset"] == "30000"
+
+        # A restarted worker rebuilds the hash from the partial file
+        store._hashers.clear()
+        done = client.patch(upload_url, content=data[30_000:], headers={"Upload-Offset": "30000"}).json()
+        digest = hashlib.sha256(data).hexdigest()
+        assert done["complete"] and done["sha256"] == digest
+        detail = client.get(f"/api/v1/projects/{project_id}", params={"include": "content_items"}).json()
+        assert detail["content_items"][0]["content_url"] == f"/api/v1/media/{digest}"
+
+        # Identical media is stored once
+        again = client.post("/api/v1/uploads/", json={
+            "content_item_id": done["content_item_id"], "content_type": "video/mp4", "size": len(data)
+        }).headers["location"]
+        assert client.patch(again, content=data, headers={"Upload-Offset": "0"}).json()["sha256"] == digest
+        assert [path.name for path in (tmp_path / "media").rglob("*") if path.is_file()] == [digest]
+        assert not any((tmp_path / "partial").iterdir())
+
+        url = f"/api/v1/media/{digest}"
+        full = client.get(url)
+        assert full.content == data and full.headers["accept-ranges"] == "bytes"
+        part = client.get(url, headers={"Range": "bytes=10-19"})
+        assert part.status_code == 206 and part.content == data[10:20]
+        assert part.headers["content-range"] == f"bytes 10-19/{len(data)}"
+        assert client.get(url, headers={"Range": "bytes=-5"}).content == data[-5:]
+        assert client.get(url, headers={"Range": f"bytes={len(data)}-"}).status_code == 416
+        assert client.get(url, headers={"If-None-Match": f'"{digest}"'}).status_code == 304
+        assert client.get("/api/v1/media/" + "0" * 64).status_code == 404
+
+        # Limits are enforced on the declaration and while streaming
+        png = client.post("/api/v1/uploads/", json={
+            "project_id": project_id, "content_type": "image/png", "size": 100
+        }).headers["location"]
+        assert client.patch(png, content=b"\xff\xd8\xff" + bytes(97), headers={"Upload-Offset": "0"}).status_code == 415
+        assert client.get(png).json()["offset"] == 0
+        assert client.patch(png, content=b"\x89PNG\r\n\x1a\n" + bytes(100), headers={"Upload-Offset": "0"}).status_code == 413
+        assert client.post("/api/v1/uploads/", json={
+            "project_id": project_id, "content_type": "text/html", "size": 10
+        }).status_code == 415
+        assert client.post("/api/v1/uploads/", json={
+            "project_id": project_id, "content_type": "video/mp4", "size": 2 << 20
+        }).status_code == 413
+        assert client.delete(png).status_code == 204
+        assert client.get(png).status_code == 404
+    finally:
+        app.dependency_overrides.pop(media.get_media_store, None)
+
+def test_media_probe_reads_headers(tmp_path):
+    """Test dimension and duration extraction from image and MP4 headers."""
+    import struct
+    import media_probe
+
+    png = tmp_path / "image.png"
+    png.write_bytes(b"\x89PNG\r\n\x1a\n" + struct.pack(">I4sII", 13, b"IHDR", 640, 480) + bytes(20))
+    assert media_probe.image_size(str(png)) == (640, 480)
+
+    def box(box_type, payload):
+        return struct.pack(">I4s", len(payload) + 8, box_type) + payload
+
+    # Version 0 mvhd: timescale 1000, duration 12.5s; tkhd: 1280x720 in 16.16 fixed point
+    mvhd = box(b"mvhd", bytes(12) + struct.pack(">II", 1000, 12_500) + bytes(80))
+    tkhd = box(b"tkhd", bytes(76) + struct.pack(">II", 1280 << 16, 720 << 16))
+    video = tmp_path / "video.mp4"
+    video.write_bytes(box(b"ftyp", b"isom" + bytes(4)) + box(b"moov", mvhd + box(b"trak", tkhd)) + box(b"mdat", bytes(64)))
+    assert media_probe.video_info(str(video)) == {"duration_seconds": 12.5, "width": 1280, "height": 720}
+
+    result = media_probe.process_media(str(video), "video/mp4", {})
+    assert result["size"] == video.stat().st_size and result["thumbnails"] == []
+
+def test_media_processing_jobs(tmp_path):
+    """Test that uploads queue a job that a worker runs, retries and records."""
+    import asyncio
+    import struct
+    import media
+    import media_jobs
+    from models import ContentItem, JobStatus, MediaJob
+
+    store = media.MediaStore(tmp_path, max_size=1 << 20, allowed_types=["image/png"])
+    app.dependency_overrides[media.get_media_store] = lambda: store
+    try:
+        project_id = client.post("/api/v1/projects/", json={"title": "Test Project"}).json()["id"]
+        data = b"\x89PNG\r\n\x1a\n" + struct.pack(">I4sII", 13, b"IHDR", 800, 600) + bytes(100)
+        upload = client.post("/api/v1/uploads/", json={
+            "project_id": project_id, "title": "Still", "content_type": "image/png", "size": len(data)
+        }).headers["location"]
+        item_id = client.patch(upload, content=data, headers={"Upload-Offset": "0"}).json()["content_item_id"]
+
+        jobs = client.get("/api/v1/media-jobs/", params={"content_item_id": item_id}).json()["items"]
+        assert len(jobs) == 1 and jobs[0]["status"] == "queued"
+        job_id = jobs[0]["id"]
+        stats = client.get("/api/v1/media-jobs/stats").json()
+        assert stats["queue_depth"] == 1 and stats["worker"]["running"] is False
+
+        async def run_until(predicate, **options):
+            worker = media_jobs.MediaWorker(TestingAsyncSessionLocal, store, processes=1, poll_seconds=0.05, **options)
+            worker.start()
+            try:
+                for _ in range(400):
+                    async with TestingAsyncSessionLocal() as db:
+                        job = await db.get(MediaJob, job_id)
+                        if predicate(job):
+                            return job
+                    await asyncio.sleep(0.05)
+                raise AssertionError("Media job did not finish")
+            finally:
+                await worker.stop()
+
+        job = asyncio.run(run_until(lambda job: job.status == JobStatus.SUCCEEDED))
+        assert job.attempts == 1 and job.locked_by is None
+
+        async def media_data():
+            async with TestingAsyncSessionLocal() as db:
+                return (await db.get(ContentItem, item_id)).content_data["media"]
+
+        processed = asyncio.run(media_data())
+        assert (processed["width"], processed["height"], processed["size"]) == (800, 600, len(data))
+
+        # Unchanged media is not requeued unless forced
+        assert client.post("/api/v1/media-jobs/", json={"content_item_id": item_id}).json()["status"] == "succeeded"
+        forced = client.post("/api/v1/media-jobs/", json={"content_item_id": item_id, "force": True})
+        assert forced.status_code == 202 and forced.json()["status"] == "queued"
+
+        # A missing input fails each attempt and then stays failed
+        digest = client.get(upload).json()["sha256"]
+        store.blob_path(digest).unlink()
+        job = asyncio.run(run_until(
+            lambda job: job.status == JobStatus.FAILED, max_attempts=2, retry_seconds=0
+        ))
+        assert job.attempts == 2 and "FileNotFoundError" in job.last_error
+        assert client.get(f"/api/v1/media-jobs/{job_id}").json()["status"] == "failed"
+        assert client.get("/api/v1/media-jobs/", params={"status": "failed"}).json()["items"][0]["id"] == job_id
+        assert client.get("/api/v1/media-jobs/", params={"status": "bogus"}).status_code == 400
+        assert client.get(f"{media.media_url(digest)}/thumbnails/320").status_code == 404
+        assert client.post("/api/v1/media-jobs/", json={"content_item_id": 9999}).status_code == 404
+    finally:
+        app.dependency_overrides.pop(media.get_media_store, None)
+
+def test_register_login_and_authenticated_ratings():
+    """Test the auth flow, rater attribution and the cached principal lookup."""
+    from sqlalchemy import event
+
+    user = {"username": "rasika", "email": "rasika@example.com", "password": "correct horse"}
+    created = client.post("/api/v1/users/register", json=user)
+    assert created.status_code == 201
+    assert created.json()["username"] == "rasika" and "hashed_password" not in created.json()
+    assert client.post("/api/v1/users/register", json=user).status_code == 409
+    assert client.post("/api/v1/users/register", json={**user, "username": "x"}).status_code == 422
+
+    assert client.post("/api/v1/users/login", data={"username": "rasika", "password": "wrong"}).status_code == 401
+    assert client.post("/api/v1/users/login", data={"username": "nobody", "password": "wrong"}).status_code == 401
+    login = client.post("/api/v1/users/login", data={"username": "rasika", "password": "correct horse"}).json()
+    assert login["token_type"] == "bearer" and login["expires_in"] > 0
+    headers = {"Authorization": f"Bearer {login['access_token']}"}
+    assert client.get("/api/v1/users/me", headers=headers).json()["email"] == "rasika@example.com"
+    assert client.get("/api/v1/users/me").status_code == 401
+    assert client.get("/api/v1/users/me", headers={"Authorization": "Bearer not-a-token"}).status_code == 401
+
+    project_id = client.post("/api/v1/projects/", json={"title": "Test Project"}).json()["id"]
+    rating = {"project_id": project_id, "rasa": "HASYA", "rating_value": 7}
+    assert client.post("/api/v1/ratings/", json=rating).json()["user_id"] is None
+
+    # The principal is cached, so attributed ratings do not query users
+    statements = []
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count)
+    try:
+        assert client.post("/api/v1/ratings/", json=rating, headers=headers).json()["user_id"] == created.json()["id"]
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", count)
+    assert not any("FROM users" in statement for statement in statements)
+    batch = client.post("/api/v1/ratings/batch", json=[rating], headers=headers).json()
+    assert batch["inserted"] == 1
+    stats = client.get(f"/api/v1/projects/{project_id}/rater-stats").json()
+    assert stats["unique_raters"] == 1
+
+    # Deactivation revokes outstanding tokens
+    other = client.post("/api/v1/users/register", json={**user, "username": "other", "email": "o@example.com"})
+    assert client.post(f"/api/v1/users/{other.json()['id']}/deactivate", headers=headers).status_code == 403
+    assert client.post(f"/api/v1/users/{created.json()['id']}/deactivate", headers=headers).status_code == 204
+    assert client.post("/api/v1/ratings/", json=rating, headers=headers).status_code == 401
+    assert client.post("/api/v1/users/login", data={"username": "rasika", "password": "correct horse"}).status_code == 401
+
+    # A user deleted while its principal is cached gets a 401, not a 500
+    from sqlalchemy.orm import Session
+    other_login = client.post("/api/v1/users/login", data={"username": "other", "password": "correct horse"}).json()
+    other_headers = {"Authorization": f"Bearer {other_login['access_token']}"}
+    assert client.get("/api/v1/users/me", headers=other_headers).json()["username"] == "other"
+    with Session(engine) as db:
+        db.delete(db.get(User, other.json()["id"]))
+        db.commit()
+    assert client.get("/api/v1/users/me", headers=other_headers).status_code == 401
+
+def test_rate_limits_and_load_shedding(tmp_path):
+    """Test per-client and per-project buckets, the in-flight cap and queue shedding."""
+    import asyncio
+
+    default = admission.admission_controller
+    admission.admission_controller = admission.AdmissionController(
+        admission.MemoryBucketStore(), max_in_flight=10, client_rate=0.5, client_burst=4,
+        project_rate=0.5, project_burst=1
+    )
+    try:
+        project_id = client.post("/api/v1/projects/", json={"title": "Test Project"}).json()["id"]
+        rating = {"project_id": project_id, "rasa": "HASYA", "rating_value": 7}
+        assert client.post("/api/v1/ratings/", json=rating).status_code == 201
+        before = metrics.RATE_LIMITED_PROJECT.value()
+        limited = client.post("/api/v1/ratings/", json=rating)
+        assert limited.status_code == 429 and int(limited.headers["retry-after"]) >= 1
+        assert metrics.RATE_LIMITED_PROJECT.value() == before + 1
+
+        assert client.get("/api/v1/projects/").status_code == 200
+        before = metrics.RATE_LIMITED_CLIENT.value()
+        limited = client.get("/api/v1/projects/")
+        assert limited.status_code == 429 and int(limited.headers["retry-after"]) >= 1
+        assert metrics.RATE_LIMITED_CLIENT.value() == before + 1
+        assert client.get("/health").status_code == 200
+    finally:
+        admission.admission_controller = default
+
+    async def shed():
+        controller = admission.AdmissionController(
+            admission.MemoryBucketStore(), max_in_flight=1, max_queue=1, queue_timeout_seconds=0.05
+        )
+        await controller.acquire()
+        waiter = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(admission.AdmissionRejected) as full:
+            await controller.acquire()
+        assert full.value.status_code == 503
+        # A released slot goes straight to the oldest waiter
+        controller.release()
+        await waiter
+        assert controller.in_flight == 1 and controller.queued == 0
+        timeouts = metrics.ADMISSION_QUEUE_TIMEOUT.value()
+        with pytest.raises(admission.AdmissionRejected):
+            await controller.acquire()
+        assert metrics.ADMISSION_QUEUE_TIMEOUT.value() == timeouts + 1
+        controller.release()
+        assert controller.in_flight == 0
+
+    asyncio.run(shed())
+
+    # Workers sharing a SQLite store draw from the same bucket
+    path = str(tmp_path / "buckets.db")
+    first, second = admission.SQLiteBucketStore(path), admission.SQLiteBucketStore(path)
+    assert first.take("client:a", rate=1.0, burst=2) == 0
+    assert second.take("client:a", rate=1.0, burst=2) == 0
+    assert 0 < first.take("client:a", rate=1.0, burst=2) <= 1
+    assert second.take("client:b", rate=1.0, burst=2) == 0
+
+def test_media_transfers_do_not_hold_admission_slots():
+    """Test a slow media download leaves the in-flight slot free for other requests."""
+    import asyncio
+
+    async def scenario():
+        download_started, finish_download = asyncio.Event(), asyncio.Event()
+
+        async def app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            if scope["path"].startswith("/api/v1/media/"):
+                download_started.set()
+                await finish_download.wait()
+            await send({"type": "http.response.body", "body": b"ok"})
+
+        async def request(method, path):
+            sent = []
+
+            async def send(message):
+                sent.append(message)
+
+            scope = {"type": "http", "method": method, "path": path, "headers": [], "client": ("10.0.0.1", 1)}
+            await middleware(scope, None, send)
+            return sent[0]["status"]
+
+        middleware = admission.AdmissionMiddleware(app)
+        controller = admission.AdmissionController(
+            admission.MemoryBucketStore(), max_in_flight=1, max_queue=0, queue_timeout_seconds=0.05
+        )
+        default, admission.admission_controller = admission.admission_controller, controller
+        try:
+            download = asyncio.ensure_future(request("GET", "/api/v1/media/" + "a" * 64))
+            await download_started.wait()
+            assert controller.in_flight == 0
+            assert await request("GET", "/api/v1/projects/") == 200
+            # Ordinary requests still take the slot
+            await controller.acquire()
+            assert await request("GET", "/api/v1/projects/") == 503
+            controller.release()
+            finish_download.set()
+            assert await download == 200
+        finally:
+            admission.admission_controller = default
+        assert admission.is_transfer("PATCH", "/api/v1/uploads/abc", "/api/v1")
+        assert not admission.is_transfer("POST", "/api/v1/uploads/", "/api/v1")
+
+    asyncio.run(scenario())
+
+def test_structured_logging_pipeline():
+    """Test request ids, JSON records, sampling, slow-query logging and queue overflow."""
+    import json
+    import logging
+    import queue
+    import log_pipeline
+
+    records = []
+    class Capture(logging.Handler):
+        def emit(self, record):
+            records.append(record)
+
+    capture = Capture()
+    log_pipeline.access_logger.addHandler(capture)
+    try:
+        response = client.get("/", headers={"X-Request-ID": "req-123"})
+        assert response.headers["x-request-id"] == "req-123"
+        generated = client.get("/", headers={"X-Request-ID": "bad id!"}).headers["x-request-id"]
+        assert len(generated) == 32
+    finally:
+        log_pipeline.access_logger.removeHandler(capture)
+    assert records[0].request_id == "req-123" and records[0].status == 200
+
+    line = json.loads(log_pipeline.JsonFormatter().format(records[0]))
+    assert line["request_id"] == "req-123" and line["logger"] == "rms.access"
+    assert line["method"] == "GET" and line["path"] == "/" and "duration_ms" in line
+    assert not log_pipeline.sampled(0.0) and log_pipeline.sampled(1.0)
+
+    # Statements over the threshold are logged; the rest only when sampled
+    sql_engine = create_engine("sqlite://")
+    log_pipeline.instrument_sql(sql_engine, "test", slow_query_ms=1e-6, sample_rate=0.0)
+    log_pipeline.sql_logger.addHandler(capture)
+    try:
+        with sql_engine.connect() as conn:
+            conn.exec_driver_sql("SELECT 1")
+    finally:
+        log_pipeline.sql_logger.removeHandler(capture)
+    slow = records[-1]
+    assert slow.levelno == logging.WARNING and slow.statement == "SELECT 1" and slow.engine == "test"
+
+    # A full queue drops records instead of blocking
+    handler = log_pipeline.DroppingQueueHandler(queue.Queue(maxsize=1))
+    dropped = metrics.LOG_RECORDS_DROPPED.value()
+    for _ in range(2):
+        handler.handle(logging.makeLogRecord({"msg": "x %s", "args": (1,)}))
+    assert metrics.LOG_RECORDS_DROPPED.value() == dropped + 1
+    assert handler.queue.get_nowait().msg == "x 1"
+
+def test_multi_worker_pools_and_fork_safety(tmp_path, monkeypatch):
+    """Test pool budgets per worker, engine disposal after fork and the schema lock."""
+    import database
+    from config import get_settings
+
+    settings = get_settings()
+    monkeypatch.setattr(settings, "db_max_connections", 100)
+    monkeypatch.setattr(settings, "workers", 4)
+    assert database.pool_limits(5, shares=2) == (5, 7)
+    assert database.pool_limits(20, shares=1) == (20, 5)
+    monkeypatch.setattr(settings, "workers", 64)
+    assert database.pool_limits(5, shares=2) == (1, 0)
+    monkeypatch.setattr(settings, "db_max_connections", 0)
+    assert database.pool_limits(5) == (5, settings.db_max_overflow)
+
+    # A forked child rebuilds engines instead of reusing the parent's pools
+    parent = database.get_engines()
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0 if database._engines is None and database.get_engines() is not parent else 1)
+    assert os.waitpid(pid, 0)[1] == 0
+    assert database.get_engines() is parent
+
+    file_engine = create_engine(f"sqlite:///{tmp_path / 'schema.db'}")
+    with file_engine.connect() as connection:
+        with database.schema_lock(connection):
+            Base.metadata.create_all(bind=connection)
+    assert (tmp_path / "schema.db.schema-lock").exists()
+
+    # Features with per-process state are turned off for several workers
+    import serve
+    for name in serve.PER_PROCESS_FEATURES:
+        monkeypatch.setenv(name, "true")
+    get_settings.cache_clear()
+    assert serve.disable_per_process_features(1) == []
+    assert serve.disable_per_process_features(4) == list(serve.PER_PROCESS_FEATURES)
+    assert not any(getattr(get_settings(), name) for name in serve.PER_PROCESS_FEATURES)
+    monkeypatch.undo()
+    get_settings.cache_clear()
+
+def test_rasa_similarity_index():
+    """Test similar content items, project divergence and incremental index refreshes."""
+    import numpy as np
+    from sqlalchemy.orm import Session
+    from models import ContentItem
+
+    sad_id = client.post("/api/v1/projects/", json={"title": "Elegy", "expected_rasa": "KARUNA"}).json()["id"]
+    odd_id = client.post("/api/v1/projects/", json={"title": "Farce", "expected_rasa": "KARUNA"}).json()["id"]
+    with Session(engine) as db:
+        items = [ContentItem(project_id=sad_id, title=f"Item {i}") for i in range(3)]
+        items.append(ContentItem(project_id=odd_id, title="Item 3"))
+        db.add_all(items)
+        db.commit()
+        item_ids = [item.id for item in items]
+    mixes = [
+        [("KARUNA", 9), ("SHANTA", 3)],
+        [("KARUNA", 8), ("SHANTA", 3)],
+        [("HASYA", 9)],
+        [("HASYA", 7), ("KARUNA", 1)],
+    ]
+    client.post("/api/v1/ratings/batch", json=[
+        {"project_id": sad_id if i < 3 else odd_id, "content_item_id": item_id, "rasa": rasa, "rating_value": value}
+        for i, (item_id, mix) in enumerate(zip(item_ids, mixes)) for rasa, value in mix
+    ])
+
+    response = client.get(f"/api/v1/content-items/{item_ids[0]}/similar")
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["content_item_id"] for result in results] == [item_ids[1], item_ids[3], item_ids[2]]
+    assert results[0]["similarity"] > 0.99 and results[0]["title"] == "Item 1"
+    assert results[2]["similarity"] == 0.0
+    assert 'rms_similarity_refresh_seconds_count{kind="full"}' in client.get("/metrics").text
+    scoped = client.get(f"/api/v1/content-items/{item_ids[0]}/similar", params={"project_id": odd_id, "limit": 1})
+    assert [result["content_item_id"] for result in scoped.json()["results"]] == [item_ids[3]]
+
+    divergence = client.get("/api/v1/projects/divergence").json()["results"]
+    assert [result["project_id"] for result in divergence] == [odd_id, sad_id]
+    assert divergence[0]["dominant_rasa"] == "hasya" and divergence[0]["title"] == "Farce"
+    assert divergence[0]["divergence"] > divergence[1]["divergence"] > 0
+
+    # New ratings are folded in on the next query, re-reading only what changed
+    client.post("/api/v1/ratings/batch", json=[
+        {"project_id": sad_id, "content_item_id": item_ids[2], "rasa": "KARUNA", "rating_value": 10}
+        for _ in range(20)
+    ])
+    index = similarity.similarity_index
+    matrix = index.content_items
+    assert client.get(f"/api/v1/content-items/{item_ids[0]}/similar").json()["results"][1]["content_item_id"] == item_ids[2]
+    assert index.content_items is matrix and matrix.totals[matrix.rows[item_ids[2]]] == 21
+    assert client.get("/api/v1/projects/divergence", params={"min_ratings": 10}).json()["results"][0]["project_id"] == sad_id
+
+    # An unrated item has no neighbours yet; an unknown one is a 404
+    with Session(engine) as db:
+        db.add(ContentItem(project_id=sad_id, title="Unrated"))
+        db.commit()
+    assert client.get(f"/api/v1/content-items/{item_ids[3] + 1}/similar").json()["results"] == []
+    assert client.get("/api/v1/content-items/9999/similar").status_code == 404
+
+    # Ratings committed out of id order, as with PostgreSQL sequences
+    import asyncio
+    from datetime import datetime
+    from sqlalchemy import func, select
+    import ingest
+    import rollups
+
+    class SequenceHorizon(rollups.RatingIdHorizon):
+        """Horizon without the SQLite shortcut."""
+
+        async def settle(self, db):
+            latest = await db.scalar(select(func.max(Rating.id))) or 0
+            return latest, self.observe(latest)
+
+    async def insert_rating(rating_id, item_id):
+        async with TestingAsyncSessionLocal() as db:
+            await ingest.insert_ratings(db, [{
+                "id": rating_id, "project_id": odd_id, "content_item_id": item_id, "rasa": Rasa.HASYA,
+                "rating_value": 5, "feedback": None, "user_id": None, "created_at": datetime.utcnow(),
+            }])
+            await db.commit()
+
+    def total(item_id):
+        client.get(f"/api/v1/content-items/{item_ids[0]}/similar")
+        matrix = similarity.similarity_index.content_items
+        return int(matrix.totals[matrix.rows[item_id]])
+
+    index = similarity.similarity_index = similarity.SimilarityIndex(refresh_seconds=0)
+    index.horizon = SequenceHorizon(settle_seconds=3600)
+    base = client.get("/api/v1/ratings/", params={"cursor": "", "limit": 100}).json()["items"][-1]["id"]
+    assert total(item_ids[3]) == 2 and index.settled_id is None
+    asyncio.run(insert_rating(base + 2, item_ids[3]))
+    assert total(item_ids[3]) == 3
+    # Nothing has settled since the first load, so the late id waits for a second full load
+    asyncio.run(insert_rating(base + 1, item_ids[3]))
+    assert total(item_ids[3]) == 3
+    index.horizon.settle_seconds = 0
+    assert total(item_ids[3]) == 4 and index.settled_id == base + 2
+    # Once settled, ids above the horizon are re-read until they settle too
+    index.horizon.settle_seconds = 3600
+    asyncio.run(insert_rating(base + 4, item_ids[3]))
+    assert total(item_ids[3]) == 5
+    asyncio.run(insert_rating(base + 3, item_ids[3]))
+    assert total(item_ids[3]) == 6
+
+    # Top-k over a large matrix agrees with a full sort
+    scores = np.random.default_rng(7).random(100_000)
+    assert list(similarity.top_k(scores, 5)) == list(np.argsort(-scores)[:5])
@@ -0,0 +1,144 @@
+"""
+Query plan regression suite for the RMS schema.
+
+Every SELECT issued by the API routes is captured while the routes are
+exercised, then explained on the same backend. Filtered queries must be
+answered from an index; a sequential scan fails the test.
+
+SQLite always runs. Set RMS_TEST_POSTGRES_URL to a scratch PostgreSQL
+database to check the same queries there.
+"""
+import asyncio
+import os
+import re
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+# Add parent directory to path to import from parent
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import app
+from database import Base, get_async_database_url, get_read_session, get_write_session
+from cache import response_cache
+
+BACKENDS = {"sqlite": "sqlite:///./test_plans.db"}
+if os.environ.get("RMS_TEST_POSTGRES_URL"):
+    BACKENDS["postgresql"] = os.environ["RMS_TEST_POSTGRES_URL"]
+
+# Plan lines that indicate a full table scan
+SEQUENTIAL_SCANS = {
+    "sqlite": re.compile(r"^SCAN (\w+)$"),
+    "postgresql": re.compile(r"Seq Scan on (\w+)"),
+}
+
+# Only filtered statements are checked; bare listings scan by design
+FILTERED = re.compile(r"\bWHERE\b", re.IGNORECASE)
+
+# Statements issued to make the planner prefer indexes wherever one applies
+PLANNER_SETUP = {
+    "sqlite": [],
+    "postgresql": ["SET enable_seqscan = off"],
+}
+
+EXPLAIN_PREFIX = {
+    "sqlite": "EXPLAIN QUERY PLAN ",
+    "postgresql": "EXPLAIN ",
+}
+
+client = TestClient(app)
+
+def exercise_routes() -> None:
+    """Call every database-backed route at least once."""
+    project_id = client.post("/api/v1/projects/", json={"title": "Plan Project"}).json()["id"]
+    client.post("/api/v1/ratings/", json={"project_id": project_id, "rasa": "HASYA", "rating_value": 7})
+    client.post("/api/v1/ratings/", json={
+        "project_id": project_id, "content_item_id": 1, "rasa": "HASYA", "rating_value": 7
+    })
+    client.post("/api/v1/ratings/batch", json=[
+        {"project_id": project_id, "content_item_id": 1, "rasa": "VEERA", "rating_value": 5},
+        {"project_id": project_id, "rasa": "KARUNA", "rating_value": 3}
+    ])
+    client.get("/api/v1/projects/")
+    client.get("/api/v1/projects/", params={"cursor": "", "limit": 1})
+    client.get("/api/v1/ratings/")
+    client.get("/api/v1/ratings/", params={"project_id": project_id})
+    page = client.get("/api/v1/ratings/", params={"project_id": project_id, "cursor": "", "limit": 1}).json()
+    client.get("/api/v1/ratings/", params={"project_id": project_id, "cursor": page["next_cursor"]})
+    client.get(f"/api/v1/projects/{project_id}/rasa-summary")
+    client.get(f"/api/v1/projects/{project_id}", params={
+        "include": "creator,content_items.philosophical_analysis,rating_summary"
+    })
+    client.get(f"/api/v1/projects/{project_id}/trend", params={"bucket": "day"})
+    client.get(f"/api/v1/projects/{project_id}/trend", params={"bucket": "6h"})
+    client.get("/api/v1/ratings/export", params={"project_id": project_id, "after_id": 1})
+    client.get(f"/api/v1/projects/{project_id}/rater-stats")
+    client.get("/api/v1/ratings/rater-stats", params={"content_item_id": 1})
+    page = client.get("/api/v1/search/", params={"q": "plan*", "type": "project", "limit": 1}).json()
+    client.get("/api/v1/search/", params={"q": "plan*", "cursor": page["next_cursor"] or ""})
+    client.get("/api/v1/media-jobs/", params={"status": "queued"})
+    client.get("/api/v1/media-jobs/stats")
+
+@pytest.fixture(params=list(BACKENDS))
+def captured_queries(request):
+    """Exercise the routes against one backend and collect their SELECTs."""
+    url = BACKENDS[request.param]
+    sync_engine = create_engine(url)
+    async_engine = create_async_engine(get_async_database_url(url), poolclass=NullPool)
+    Base.metadata.create_all(bind=sync_engine)
+    response_cache.clear()
+
+    statements = {}
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith("SELECT"):
+            statements.setdefault(statement, parameters)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", capture)
+    session_factory = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+    async def override_get_db():
+        async with session_factory() as db:
+            yield db
+
+    dependencies = (get_write_session, get_read_session)
+    previous = {dependency: app.dependency_overrides.get(dependency) for dependency in dependencies}
+    for dependency in dependencies:
+        app.dependency_overrides[dependency] = override_get_db
+    try:
+        exercise_routes()
+        yield request.param, async_engine, statements
+    finally:
+        for dependency, override in previous.items():
+            if override is None:
+                app.dependency_overrides.pop(dependency, None)
+            else:
+                app.dependency_overrides[dependency] = override
+        Base.metadata.drop_all(bind=sync_engine)
+        sync_engine.dispose()
+
+async def explain(async_engine, dialect: str, statement: str, parameters) -> list:
+    """Return the plan lines for one captured statement."""
+    async with async_engine.connect() as conn:
+        for setup in PLANNER_SETUP[dialect]:
+            await conn.exec_driver_sql(setup)
+        result = await conn.exec_driver_sql(EXPLAIN_PREFIX[dialect] + statement, parameters)
+        return [str(row[-1]) for row in result]
+
+def test_filtered_queries_use_indexes(captured_queries):
+    """Fail when a filtered route query is planned as a sequential scan."""
+    dialect, async_engine, statements = captured_queries
+    assert statements, "No queries were captured"
+
+    regressions = []
+    for statement, parameters in statements.items():
+        if not FILTERED.search(statement):
+            continue
+        plan = asyncio.run(explain(async_engine, dialect, statement, parameters))
+        if any(SEQUENTIAL_SCANS[dialect].search(line.strip()) for line in plan):
+            regressions.append(f"{statement}\n  " + "\n  ".join(plan))
+    assert not regressions, "Sequential scans found:\n" + "\n".join(regressions)
@@ -0,0 +1,214 @@
+"""
+Write-behind rating buffer for RMS.
+
+When enabled, create_rating validates a rating and places it on a bounded
+in-memory queue instead of committing it. A background task drains the
+queue and writes ratings in group commits, every ``flush_interval_ms`` or
+``flush_max_rows`` rows, whichever comes first. Clients receive an
+acknowledgement id whose status can be polled.
+
+A full queue pushes back on clients after a short wait. On shutdown the
+queue is drained before the process exits. Queued ratings are held in
+memory only, so a crash loses at most the unflushed tail.
+"""
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict
+from contextlib import suppress
+from typing import Any, AsyncContextManager, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import ingest
+import live
+from cache import RATINGS_SCOPE, project_scope, response_cache
+from config import get_settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Acknowledgement states
+QUEUED = "queued"
+COMMITTED = "committed"
+FAILED = "failed"
+
+class BufferFullError(Exception):
+    """Raised when a rating cannot be queued before the enqueue timeout."""
+
+class RatingWriteBuffer:
+    """
+    Bounded queue of validated ratings flushed in group commits.
+
+    Args:
+        session_factory: Callable returning an async session context manager
+        max_queue: Maximum number of queued ratings
+        flush_interval_ms: Longest time a rating waits before a flush starts
+        flush_max_rows: Maximum ratings per group commit
+        enqueue_timeout_ms: How long submit waits for space in a full queue
+        ack_history: Number of acknowledgement statuses kept for polling
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncContextManager[AsyncSession]],
+        max_queue: int = 10000,
+        flush_interval_ms: int = 50,
+        flush_max_rows: int = 1000,
+        enqueue_timeout_ms: int = 100,
+        ack_history: int = 100000
+    ):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_max_rows = flush_max_rows
+        self.enqueue_timeout = enqueue_timeout_ms / 1000
+        self.ack_history = ack_history
+        self._queue: "asyncio.Queue[Tuple[str, Any]]" = asyncio.Queue(maxsize=max_queue)
+        self._acks: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+        self._pending: List[Tuple[str, Any]] = []
+        self._flushing: Optional[asyncio.Task] = None
+        self._closed = False
+
+    @property
+    def depth(self) -> int:
+        """Number of ratings waiting to be flushed."""
+        return self._queue.qsize()
+
+    async def submit(self, rating: Any) -> str:
+        """
+        Queue a validated rating.
+
+        Args:
+            rating: RatingCreate with a known rasa
+
+        Returns:
+            str: Acknowledgement id
+
+        Raises:
+            BufferFullError: If the queue stays full past the enqueue timeout
+                or the buffer is shutting down
+        """
+        if self._closed:
+            raise BufferFullError("Rating buffer is shutting down")
+        ack_id = uuid.uuid4().hex
+        # Recorded first: a flush may complete before put() returns control
+        self._record(ack_id, {"status": QUEUED})
+        try:
+            await asyncio.wait_for(self._queue.put((ack_id, rating)), self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            del self._acks[ack_id]
+            raise BufferFullError("Rating buffer is full")
+        return ack_id
+
+    def status(self, ack_id: str) -> Optional[Dict[str, Any]]:
+        """Return the status of an acknowledgement, or None if unknown."""
+        return self._acks.get(ack_id)
+
+    def start(self) -> None:
+        """Start the background flush task on the running loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info("Rating write buffer started")
+
+    async def stop(self) -> None:
+        """Stop accepting ratings and flush everything still queued."""
+        self._closed = True
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        if self._flushing is not None:
+            await self._flushing
+        if self._pending:
+            batch, self._pending = self._pending, []
+            await self._flush(batch)
+        while not self._queue.empty():
+            batch = [self._queue.get_nowait() for _ in range(min(self.flush_max_rows, self._queue.qsize()))]
+            await self._flush(batch)
+        logger.info("Rating write buffer drained")
+
+    async def _run(self) -> None:
+        """Collect ratings into batches and flush them until cancelled."""
+        loop = asyncio.get_running_loop()
+        while True:
+            # Collected ratings live on the instance so stop() can flush them
+            self._pending = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(self._pending) < self.flush_max_rows:
+                try:
+                    self._pending.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    self._pending.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            batch, self._pending = self._pending, []
+            # Shielded so that stop() never abandons a half-written batch
+            self._flushing = asyncio.ensure_future(self._flush(batch))
+            await asyncio.shield(self._flushing)
+            self._flushing = None
+
+    async def _flush(self, batch: List[Tuple[str, Any]]) -> None:
+        """Write one batch in a single transaction and record the outcomes."""
+        ack_ids = [ack_id for ack_id, _ in batch]
+        try:
+            async with self.session_factory() as db:
+                rows, errors = await ingest.build_rating_rows(db, list(enumerate(r for _, r in batch)))
+                await ingest.insert_ratings(db, rows)
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Rating buffer flush of {len(batch)} rows failed: {e}", exc_info=True)
+            for ack_id in ack_ids:
+                self._record(ack_id, {"status": FAILED, "detail": "Database write failed"})
+            return
+
+        if rows:
+            project_ids = {row["project_id"] for row in rows}
+            response_cache.invalidate(RATINGS_SCOPE, *(project_scope(project_id) for project_id in project_ids))
+            live.notify_ratings(*project_ids)
+        failed = {error["index"]: error["detail"] for error in errors}
+        for index, ack_id in enumerate(ack_ids):
+            if index in failed:
+                self._record(ack_id, {"status": FAILED, "detail": failed[index]})
+            else:
+                self._record(ack_id, {"status": COMMITTED})
+        logger.debug(f"Rating buffer flushed {len(rows)} rows, {len(errors)} rejected")
+
+    def _record(self, ack_id: str, status: Dict[str, Any]) -> None:
+        """Store an acknowledgement status, evicting the oldest beyond the history size."""
+        self._acks[ack_id] = status
+        self._acks.move_to_end(ack_id)
+        while len(self._acks) > self.ack_history:
+            self._acks.popitem(last=False)
+
+# Process-wide buffer, created on startup when write-behind is enabled
+rating_buffer: Optional[RatingWriteBuffer] = None
+
+def start_rating_buffer() -> None:
+    """Create and start the process-wide buffer if enabled in settings."""
+    global rating_buffer
+    settings = get_settings()
+    if not settings.write_behind_enabled:
+        return
+    from database import get_async_db
+
+    rating_buffer = RatingWriteBuffer(
+        get_async_db,
+        max_queue=settings.write_behind_max_queue,
+        flush_interval_ms=settings.write_behind_flush_interval_ms,
+        flush_max_rows=settings.write_behind_flush_max_rows,
+        enqueue_timeout_ms=settings.write_behind_enqueue_timeout_ms,
+    )
+    rating_buffer.start()
+
+async def stop_rating_buffer() -> None:
+    """Drain and stop the process-wide buffer if it is running."""
+    if rating_buffer is not None:
+        await rating_buffer.stop()